@@ -16,6 +16,7 @@ class ApiStatus:
     STATUS_PATIENT_NOT_FOUND = 12
     STATUS_ANALYSIS_IN_PROGRESS = 13
     STATUS_WRONG_SNS_CODE = 14
+    STATUS_TOO_MANY_BUCKETS = 15
 
     _msg = {STATUS_OK: 'OK',
             STATUS_USER_NOT_FOUND: 'User Not Found',
@@ -32,6 +33,7 @@ class ApiStatus:
             STATUS_PATIENT_NOT_FOUND: 'Patient not found',
             STATUS_ANALYSIS_IN_PROGRESS: 'Analysis in progress',
             STATUS_WRONG_SNS_CODE: 'Wrong SNS code',
+            STATUS_TOO_MANY_BUCKETS: 'Too many buckets',
             }
 
     @classmethod
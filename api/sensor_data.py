@@ -4,14 +4,21 @@ from flask_restful import Resource, reqparse, abort
 from api.auth import check_auth
 from api.error_codes import ApiStatus
 from components import ext_cache
+from flaskapp import app
+from math.aggregate import AGGREGATES, bucket_count
 from math.algorithm.algorithms import Algorithms
+from math.pyramid import pick_level
 from models.structure.patient import PatientProfile
 from models.structure.measurement import AlgProfile
 from query.deriveddata.derived_data_query import generate_derived_data, fetch_derived_data_bins, \
     fetch_cached_derived_data_hour, DataNotReady
+from query.sensordata.aggregate_query import fetch_sensor_aggregate
 from query.sensordata.sensor_query import fetch_sensor, fetch_sensor_from_id, extend_sensors_remote_details
+from query.sensordata.pyramid_query import fetch_sensor_pyramid
 from query.sensordata.sensordata_query import fetch_sensor_data_bundle_for_sensor
 from query.structure.projects_query import fetch_org_and_project
+from types.sensor_data import sample_scale
+from utils import unixts
 from .helpers import api_resource, build_response, str_array_argument, datetime_argument, id_argument, id_out
 from itsdangerous import (TimedJSONWebSignatureSerializer as Serializer, BadSignature, SignatureExpired)
 import numpy
@@ -38,7 +45,8 @@ def format_samples(data_bundle, average, var_names):
     max_all = None
 
     for i, sensor_data in enumerate(data_bundle):
-        data = sensor_data.samples()
+        # float64 so the values are json serializable
+        data = sensor_data.samples(numpy.float64)
         ts = sensor_data.ts
         sample_count = len(ts)
 
@@ -124,6 +132,33 @@ def format_samples(data_bundle, average, var_names):
     return v
 
 
+def format_pyramid(parts, stream_type, var_names):
+    """
+    Same output as format_samples(average=True), from pyramid levels (see
+    fetch_sensor_pyramid()) instead of raw samples
+    """
+    scale = sample_scale(stream_type)
+    v = {'ts': []}
+    for l in var_names:
+        v[l] = []
+        v[l + '_diff'] = []
+
+    for i, buckets in enumerate(parts):
+        # Insert None in time holes, to show a hole in the plot
+        if i != 0:
+            v['ts'] += [int(buckets['ts'][0]-1)]
+            for l in var_names:
+                v[l] += [None]
+                v[l+'_diff'] += [(None, None)]
+
+        v['ts'] += buckets['ts'].tolist()
+        for j, l in enumerate(var_names):
+            v[l] += (buckets['median'][:, j] * scale).tolist()
+            v[l+'_diff'] += list(zip((buckets['min'][:, j] * scale).tolist(), (buckets['max'][:, j] * scale).tolist()))
+
+    return v
+
+
 @api_resource('/api/1.0/sensor/data/raw', endpoint='/api/1.0/sensor/data/raw')
 class ApiGetSensorData2(Resource):
 
@@ -230,12 +265,15 @@ class ApiGetSensorData2(Resource):
             abort(500)
 
         extend_sensors_remote_details([sensor])
-        data_bundle = fetch_sensor_data_bundle_for_sensor(sensor.remote_details, start_time, end_time, stream_name)
 
-        if args['window_type'] == 'hour':
-            values = format_samples(data_bundle, False, var_names)
+        # Day charts show about 2 minute chunks, served from the pyramid without decoding records
+        level_ms = pick_level(2*60000) if args['window_type'] == 'day' else None
+        if level_ms is not None:
+            parts = fetch_sensor_pyramid(sensor.remote_details, start_time, end_time, stream_name, level_ms)
+            values = format_pyramid(parts, stream_name, var_names)
         else:
-            values = format_samples(data_bundle, True, var_names)
+            data_bundle = fetch_sensor_data_bundle_for_sensor(sensor.remote_details, start_time, end_time, stream_name)
+            values = format_samples(data_bundle, args['window_type'] != 'hour', var_names)
 
         return build_response(
             {
@@ -257,6 +295,160 @@ class ApiGetSensorData2(Resource):
         )
 
 
+@api_resource('/api/1.0/sensor/data/aggregate', endpoint='/api/1.0/sensor/data/aggregate')
+class ApiGetSensorDataAggregate(Resource):
+
+    @staticmethod
+    def parse_args():
+        parser = reqparse.RequestParser()
+        parser.add_argument('Auth-Token', location='headers')
+        parser.add_argument('org_id', type=id_argument, required=True, location='args')
+        parser.add_argument('project_id', type=id_argument, required=True, location='args')
+        parser.add_argument('sensor_id', type=id_argument, required=True, location='args')
+        parser.add_argument('stream', type=str, required=True, location='args')
+        parser.add_argument('start_time', type=datetime_argument, required=True, location='args')
+        parser.add_argument('end_time', type=datetime_argument, required=True, location='args')
+        parser.add_argument('bucket_s', type=float, required=True, location='args')
+        parser.add_argument('aggregate', type=str, required=True, location='args')
+        parser.add_argument('percentile', type=float, required=False, default=50.0, location='args')
+        return parser.parse_args()
+
+    @ext_cache.cached(timeout=60*2, query_string=True)
+    def get(self):
+        """
+        Get Aggregated Sensor Data
+
+        Return sensor data of a given sensor aggregated in fixed width time buckets
+        ---
+        tags:
+          - Sensor Data
+        parameters:
+          - name: Auth-Token
+            in: header
+            schema:
+                type: string
+                required: true
+          - name: org_id
+            in: query
+            type: string
+            default:
+            required: true
+          - name: project_id
+            in: query
+            type: string
+            default:
+            required: true
+          - name: sensor_id
+            in: query
+            type: string
+            default:
+            required: true
+          - name: stream
+            in: query
+            type: string
+            default: 'acc/3ax/4g'
+            required: true
+          - name: start_time
+            in: query
+            type: string
+            default: '2017-11-07T11:00:00'
+            required: true
+          - name: end_time
+            in: query
+            type: string
+            default: '2017-11-07T12:00:00'
+            required: true
+          - name: bucket_s
+            in: query
+            type: number
+            default: 60
+            required: true
+          - name: aggregate
+            in: query
+            type: string
+            default: 'mean'
+            required: true
+            description: min, max, mean, std, percentile or count
+          - name: percentile
+            in: query
+            type: number
+            default: 50
+            required: false
+        responses:
+          200:
+            description: Success
+          400:
+            description: Invalid Parameters
+          401:
+            description: Authentication Failed
+          406:
+            description: Too many buckets
+            examples:
+        """
+        args = self.parse_args()
+        user = check_auth(args)
+
+        org, proj = fetch_org_and_project(user, args['org_id'], args['project_id'])
+
+        if org is None:
+            return build_response(None, status_code=ApiStatus.STATUS_ORG_NOT_FOUND)
+
+        if proj is None:
+            return build_response(None, status_code=ApiStatus.STATUS_PROJECT_NOT_FOUND)
+
+        sensor = fetch_sensor_from_id(args['sensor_id'], proj)
+
+        if sensor is None:
+            return build_response(None, status_code=ApiStatus.STATUS_SENSOR_NOT_FOUND)
+
+        start_time = args['start_time']
+        end_time = args['end_time']
+        bucket_ms = int(round(args['bucket_s'] * 1000))
+        stream_name = args['stream']
+
+        if stream_name == 'acc/3ax/4g':
+            var_names = ['x', 'y', 'z']
+        elif stream_name in ['cap/stretch/scalar', 'volt/system/mv', 'temp/acc/scalar']:
+            var_names = ['v']
+        else:
+            return build_response(None, status_code=ApiStatus.STATUS_INVALID_PARAMETER)
+
+        if end_time <= start_time or bucket_ms <= 0 or args['aggregate'] not in AGGREGATES \
+                or not 0 <= args['percentile'] <= 100:
+            return build_response(None, status_code=ApiStatus.STATUS_INVALID_PARAMETER)
+
+        if bucket_count(unixts(start_time), unixts(end_time), bucket_ms) > app.config['AGGREGATE_MAX_BUCKETS']:
+            return build_response(None, status_code=ApiStatus.STATUS_TOO_MANY_BUCKETS)
+
+        extend_sensors_remote_details([sensor])
+        bucket_ts, aggregated = fetch_sensor_aggregate(sensor.remote_details, start_time, end_time, stream_name,
+                                                       bucket_ms, args['aggregate'], args['percentile'])
+
+        values = {'ts': bucket_ts.tolist()}
+        for j, l in enumerate(var_names):
+            values[l] = aggregated[:, j].tolist()
+
+        return build_response(
+            {
+                'data':
+                {
+                    'sensor_id': id_out(sensor.id),
+                    'start_time': start_time.isoformat(),
+                    'end_time': end_time.isoformat(),
+                    'bucket_ms': bucket_ms,
+                    'aggregate': args['aggregate'],
+                    'streams':
+                        [
+                            {
+                                'stream_type': stream_name,
+                                'values': values
+                            }
+                        ]
+                }
+            }
+        )
+
+
 @api_resource('/api/1.0/sensor/data/derived', endpoint='/api/1.0/sensor/data/derived')
 class ApiGetSensorDerivedData(Resource):
 
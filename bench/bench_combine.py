@@ -0,0 +1,116 @@
+"""
+Peak memory and run time of combining a day of compressed records into one
+windowed array, stacking per-record arrays and masking the window versus
+decoding the window straight into a preallocated array
+
+    python -m bench.bench_combine
+"""
+import struct
+import time
+import tracemalloc
+import numpy
+from bench.bench_compress import accelerometer_signal
+from math.clock import ClockModel
+from math.compress import build_index, compress_fast, decompress_fast, load_index
+from math.decode import FORMAT_COMPRESS_3INT12, sample_count, window_jobs
+from math.decode_pool import DecodeExecutor
+
+RATE_HZ = 12.5
+
+
+class _Record(object):
+    def __init__(self, timestamp_tx, timestamp_tx_end, bin_data, frame_index):
+        self.timestamp_tx = timestamp_tx
+        self.timestamp_tx_end = timestamp_tx_end
+        self.bin_data = bin_data
+        self.frame_index = frame_index
+
+
+def make_day(record_count=72, samples_per_record=15000, packet_samples=4000):
+    """20 minute records of packets with their 0xFE timestamp, like add_records() stores them"""
+    tx_per_sample = 100.0 / RATE_HZ
+    records = []
+    tx = 100000
+    for i in range(record_count):
+        data = accelerometer_signal(samples_per_record, seed=i)
+        blob = bytearray()
+        for p in range(0, samples_per_record, packet_samples):
+            packet_tx = int(tx + p * tx_per_sample)
+            blob += bytearray([0xFE, 0x04]) + struct.pack('>L', packet_tx)
+            blob += bytearray().join(compress_fast(data[p:p + packet_samples], max_samples=packet_samples))
+        records.append(_Record(tx, tx + samples_per_record * tx_per_sample, bytes(blob), build_index(blob).tobytes()))
+        tx += samples_per_record * tx_per_sample
+    return records
+
+
+def combine_stacked(records, epoch_ms, start_ts, end_ts):
+    # Decode each record, stack them and mask the window
+    parts = [decompress_fast(r.bin_data) for r in records]
+    total = sum(len(p) for p in parts)
+    period = (records[-1].timestamp_tx_end - records[0].timestamp_tx) * 10.0 / total
+    ts = (numpy.arange(total) * period).astype(numpy.int64) + epoch_ms + records[0].timestamp_tx * 10
+    samples = numpy.vstack(parts)
+    mask = (ts > start_ts) & (ts < end_ts)
+    return ts[mask], samples[mask]
+
+
+def combine_preallocated(records, clock, start_ts, end_ts, executor):
+    # As query.sensordata.sensordata_query._combine_records()
+    counts = [sample_count("acc/3ax/4g", FORMAT_COMPRESS_3INT12, r.bin_data, r.frame_index) for r in records]
+    padding = [0] * len(records)
+    total = sum(counts)
+    anchor_sample = []
+    anchor_tx = []
+    offset = 0
+    for r, count in zip(records, counts):
+        index = load_index(r.frame_index)[:-1]
+        anchor_sample.append(index['sample'] + offset)
+        anchor_tx.append(index['tx'])
+        offset += count
+    anchor_sample = numpy.concatenate(anchor_sample + [[total]])
+    anchor_tx = numpy.concatenate(anchor_tx + [[records[-1].timestamp_tx_end]])
+    lo = int(min(max(clock.ms_to_sample(anchor_sample, anchor_tx, start_ts) - 2, 0), total))
+    hi = int(min(max(clock.ms_to_sample(anchor_sample, anchor_tx, end_ts) + 3, lo), total))
+    ts = clock.sample_ms(anchor_sample, anchor_tx, lo, hi)
+    first = lo + int(numpy.searchsorted(ts, start_ts, side='right'))
+    last = max(first, lo + int(numpy.searchsorted(ts, end_ts, side='left')))
+    jobs = [(records[i].bin_data, records[i].frame_index, r_lo, r_hi, row)
+            for i, r_lo, r_hi, row in window_jobs(counts, padding, first, last)]
+    samples = executor.decode("acc/3ax/4g", FORMAT_COMPRESS_3INT12, jobs, last - first)
+    return ts[first - lo:last - lo], samples
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    res = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, res
+
+
+def main(record_count=72):
+    records = make_day(record_count)
+    epoch_ms = 1.6e12
+    clock = ClockModel([0], [epoch_ms])
+    executor = DecodeExecutor(workers=0)
+    day_start = epoch_ms + records[0].timestamp_tx * 10
+    day_end = epoch_ms + records[-1].timestamp_tx_end * 10
+    span = day_end - day_start
+    hour = 3600 * 1000
+
+    print("% 14s % 10s % 12s % 12s % 12s % 12s" % ("window", "samples", "stack ms", "prealloc ms",
+                                                   "stack MB", "prealloc MB"))
+    for name, start_ts, end_ts in (('all + 1 h', day_start - hour, day_end + hour),
+                                   ('middle half', day_start + span / 4, day_end - span / 4),
+                                   ('1 h', day_start + span / 2, day_start + span / 2 + hour)):
+        t_old, peak_old, (ts_old, s_old) = measure(combine_stacked, records, epoch_ms, start_ts, end_ts)
+        t_new, peak_new, (ts_new, s_new) = measure(combine_preallocated, records, clock, start_ts, end_ts, executor)
+        assert (ts_old == ts_new).all() and (s_old == s_new).all(), "Results differ"
+        print("% 14s % 10d % 12.1f % 12.1f % 12.1f % 12.1f" % (name, len(ts_new), t_old * 1000, t_new * 1000,
+                                                               peak_old / 1e6, peak_new / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Throughput benchmark and fuzz harness for the FORMAT_COMPRESS_3INT12 codec
+
+    python -m bench.bench_compress
+"""
+import random
+import time
+import numpy
+from math.compress import compress, compress_fast, decompress, decompress_fast, IDLE_WINDOW
+
+
+def synthetic_record(frame_count, seed=0):
+    """
+    Build a random but valid FORMAT_COMPRESS_3INT12 byte stream with roughly the
+    frame mix of a real acc/3ax/4g record (mostly B5/B7, some idle, rare B11)
+    """
+    r = random.Random(seed)
+    data = bytearray([0xFE, 0x04, 0x00, 0x00, 0x00, 0x00])
+    data += bytearray([0xFC] + [r.randrange(256) for _ in range(4)])
+    for _ in range(frame_count):
+        p = r.random()
+        if p < 0.55:
+            data += bytearray([r.randrange(0x00, 0x80), r.randrange(256)])
+        elif p < 0.85:
+            data += bytearray([r.randrange(0xC0, 0xE0), r.randrange(256), r.randrange(256)])
+        elif p < 0.95:
+            data += bytearray([r.randrange(0x80, 0xC0), r.randrange(256), r.randrange(256), r.randrange(256)])
+        elif p < 0.99:
+            data += bytearray([0xF0, r.randrange(256)])
+        else:
+            data += bytearray([0xFC, r.randrange(256), r.randrange(256), r.randrange(256), r.randrange(256)])
+    return data
+
+
+def random_signal(sample_count, seed=0):
+    """Random walk with mixed step sizes, exercises every frame type"""
+    rng = numpy.random.RandomState(seed)
+    steps = rng.randint(-600, 600, (sample_count, 3)) // rng.choice([1, 8, 40, 300], (sample_count, 1))
+    return numpy.clip(numpy.cumsum(steps, axis=0), -1000, 1000).astype(numpy.int64)
+
+
+def accelerometer_signal(sample_count, seed=0, rate_hz=12.5):
+    """
+    Resting periods with sensor noise, interrupted by walking bouts around 1.8 Hz,
+    scaled like acc/3ax/4g (125 LSB per g)
+    """
+    rng = numpy.random.RandomState(seed)
+    t = numpy.arange(sample_count) / rate_hz
+    data = numpy.zeros((sample_count, 3))
+    data[:, 0] = 125
+    data += rng.randint(-2, 3, (sample_count, 3))
+    pos = 0
+    while pos < sample_count:
+        rest = rng.randint(100, 3000)
+        walk = rng.randint(20, 600)
+        bout = slice(pos + rest, pos + rest + walk)
+        data[bout] += numpy.outer(numpy.sin(2 * numpy.pi * 1.8 * t[bout]), rng.uniform(10, 150, 3))
+        pos += rest + walk
+    return numpy.clip(numpy.round(data), -1000, 1000).astype(numpy.int64)
+
+
+def check_roundtrip(data, max_samples=4000, max_packetsize=1024):
+    """
+    Encode with both encoders and decode with both decoders, assert that the
+    results agree and that samples are restored within the idle window
+    """
+    packets = list(compress(data, max_samples, max_packetsize))
+    packets_fast = list(compress_fast(data, max_samples, max_packetsize))
+    assert [bytes(p) for p in packets] == [bytes(p) for p in packets_fast], "Encoders disagree"
+    blob = bytearray().join(packets)
+    decoded = decompress(blob)
+    decoded_fast = decompress_fast(blob)
+    assert decoded.shape == decoded_fast.shape and (decoded == decoded_fast).all(), "Decoders disagree"
+    assert decoded.shape == numpy.shape(data), "Sample count changed"
+    assert numpy.max(numpy.abs(decoded - data), initial=0) <= IDLE_WINDOW, "Sample outside idle window"
+    return blob
+
+
+def fuzz(iterations=200, seed=0):
+    r = random.Random(seed)
+    for it in range(iterations):
+        sample_count = r.randrange(0, 3000)
+        if r.random() < 0.5:
+            data = random_signal(sample_count, seed=it)
+        else:
+            data = accelerometer_signal(sample_count, seed=it)
+        check_roundtrip(data, r.choice([4000, 400, 13]), r.choice([1024, 128, 12]))
+    print("fuzz: %d round trips OK" % iterations)
+
+
+def timed(fn, data, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = fn(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, res
+
+
+def main(sample_counts=(1000, 10000, 45000), repeat=3):
+    print("% 10s % 8s % 10s % 16s % 16s % 16s % 16s" % ("signal", "samples", "bytes",
+                                                       "enc MB/s old", "enc MB/s fast",
+                                                       "dec MS/s old", "dec MS/s fast"))
+    for name, generator in (('random', random_signal), ('accel', accelerometer_signal)):
+        for sample_count in sample_counts:
+            data = generator(sample_count, seed=sample_count)
+            blob = check_roundtrip(data)
+            raw_mb = data.size * 2 / 1e6  # int16 samples
+            t_enc_old, _ = timed(lambda d: list(compress(d)), data, 1)
+            t_enc_new, _ = timed(lambda d: list(compress_fast(d)), data, repeat)
+            t_dec_old, _ = timed(decompress, blob, 1)
+            t_dec_new, _ = timed(decompress_fast, blob, repeat)
+            print("% 10s % 8d % 10d % 16.3f % 16.3f % 16.3f % 16.3f" % (name, sample_count, len(blob),
+                                                                    raw_mb / t_enc_old, raw_mb / t_enc_new,
+                                                                    sample_count / t_dec_old / 1e6,
+                                                                    sample_count / t_dec_new / 1e6))
+
+    print("% 8s % 10s % 14s % 14s % 8s" % ("frames", "bytes", "old MS/s", "fast MS/s", "speedup"))
+    for frame_count in sample_counts:
+        data = synthetic_record(frame_count, seed=frame_count)
+        t_old, res_old = timed(decompress, data, repeat)
+        t_new, res_new = timed(decompress_fast, data, repeat)
+        assert res_old.shape == res_new.shape and (res_old == res_new).all(), "Decoders disagree"
+        samples = len(res_new)
+        print("% 8d % 10d % 14.3f % 14.3f % 8.1f" % (frame_count, len(data),
+                                                  samples / t_old / 1e6,
+                                                  samples / t_new / 1e6,
+                                                  t_old / t_new))
+    fuzz()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Size and encode / decode time of cached derived hours (CacheDerivedData.data),
+pickle + lz4 of the whole SensorDataBundle versus the bundle container, raw
+and lz4 compressed. 'bins' is what fetch_derived_data_bins() does with an hour,
+'1 column' reads only the ts and a single derived column.
+
+    python -m bench.bench_container
+"""
+import pickle
+import time
+from datetime import datetime, timedelta
+import lz4.frame
+import numpy
+from types.bundle_container import BundleContainer, dumps_bundle, loads_bundle
+from types.derived_data import DerivedData
+from types.sensor_data import SensorData2
+from types.sensor_data_bundle import SensorDataBundle
+from utils import unixts
+
+RATE_HZ = 12.5
+CHUNK_SAMPLES = 64
+CATEGORIES = ['lying', 'sitting', 'standing', 'walking', 'running', 'cycling', 'transport', 'other']
+OUTPUTS = ['activity/%s/time' % c for c in CATEGORIES] + ['activity/step/count', 'general/data/time']
+
+
+def derived_hour(start_time, seed=0):
+    """Like Algorithm.analyse_data(): one hot category runs, step counts and data time per 64 sample chunk"""
+    rng = numpy.random.RandomState(seed)
+    rows = int(3600 * RATE_HZ / CHUNK_SAMPLES)
+    start_ts = unixts(start_time)
+    ts = start_ts + numpy.arange(rows) * (CHUNK_SAMPLES * 1000.0 / RATE_HZ)
+    category = numpy.repeat(rng.randint(0, len(CATEGORIES), rows // 20 + 1), 20)[:rows]
+    data = numpy.zeros((rows, len(OUTPUTS)), dtype=numpy.int32)
+    data[numpy.arange(rows), category] = 1
+    data[:, len(CATEGORIES)] = numpy.where(category == 3, rng.randint(50, 120, rows), 0)
+    data[:, len(CATEGORIES) + 1] = 1
+    source = SensorData2(start_ts, start_ts + 3600000, None, 'acc/3ax/4g', None)
+    bundle = SensorDataBundle(start_time=None, end_time=None, stream_type='derived')
+    bundle.add(DerivedData(derived_type=OUTPUTS, data=data, source=source, ts=ts))
+    return bundle
+
+
+def hour_bins(bundle, start_time):
+    data = bundle.get_data()
+    bin_width = timedelta(minutes=15)
+    starts = [start_time + bin_width * i for i in range(4)]
+    return [numpy.sum(w, axis=0) for w in data.derived_windows(starts, [s + bin_width for s in starts])]
+
+
+def timed(fn, values, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for v in values:
+            fn(v)
+    return (time.perf_counter() - start) / repeat / len(values)
+
+
+def main(hours=24, repeat=20):
+    day = datetime(2020, 1, 1)
+    bundles = [derived_hour(day + timedelta(hours=h), seed=h) for h in range(hours)]
+    variants = [
+        ('pickle + lz4', lambda b: lz4.frame.compress(pickle.dumps(b)), loads_bundle,
+         lambda v: loads_bundle(v).get_data().derived_window(day, day + timedelta(hours=1))[:, 0]),
+        ('container', lambda b: dumps_bundle(b), loads_bundle,
+         lambda v: BundleContainer(v).column(0, OUTPUTS[0])),
+        ('container lz4', lambda b: dumps_bundle(b, compress=True), loads_bundle,
+         lambda v: BundleContainer(v).column(0, OUTPUTS[0])),
+    ]
+
+    print("% 14s % 10s % 12s % 12s % 12s % 12s" % ("variant", "bytes", "encode us", "decode us", "bins us", "1 column us"))
+    for name, dumps, loads, column in variants:
+        values = [dumps(b) for b in bundles]
+        for b, v in zip(bundles, values):
+            assert numpy.array_equal(loads(v).get_data().data, b.get_data().data)
+        encode = timed(dumps, bundles, repeat)
+        decode = timed(loads, values, repeat)
+        bins = timed(lambda v: hour_bins(loads(v), day), values, repeat)
+        one = timed(column, values, repeat)
+        print("% 14s % 10d % 12.1f % 12.1f % 12.1f % 12.1f" % (name, sum(len(v) for v in values) / hours,
+                                                             encode * 1e6, decode * 1e6, bins * 1e6, one * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+In-line versus process pool decoding of many compressed records, shows the
+batch size where DecodeExecutor should switch to the pool
+
+    python -m bench.bench_decode_pool
+"""
+import os
+import time
+from bench.bench_compress import accelerometer_signal
+from math.compress import compress_fast
+from math.decode import FORMAT_COMPRESS_3INT12
+from math.decode_pool import DecodeExecutor
+
+
+def make_records(record_count, samples_per_record=15000):
+    # 20 minute records at 12.5 Hz, like add_records() creates them
+    records = []
+    for i in range(record_count):
+        data = accelerometer_signal(samples_per_record, seed=i)
+        records.append(bytes(bytearray().join(compress_fast(data))))
+    return records, samples_per_record
+
+
+def jobs_for(records, samples_per_record):
+    return [(r, None, 0, samples_per_record, i * samples_per_record) for i, r in enumerate(records)]
+
+
+def main(batch_sizes=(1, 2, 4, 8, 16, 32, 72), workers=None, repeat=3):
+    workers = workers or os.cpu_count()
+    executor = DecodeExecutor(workers=workers, min_samples=0)
+    records, per_record = make_records(max(batch_sizes))
+
+    # Start the workers before timing
+    executor.decode("acc/3ax/4g", FORMAT_COMPRESS_3INT12, jobs_for(records[:workers], per_record),
+                    workers * per_record, parallel=True)
+
+    print("workers: %d" % workers)
+    print("% 8s % 10s % 12s % 12s % 8s" % ("records", "samples", "inline ms", "pool ms", "speedup"))
+    crossover = None
+    for batch in batch_sizes:
+        jobs = jobs_for(records[:batch], per_record)
+        rows = batch * per_record
+        timings = []
+        for parallel in (False, True):
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                executor.decode("acc/3ax/4g", FORMAT_COMPRESS_3INT12, jobs, rows, parallel=parallel)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings.append(best)
+        if crossover is None and timings[1] < timings[0]:
+            crossover = rows
+        print("% 8d % 10d % 12.1f % 12.1f % 8.2f" % (batch, rows, timings[0] * 1000, timings[1] * 1000,
+                                                   timings[0] / timings[1]))
+    print("pool faster from %s samples (DECODE_PARALLEL_MIN_SAMPLES)" % crossover)
+    executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
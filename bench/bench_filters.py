@@ -0,0 +1,98 @@
+"""
+Throughput and numerical equivalence of the FIR filters against their
+previous implementations: filter design per call versus the shared design
+cache, x, y, z filtered one at a time versus in one pass, lfilter() versus
+oaconvolve() by tap count (sets FFT_MIN_TAPS), and upsampling by repeat +
+lfilter() versus upfirdn()
+
+    python -m bench.bench_filters
+"""
+import time
+import numpy
+import scipy.signal as sig
+from bench.bench_compress import accelerometer_signal
+from math.algorithm.lowpass_filter import LowpassFilter
+from math.filter import fir
+from math.filter.upsample_filter import UpsampleFilter
+
+RATE_HZ = 12.5
+HOUR_SAMPLES = int(3600 * RATE_HZ)
+
+
+class PreviousLowpassFilter:
+    def __init__(self, sample_freq_hz, cutoff_hz):
+        nyq_freq = sample_freq_hz / 2.0
+        n, beta = sig.kaiserord(26.0, 1.0 / nyq_freq)
+        self.taps = sig.firwin(n, cutoff_hz / nyq_freq, window=('kaiser', beta))
+        self.ltaps = len(self.taps)
+
+    def filter(self, data, axis=-1):
+        data = numpy.atleast_2d(data)
+        tapshl = self.ltaps // 2 + 1
+        padding = [(0, 0)] * data.ndim
+        padding[axis] = (tapshl, tapshl)
+        s_data = numpy.pad(data.copy(), padding, 'symmetric')
+        us_data = sig.lfilter(self.taps, 1.0, s_data, axis=axis)
+        return numpy.squeeze(us_data.take(numpy.arange(2 * tapshl, us_data.shape[axis]), axis=axis))
+
+
+def previous_upsample(data, source_interval, upsample_factor):
+    source_freq = 1000.0 / source_interval
+    nyq_freq = source_freq * upsample_factor / 2.0
+    n, beta = sig.kaiserord(26.0, 1.0 / nyq_freq)
+    taps = sig.firwin(n, source_freq * 0.40 / nyq_freq, window=('kaiser', beta))
+    tapshl = len(taps) // 2 + 1
+    us_data = numpy.repeat(data, upsample_factor, 0)
+    us_data = numpy.pad(us_data, ((tapshl, tapshl), (0, 0)), 'symmetric')
+    return sig.lfilter(taps, 1.0, us_data, axis=0)[len(taps) + 2:, :]
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def row(name, before_ms, after_ms, before, after):
+    print("% 34s % 10.2f % 10.2f % 8.1fx % 12.2e" % (name, before_ms, after_ms, before_ms / after_ms,
+                                                    numpy.max(numpy.abs(before - after))))
+
+
+def main(repeat=10):
+    xyz = accelerometer_signal(HOUR_SAMPLES, seed=0).astype(numpy.float64) * 4.0 / 500.0
+    print("% 34s % 10s % 10s % 9s % 12s" % ("", "before ms", "after ms", "speedup", "max abs diff"))
+
+    before_ms, _ = timed(lambda: PreviousLowpassFilter(RATE_HZ, 0.5), repeat * 10)
+    after_ms, _ = timed(lambda: LowpassFilter(RATE_HZ, 0.5), repeat * 10)
+    row("design 12.5 Hz / 0.5 Hz", before_ms, after_ms, PreviousLowpassFilter(RATE_HZ, 0.5).taps,
+        LowpassFilter(RATE_HZ, 0.5).taps)
+
+    # SmoothXYZ on an hour
+    previous = PreviousLowpassFilter(RATE_HZ, 0.5)
+    lp = LowpassFilter(RATE_HZ, 0.5)
+    before_ms, before = timed(lambda: numpy.vstack([previous.filter(xyz[:, i]) for i in range(3)]), repeat)
+    after_ms, after = timed(lambda: lp.filter(numpy.vstack([xyz[:, i] for i in range(3)])), repeat)
+    row("x, y, z hour, %d taps" % lp.ltaps, before_ms, after_ms, before, after)
+
+    # Same cutoff at higher rates needs longer taps, lfilter() versus oaconvolve()
+    min_taps = fir.FFT_MIN_TAPS
+    for rate_hz in (25.0, 50.0, 100.0, 200.0):
+        data = numpy.tile(xyz.T, (1, int(rate_hz / RATE_HZ)))
+        lp = LowpassFilter(rate_hz, 0.5)
+        fir.FFT_MIN_TAPS = len(lp.taps) + 1
+        before_ms, before = timed(lambda: lp.filter(data), repeat)
+        fir.FFT_MIN_TAPS = len(lp.taps)
+        after_ms, after = timed(lambda: lp.filter(data), repeat)
+        row("lfilter / fft %g Hz, %d taps" % (rate_hz, lp.ltaps), before_ms, after_ms, before, after)
+    fir.FFT_MIN_TAPS = min_taps
+
+    for factor in (2, 4, 8):
+        up = UpsampleFilter(1000.0 / RATE_HZ, factor)
+        before_ms, before = timed(lambda: previous_upsample(xyz, 1000.0 / RATE_HZ, factor), repeat)
+        after_ms, after = timed(lambda: up.upsample(xyz), repeat)
+        row("upsample x%d, %d taps" % (factor, up.ltaps), before_ms, after_ms, before, after)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Time and numerical equivalence of FreqPeakFilt / FreqPeaks on an hour of
+samples: the previous per chunk, per search frequency np.interp() loops versus
+the cached interpolation matrices
+
+    python -m bench.bench_freqpeaks
+"""
+import time
+import numpy
+from bench.bench_compress import accelerometer_signal
+from math.algorithm import intermediates
+from math.algorithm.algorithms import FreqPeakFilt, FreqPeaks
+from types.sensor_data import SensorData2
+
+RATE_HZ = 12.5
+HOUR_SAMPLES = int(3600 * RATE_HZ)
+AMP_CUTOFF = 0.05
+
+
+def previous_calc_response(freqs, chunk):
+    search_freqs = FreqPeakFilt.get_search_freqs()
+    r = numpy.zeros(FreqPeakFilt.N)
+    chunk = numpy.squeeze(chunk)
+    for j, f in enumerate(search_freqs):
+        r[j] = numpy.dot(numpy.interp(f * FreqPeakFilt.MULTS, freqs, chunk), FreqPeakFilt.SIGNS)
+    return r
+
+
+def previous_freq_peak_filt(sensor_data):
+    freqs = intermediates.get(sensor_data, 'fft_freqs')
+    yz_fft_abs = intermediates.get(sensor_data, 'fft_abs')
+    resp = numpy.zeros((yz_fft_abs.shape[0], FreqPeakFilt.N))
+    for i, chunk in enumerate(yz_fft_abs):
+        resp[i, :] = previous_calc_response(freqs, chunk)
+    return resp
+
+
+def previous_freq_peaks(sensor_data):
+    freqs = intermediates.get(sensor_data, 'fft_freqs')
+    yz_fft_abs = intermediates.get(sensor_data, 'fft_abs')
+    search_freqs = FreqPeakFilt.get_search_freqs()
+    count = yz_fft_abs.shape[0]
+    resp, order1, amp, factor = [numpy.zeros(count) for _ in range(4)]
+    for i, chunk in enumerate(numpy.squeeze(yz_fft_abs, axis=-1)):
+        r = previous_calc_response(freqs, chunk)
+        max_idx = numpy.argmax(r)
+        resp[i] = r[max_idx]
+        order1[i] = search_freqs[max_idx]
+        fa = numpy.interp(order1[i] * FreqPeakFilt.MULTS[::2], freqs, chunk)
+        amp[i] = numpy.max(fa)
+        if amp[i] > AMP_CUTOFF:
+            factor[i] = numpy.sum(fa[1:3]) / fa[0]
+        else:
+            order1[i] = 0
+    return numpy.vstack((amp, resp, factor / 5.0, order1))
+
+
+def chunked_hour(data, chunk_samples):
+    sensor_data = SensorData2(0, 3600000, numpy.arange(len(data)) * 1000.0 / RATE_HZ, 'acc/3ax/4g', data)
+    return sensor_data.chunked_view(chunk_samples)
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main(repeat=3):
+    data = accelerometer_signal(HOUR_SAMPLES, seed=0)
+    print("% 20s % 10s % 10s % 9s % 12s" % ("", "before ms", "after ms", "speedup", "max abs diff"))
+    for chunk_samples in (64, 125):
+        chunked = chunked_hour(data, chunk_samples)
+        with intermediates.shared(chunked):
+            intermediates.get(chunked, 'fft_abs')  # Shared spectra are not part of the timing
+            for name, previous, alg in (("FreqPeakFilt", previous_freq_peak_filt, FreqPeakFilt),
+                                        ("FreqPeaks", previous_freq_peaks, FreqPeaks)):
+                before_ms, before = timed(lambda: previous(chunked), repeat)
+                after_ms, after = timed(lambda: alg.analyse_data_low(chunked), repeat)
+                print("% 20s % 10.2f % 10.2f % 8.1fx % 12.2e" % ("%s / %d" % (name, chunk_samples), before_ms,
+                                                                after_ms, before_ms / after_ms,
+                                                                numpy.max(numpy.abs(before - after))))
+
+
+if __name__ == '__main__':
+    main()
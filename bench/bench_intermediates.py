@@ -0,0 +1,49 @@
+"""
+Time of the algorithms sharing get_xyz(), rfft() and lowpass work on an hour
+of samples: each one alone on a fresh chunked view (what running them one
+after another cost before the intermediates were shared) versus all of them
+through intermediates.run() on one view.
+
+    python -m bench.bench_intermediates
+"""
+import time
+import numpy
+from bench.bench_compress import accelerometer_signal
+from math.algorithm import algorithms, intermediates
+from types.sensor_data import SensorData2
+
+RATE_HZ = 12.5
+HOUR_SAMPLES = int(3600 * RATE_HZ)
+
+ALGORITHMS = [algorithms.SmoothXYZ, algorithms.SmoothAngle, algorithms.Transition,
+              algorithms.SampleFFT, algorithms.FreqPeakFilt, algorithms.FreqPeaks]
+
+
+def chunked_hour(data):
+    sensor_data = SensorData2(0, 3600000, numpy.arange(len(data)) * 1000.0 / RATE_HZ, 'acc/3ax/4g', data)
+    return sensor_data.chunked_view(64)
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(repeat=5):
+    data = accelerometer_signal(HOUR_SAMPLES, seed=0)
+
+    print("% 16s % 10s" % ("", "alone ms"))
+    total_ms = 0
+    for alg in ALGORITHMS:
+        ms = timed(lambda: alg.analyse_data_low(chunked_hour(data)), repeat)
+        total_ms += ms
+        print("% 16s % 10.2f" % (alg.__name__, ms))
+    shared_ms = timed(lambda: intermediates.run(ALGORITHMS, chunked_hour(data)), repeat)
+    print("% 16s % 10.2f" % ("sum", total_ms))
+    print("% 16s % 10.2f (%.1fx)" % ("shared", shared_ms, total_ms / shared_ms))
+
+
+if __name__ == '__main__':
+    main()
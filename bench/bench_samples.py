@@ -0,0 +1,87 @@
+"""
+Memory of running the accelerometer algorithms on an hour of samples, with
+the previous float64 samples() and get_xyz() copies versus the float32 per
+axis views. Each variant runs in a fresh process so peak RSS is its own.
+
+    python -m bench.bench_samples
+"""
+import multiprocessing
+import resource
+import time
+import tracemalloc
+import numpy
+from bench.bench_compress import accelerometer_signal
+from math.algorithm import algorithms, intermediates, utils
+from math.algorithm.generic import alg_movement
+from types.sensor_data import SensorData2, set_sample_dtype
+
+RATE_HZ = 12.5
+HOUR_SAMPLES = int(3600 * RATE_HZ)
+
+
+def get_xyz_copies(sensor_data):
+    # get_xyz() before per axis views
+    data = sensor_data.samples()
+    last_axis = len(data.shape) - 1
+    x = data.take([0], axis=last_axis)
+    y = data.take([1], axis=last_axis)
+    z = data.take([2], axis=last_axis)
+    try:
+        valid = data.take([3], axis=last_axis)
+    except:
+        valid = numpy.ones(x.shape)
+    valid_bool = (valid==False)
+    x[valid_bool] = 0
+    y[valid_bool] = 0
+    z[valid_bool] = 0
+    return x, y, z, valid
+
+
+def derive_hour(data):
+    # What Algorithm.analyse_data() does with an hour: chunk it and run the categorizers
+    sensor_data = SensorData2(0, 3600000, numpy.arange(len(data)) * 80.0, 'acc/3ax/4g', data)
+    chunked = sensor_data.chunked_view(64)
+    alg_movement.ActivityMovement.analyse_data_chunks(chunked, None)
+    algorithms.ActivityAngle.analyse_data_low(chunked)
+    algorithms.ActivityDAngle.analyse_data_low(chunked)
+    algorithms.Transition.analyse_data_low(chunked)
+
+
+def run_variant(variant, hours):
+    if variant == 'float64 copies':
+        set_sample_dtype(numpy.float64)
+        getter = get_xyz_copies
+    else:
+        set_sample_dtype(numpy.float32)
+        getter = utils.get_xyz
+    for module in (intermediates, algorithms):
+        module.get_xyz = getter
+
+    # Decoded samples are in memory before the algorithms run, only measure on top of them
+    data = [accelerometer_signal(HOUR_SAMPLES, seed=h).astype(numpy.int16) for h in range(hours)]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = 0
+    elapsed = 0
+    for hour in data:
+        tracemalloc.start()
+        start = time.perf_counter()
+        derive_hour(hour)
+        elapsed += time.perf_counter() - start
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return elapsed / hours, peak, (rss_after - rss_before) * 1024
+
+
+def main(hours=4):
+    print("raw int16 per hour: %.1f MB" % (HOUR_SAMPLES * 3 * 2 / 1e6))
+    print("% 16s % 12s % 18s % 16s" % ("variant", "ms / hour", "peak traced MB", "peak RSS +MB"))
+    ctx = multiprocessing.get_context('spawn')
+    for variant in ('float64 copies', 'float32 views'):
+        with ctx.Pool(1) as pool:
+            elapsed, peak, rss = pool.apply(run_variant, (variant, hours))
+        print("% 16s % 12.1f % 18.1f % 16.1f" % (variant, elapsed * 1000, peak / 1e6, rss / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,10 @@
 from flask_caching import Cache
 from flask_obscure import Obscure
+from flask_redis import Redis
 from flask_sqlalchemy import SQLAlchemy
 from flask_sslify import SSLify
 from raven.contrib.flask import Sentry
+from types.sensor_data import set_sample_dtype
 
 from .flaskapp import app
 
@@ -17,6 +19,10 @@ if app.config['FORCE_SSL'] is True:
 internal_cache = Cache(app, config={'CACHE_TYPE': 'simple'})
 ext_cache = internal_cache
 
+redis_store = Redis(app)
+
+set_sample_dtype(app.config.get('SAMPLE_DTYPE', 'float32'))
+
 if 'SENTRY_DNS' in app.config and app.config['SENTRY_DNS'] and app.config['SENTRY_DNS'] != '':
     sentry = Sentry(app, dsn=app.config['SENTRY_DNS'])
 else:
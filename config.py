@@ -23,8 +23,40 @@ class Config(object):
     REDIS_DB = 0
 
     CACHE_SERVER_ID = 0
+    # lz4 compress cached derived hours (see types/bundle_container.py), about
+    # 7x smaller, uncompressed they are read without copying
+    CACHE_DERIVED_COMPRESS = True
     DEPLOYMENT_ID = ENV_DEPLOYMENT_ID
 
+    # Record decoding, 0 workers decodes in the request thread
+    # (see bench/bench_decode_pool.py for the crossover). Workers are started
+    # by a forkserver, so they are safe under threaded servers, see
+    # math/decode_pool.py
+    DECODE_WORKERS = 0
+    DECODE_PARALLEL_MIN_SAMPLES = 100000
+
+    # Record bin_data moved out of the database (see migrate/migrate_blobs.py),
+    # a relative path is under the instance folder of the app
+    BLOB_STORE_DIR = os.getenv('SENS_BLOB_STORE_DIR', 'blobstore')
+    BLOB_CACHE_BYTES = 64 * 1024 * 1024
+
+    # Decoded samples of closed records (see models/sensordata/sample_cache.py)
+    SAMPLE_CACHE_BYTES = 128 * 1024 * 1024
+    SAMPLE_CACHE_REDIS = False
+    SAMPLE_CACHE_REDIS_TTL_S = 24 * 3600
+
+    # Record pyramids (see query/sensordata/pyramid_query.py): records per
+    # /internal/worker/pyramids step, and the process cache of the levels
+    # requests build for records without a stored pyramid (the open record)
+    PYRAMID_WORKER_BATCH = 50
+    PYRAMID_CACHE_BYTES = 16 * 1024 * 1024
+
+    # Largest bucket count /api/1.0/sensor/data/aggregate answers
+    AGGREGATE_MAX_BUCKETS = 10000
+
+    # dtype of scaled samples handed to algorithms (see types/sensor_data.py)
+    SAMPLE_DTYPE = 'float32'
+
     DESCRIPTION = 'default'
 
     APIDOC_ADDR = ENV_APIDOC_ADDR
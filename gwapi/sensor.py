@@ -8,7 +8,8 @@ from werkzeug.exceptions import BadRequest
 from api.error_codes import ApiStatus
 from api.helpers import api_resource, build_parameter_error_respose, build_response, bindata_argument
 from components import db
-from models import GatewaySensorActionRequest, MotionDevice, datetime, TimeSync, Session2, Stream2, add_records
+from models import GatewaySensorActionRequest, MotionDevice, datetime, TimeSync, Session2, Stream2, add_records, \
+    get_clock_model, invalidate_clock_model, invalidate_record_pyramids
 
 
 @api_resource('/gwapi/1.0/gateway/submit/state')
@@ -49,6 +50,8 @@ class GatewaySensorSubmitState(Resource):
         if action.action_type == GatewaySensorActionRequest.ACTION_SYNC and action.session_id is not None:
             timesync = TimeSync(session_id=action.session_id, timestamp_tx=args['sensor_tx'], server_time=now)
             db.session.add(timesync)
+            invalidate_clock_model(action.session_id)
+            invalidate_record_pyramids(action.session_id, args['sensor_tx'])
 
         db.session.commit()
 
@@ -163,6 +166,7 @@ class GatewaySensorSubmitRecords(Resource):
 
         # Epoch
         timesync = TimeSync.query.filter(TimeSync.session_id==session.id).order_by(TimeSync.timestamp_tx.desc()).first()
+        clock = get_clock_model(session.id, latest=timesync)
 
         print("Submitting %d records" % len(args['data']))
 
@@ -211,14 +215,14 @@ class GatewaySensorSubmitRecords(Resource):
             # Save record under corresponding stream
             record_data[stream_type].append([timestamp_tx, count, bin_data])
 
-            session.motion_device.last_record_timestamp = timesync.tx_to_utc(timestamp_tx)
+            session.motion_device.last_record_timestamp = clock.tx_to_utc(timestamp_tx)
             session.end_time = session.motion_device.last_record_timestamp
             if session.start_time is None or session.start_time > session.end_time:
                 session.start_time = session.end_time
 
         db.session.commit()
         for s in record_data:
-            add_records(session, streams[s], record_data[s], timesync)
+            add_records(session, streams[s], record_data[s], clock)
         action.synced_record_last = last_record_id
         db.session.commit()
 
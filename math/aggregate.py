@@ -0,0 +1,100 @@
+import numpy
+
+###############################################################
+##
+## Fixed width time bucket aggregates of samples, or of pyramid
+## levels (see math/pyramid.py) when they cover the aggregate
+##
+###############################################################
+
+AGGREGATES = ('min', 'max', 'mean', 'std', 'percentile', 'count')
+PYRAMID_AGGREGATES = ('min', 'max', 'mean', 'count')
+
+
+def bucket_count(start_ts, end_ts, bucket_ms):
+    """Number of buckets of [start_ts, end_ts)"""
+    return int(-(-(end_ts - start_ts) // bucket_ms))
+
+
+def _runs(bucket):
+    # Start of each run of equal bucket ids, bucket is increasing
+    return numpy.flatnonzero(numpy.concatenate(([True], bucket[1:] != bucket[:-1])))
+
+
+def aggregate_samples(ts, samples, start_ts, bucket_ms, aggregate, percentile=50.0):
+    """
+    :param ts: numpy int64 unix ms of each sample, increasing
+    :param samples: numpy [n, axes]
+    :param start_ts: unix ms of the start of the first bucket
+    :param aggregate: one of AGGREGATES
+    :param percentile: 0-100, for aggregate 'percentile' (linear interpolation like numpy.percentile)
+    :return: bucket start ts numpy int64 [buckets], values numpy float64 [buckets, axes], only non-empty buckets
+    """
+    bucket = (ts - start_ts) // bucket_ms
+    if len(ts) == 0:
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros((0, samples.shape[1]))
+    starts = _runs(bucket)
+    counts = numpy.diff(numpy.append(starts, len(ts)))
+    bucket_ts = bucket[starts] * bucket_ms + start_ts
+
+    if aggregate == 'min':
+        values = numpy.minimum.reduceat(samples, starts, axis=0).astype(numpy.float64)
+    elif aggregate == 'max':
+        values = numpy.maximum.reduceat(samples, starts, axis=0).astype(numpy.float64)
+    elif aggregate == 'mean':
+        values = numpy.add.reduceat(samples, starts, axis=0, dtype=numpy.float64) / counts[:, numpy.newaxis]
+    elif aggregate == 'std':
+        mean = numpy.add.reduceat(samples, starts, axis=0, dtype=numpy.float64) / counts[:, numpy.newaxis]
+        square = numpy.add.reduceat(numpy.square(samples, dtype=numpy.float64), starts, axis=0) / counts[:, numpy.newaxis]
+        values = numpy.sqrt(numpy.maximum(square - numpy.square(mean), 0))
+    elif aggregate == 'percentile':
+        # Sort every bucket at once (bucket id as the primary key) and interpolate between the closest ranks
+        rank = (counts - 1) * (percentile / 100.0)
+        lower = numpy.floor(rank).astype(numpy.int64)
+        upper = numpy.minimum(lower + 1, counts - 1)
+        fraction = rank - lower
+        values = numpy.zeros((len(starts), samples.shape[1]))
+        for axis in range(samples.shape[1]):
+            column = samples[:, axis]
+            ordered = column[numpy.lexsort((column, bucket))].astype(numpy.float64)
+            values[:, axis] = ordered[starts + lower] + (ordered[starts + upper] - ordered[starts + lower]) * fraction
+    elif aggregate == 'count':
+        values = numpy.repeat(counts[:, numpy.newaxis], samples.shape[1], axis=1).astype(numpy.float64)
+    else:
+        raise ValueError("Unknown aggregate %s" % aggregate)
+    return bucket_ts, values
+
+
+def pyramid_level_for(start_ts, end_ts, bucket_ms, levels):
+    """Coarsest pyramid level whose buckets nest in the requested buckets and range, None if none do"""
+    nested = [level for level in levels
+              if bucket_ms % level == 0 and start_ts % level == 0 and end_ts % level == 0]
+    return nested[-1] if len(nested) else None
+
+
+def aggregate_pyramid(buckets, start_ts, bucket_ms, aggregate):
+    """
+    aggregate_samples() from a pyramid level nesting in the requested buckets
+
+    :param buckets: pyramid_dtype array, increasing ts
+    :param aggregate: one of PYRAMID_AGGREGATES
+    """
+    axes = buckets['min'].shape[1]
+    if len(buckets) == 0:
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros((0, axes))
+    bucket = (buckets['ts'] - start_ts) // bucket_ms
+    starts = _runs(bucket)
+    bucket_ts = bucket[starts] * bucket_ms + start_ts
+    counts = buckets['count'].astype(numpy.float64)[:, numpy.newaxis]
+
+    if aggregate == 'min':
+        values = numpy.minimum.reduceat(buckets['min'], starts, axis=0).astype(numpy.float64)
+    elif aggregate == 'max':
+        values = numpy.maximum.reduceat(buckets['max'], starts, axis=0).astype(numpy.float64)
+    elif aggregate == 'mean':
+        values = numpy.add.reduceat(buckets['mean'] * counts, starts, axis=0) / numpy.add.reduceat(counts, starts, axis=0)
+    elif aggregate == 'count':
+        values = numpy.repeat(numpy.add.reduceat(counts, starts, axis=0), axes, axis=1)
+    else:
+        raise ValueError("Aggregate %s needs samples" % aggregate)
+    return bucket_ts, values
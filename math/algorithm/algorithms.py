@@ -2,11 +2,13 @@ import numpy as np
 import numpy
 import scipy.signal as sig
 import time
+from functools import lru_cache
 from numpy.fft import rfftfreq
+from math.algorithm import intermediates
 from math.algorithm.utils import get_xyz, OVER_SAMPLES
 from types.derived_data import DerivedData
+from types.sensor_data import SensorData2
 from types.sensor_data_bundle import SensorDataBundle
-from .lowpass_filter import LowpassFilter
 
 
 class AlgorithmMeta:
@@ -53,6 +55,51 @@ def hyst_crossing(data, limit_low, limit_high):
     return idx[df<0], idx[df>00]
 
 
+# hyst_crossing() of consecutive windows. state is the hysteresis at the end of the
+# previous window (None for the first), a crossing between the windows is at index -1
+def hyst_crossing_stream(data, limit_low, limit_high, state=None):
+    h = hyst(data, limit_low, limit_high, bool(state))*1
+    if state is not None:
+        h = np.concatenate(([int(state)], h))
+    df = np.diff(h)
+    idx = np.arange(len(df), dtype=np.int64) - (1 if state is not None else 0)
+    return idx[df<0], idx[df>00], bool(h[-1]) if len(h) else state
+
+
+# Samples further apart than this do not continue a chunk between stream windows
+STREAM_MAX_GAP_MS = 1000
+
+
+class StreamState:
+    """State carried between the windows of Algorithm.analyse_stream()"""
+    def __init__(self):
+        # place -> SensorData2 of the samples after the last whole chunk
+        self.carry = {}
+        # Whatever analyse_stream_chunks() of the algorithm carries
+        self.chunks = None
+
+
+def _continue_chunks(carry, sensor_data):
+    """sensor_data led by the carried samples of the previous window, if they are contiguous"""
+    if carry is None or len(carry.ts) == 0 or sensor_data.ts[0] - carry.ts[-1] > STREAM_MAX_GAP_MS:
+        return sensor_data
+    idle = None
+    if carry.idle is not None and sensor_data.idle is not None:
+        idle = numpy.concatenate((carry.idle, sensor_data.idle))
+    return SensorData2(start_ts=carry.start_ts, end_ts=sensor_data.end_ts,
+                       ts=numpy.concatenate((carry.ts, sensor_data.ts)), stream_type=sensor_data.stream_type,
+                       data=numpy.concatenate((carry.data, sensor_data.data)), idle=idle)
+
+
+def _chunk_remainder(sensor_data, chunk_size):
+    """The samples chunked_view() leaves out"""
+    first = len(sensor_data.data) - len(sensor_data.data) % chunk_size
+    return SensorData2(start_ts=sensor_data.ts[first] if first < len(sensor_data.ts) else sensor_data.end_ts,
+                       end_ts=sensor_data.end_ts, ts=sensor_data.ts[first:], stream_type=sensor_data.stream_type,
+                       data=sensor_data.data[first:],
+                       idle=sensor_data.idle[first:] if sensor_data.idle is not None else None)
+
+
 class Algorithm:
     @classmethod
     def is_categorizer(cls):
@@ -66,6 +113,51 @@ class Algorithm:
     def is_for_chunk(cls):
         return cls.__type__ == 'chunk'
 
+    @classmethod
+    def supports_idle_chunks(cls):
+        """
+        Categorizers that define __idle_result__ (the output row of a constant
+        chunk) skip chunks made up only of idle samples
+        """
+        return getattr(cls, '__idle_result__', None) is not None
+
+    @classmethod
+    def analyse_active_chunks(cls, chunked_data, parameters):
+        """
+        Run analyse_data_chunks() on the chunks that are not idle for every place,
+        idle chunks get __idle_result__ without being analysed
+        """
+        idle_masks = [d.idle_chunks() for d in chunked_data.values()]
+        if not cls.supports_idle_chunks() or any(m is None for m in idle_masks):
+            return cls.analyse_data_chunks(cls.chunks_input(chunked_data), parameters=parameters)
+        idle = numpy.logical_and.reduce(idle_masks)
+        if not numpy.any(idle):
+            return cls.analyse_data_chunks(cls.chunks_input(chunked_data), parameters=parameters)
+
+        res = numpy.empty((len(idle), len(cls.__idle_result__)), dtype=numpy.int32)
+        res[idle] = cls.__idle_result__
+        active = ~idle
+        if numpy.any(active):
+            active_data = {place: d.chunk_subset(active) for place, d in chunked_data.items()}
+            res[active] = cls.analyse_data_chunks(cls.chunks_input(active_data), parameters=parameters)
+        return res
+
+    @classmethod
+    def chunks_input(cls, chunked_data):
+        """
+        What analyse_data_chunks() takes: the chunked SensorData2 for
+        categorizers of one place (e.g. 'any'), the {place: chunked} dict for
+        the others
+        """
+        if len(cls.__place__) == 1:
+            return next(iter(chunked_data.values()))
+        return chunked_data
+
+    @classmethod
+    def ts_place(cls, chunked_data):
+        """The place whose chunk timestamps the results get, the first of __place__ that has data"""
+        return next((place for place in cls.__place__ if place in chunked_data), next(iter(chunked_data)))
+
     @classmethod
     def categoriy_ids(cls):
         return cls.__categories__.keys() + [100]
@@ -87,14 +179,62 @@ class Algorithm:
                 print("DATA", d)
                 chunked_d = d.chunked_view(64)
                 chunked_data[place] = chunked_d
-            res = cls.analyse_data_chunks(chunked_data, parameters=parameters)
+            res = intermediates.run([cls], chunked_data, parameters)[0]
             assert res.dtype == numpy.int32, "Type was %s" % str(res.dtype)
-            derived_data.add(DerivedData(derived_type=cls.__output__, data=res, source=d, ts=chunked_data['person/thigh'].ts))
+            derived_data.add(DerivedData(derived_type=cls.__output__, data=res, source=d,
+                                         ts=chunked_data[cls.ts_place(chunked_data)].ts))
             # rint("++ analyzed in %f" % (time.time() - start_t))
             return derived_data
         else:
             assert False, "Not Implemented"
 
+    @classmethod
+    def analyse_stream_chunks(cls, chunked_data, parameters, state):
+        """
+        analyse_active_chunks() within a stream. Categorizers that carry state
+        from chunk to chunk (e.g. a LowpassStream or hyst_crossing_stream()
+        state) override this, state is None for the first window.
+
+        :return: result rows, state for the next window
+        """
+        return intermediates.run([cls], chunked_data, parameters)[0], state
+
+    @classmethod
+    def analyse_stream(cls, data_map, parameters, state=None):
+        """
+        analyse_data() of one window of a continuous stream of windows. The
+        samples after the last whole chunk are carried to the next window and
+        lead its chunks, so consecutive windows give the same chunks as
+        analysing them joined in one call. Like that call, the samples after
+        the last whole chunk of a stream are not analysed.
+
+        :param state: StreamState from the previous window, None to start a stream
+        :return: DerivedData of the chunks completed in this window (None if
+                 none were), StreamState for the next window
+        """
+        if len(data_map) != len(cls.__place__) and len(data_map) != 1:
+            assert False, "Incorrect number of places"
+        assert cls.is_categorizer(), "Not Implemented"
+
+        if not all(sensordata.has_data() for sensordata in data_map.values()):
+            # A gap in any place ends the stream
+            return None, None
+
+        state = state or StreamState()
+        chunked_data = {}
+        for place, sensordata in data_map.items():
+            d = _continue_chunks(state.carry.get(place), sensordata.data[0])
+            state.carry[place] = _chunk_remainder(d, 64)
+            chunked_data[place] = d.chunked_view(64)
+        ts_place = cls.ts_place(chunked_data)
+        if chunked_data[ts_place].chunk_count() == 0:
+            return None, state
+
+        res, state.chunks = cls.analyse_stream_chunks(chunked_data, parameters, state.chunks)
+        assert res.dtype == numpy.int32, "Type was %s" % str(res.dtype)
+        return DerivedData(derived_type=cls.__output__, data=res, source=chunked_data[ts_place],
+                           ts=chunked_data[ts_place].ts), state
+
     class ParametersDefault:
         STANDING_ANGLE_MIN = 0.35
         STANDING_ANGLE_MAX = 0.55
@@ -173,6 +313,8 @@ class SmoothAngle(Algorithm):
     __min__ = -2
     __max__ = 2
 
+    __intermediates__ = ['lowpass_x', 'lowpass_y', 'lowpass_z']
+
     @staticmethod
     def analyse_data_low(sensor_data, idx=0):
         assert(len(sensor_data.data.shape) == 3) # required for 'chunk' type
@@ -190,19 +332,12 @@ class SmoothXYZ(Algorithm):
     __min__ = -2
     __max__ = 2
 
+    __intermediates__ = ['lowpass_x', 'lowpass_y', 'lowpass_z']
+
     @staticmethod
     def analyse_data_low(sensor_data, idx=0):
         assert(len(sensor_data.data.shape) == 3) # required for 'chunk' type
-        x, y, z, _ = get_xyz(sensor_data)
-        chunk_sc = sensor_data.sample_count() / sensor_data.chunk_count()
-        lp = LowpassFilter(12.5, 0.5)
-
-        for i in [x, y, z]:
-            all_view = i.view()
-            all_view.shape = (-1, 1)
-            all_view = np.squeeze(all_view)
-            lp_data = lp.filter(all_view)
-            all_view[:] = lp_data
+        x, y, z = [intermediates.get(sensor_data, i) for i in SmoothXYZ.__intermediates__]
         return np.vstack((x[idx,:].transpose(), y[idx,:].transpose(), z[idx,:].transpose()))
 
 
@@ -214,19 +349,19 @@ class SampleFFT(Algorithm):
     __min__ = 0
     __max__ = 1
 
+    __intermediates__ = ['fft']
+
     @staticmethod
     def analyse_data_low(sensor_data, idx=0):
         assert(len(sensor_data.data.shape) == 3) # required for 'chunk' type
         chunk_sc = sensor_data.sample_count() / sensor_data.chunk_count()
-        x, y, z, _ = get_xyz(sensor_data)
-        x_fft = np.fft.rfft(x, axis=OVER_SAMPLES)
-        y_fft = np.fft.rfft(y, axis=OVER_SAMPLES)
-        z_fft = np.fft.rfft(z, axis=OVER_SAMPLES)
-        x_fft[idx,0] = 0
-        y_fft[idx,0] = 0
-        z_fft[idx,0] = 0
-        l_fft = np.sqrt( np.sum(np.absolute(i)*np.absolute(i) for i in [x_fft, y_fft, z_fft]) )
-        return np.absolute(np.vstack((x_fft[idx,:].transpose(), y_fft[idx,:].transpose(), z_fft[idx,:].transpose(), l_fft[idx,:].transpose())))/chunk_sc
+        # The spectra are shared, zero the DC of copies of the chunk
+        x_fft, y_fft, z_fft = [f[idx,:].copy() for f in intermediates.get(sensor_data, 'fft')]
+        x_fft[0] = 0
+        y_fft[0] = 0
+        z_fft[0] = 0
+        l_fft = np.sqrt( sum(np.absolute(i)*np.absolute(i) for i in [x_fft, y_fft, z_fft]) )
+        return np.absolute(np.vstack((x_fft.transpose(), y_fft.transpose(), z_fft.transpose(), l_fft.transpose())))/chunk_sc
 
 
 class ActivityT1(Algorithm):
@@ -261,17 +396,14 @@ class Transition(Algorithm):
     __min__ = -5
     __max__ = 5
 
+    __intermediates__ = ['lowpass_x']
+
     @staticmethod
     def analyse_data_low(sensor_data):
         assert(len(sensor_data.data.shape) == 3) # required for 'chunk' type
-        x, y, z, _ = get_xyz(sensor_data)
-        lp = LowpassFilter(12.5, 0.5)
         chunk_sc = sensor_data.sample_count() / sensor_data.chunk_count()
 
-        x_all = x.view()
-        x_all.shape = (-1, 1)
-        x_lp = lp.filter(np.squeeze(x_all))
-        x_all[:] = 0
+        x_lp = intermediates.get(sensor_data, 'lowpass_x').reshape(-1)
         #up_idx, down_idx = crossing(np.arcsin(-x_lp), 0.4)
         up_idx, down_idx = hyst_crossing(-x_lp, numpy.sin(0.35), numpy.sin(0.55))
         up = np.zeros((sensor_data.chunk_count(),1))
@@ -383,36 +515,46 @@ class FreqPeakFilt(Algorithm):
         return np.linspace(0.2, 1.8, FreqPeakFilt.N)
 
     @staticmethod
-    def calc_response(freqs, chunk, meta=None):
-
-        search_freqs = FreqPeakFilt.get_search_freqs(meta)
-        r = np.zeros(FreqPeakFilt.N)
-        chunk = np.squeeze(chunk)
-        for j, f in enumerate(search_freqs):
-            r[j] = np.dot(np.interp(f * FreqPeakFilt.MULTS, freqs, chunk),
-                          FreqPeakFilt.SIGNS)
-
-        return r
+    def interp_matrix(points, freqs):
+        """W with W.dot(values) == np.interp(points, freqs, values) for any values on the increasing grid freqs"""
+        idx = np.clip(np.searchsorted(freqs, points, side='right') - 1, 0, len(freqs) - 2)
+        frac = np.clip((points - freqs[idx]) / (freqs[idx + 1] - freqs[idx]), 0.0, 1.0)
+        rows = np.arange(len(points))
+        W = np.zeros((len(points), len(freqs)))
+        W[rows, idx] = 1.0 - frac
+        W[rows, idx + 1] += frac
+        return W
 
     @staticmethod
-    def analyse_data_low(sensor_data, meta=None):
-        x, y, z, _ = get_xyz(sensor_data)
-        param = Algorithm.get_parameters(meta)
+    def response_matrices(freqs, meta=None):
+        """
+        The interpolation at the harmonics of every search frequency as linear
+        operators on a chunk spectrum. The FFT bins only depend on the chunk
+        size and sample interval, so they are built once per bin grid and
+        search frequencies (see _response_matrices()).
+
+        :return: response [N, bins], response.dot(spectrum) is calc_response(),
+                 amplitude [N, 4, bins], amplitude[j].dot(spectrum) the spectrum
+                 at the even MULTS of search frequency j
+        """
+        search_freqs = np.asarray(FreqPeakFilt.get_search_freqs(meta), dtype=np.float64)
+        return _response_matrices(np.asarray(freqs, dtype=np.float64).tobytes(), search_freqs.tobytes())
 
-        chunk_sc = sensor_data.sample_count() / sensor_data.chunk_count()
+    @staticmethod
+    def calc_response(freqs, chunk, meta=None):
+        response, _ = FreqPeakFilt.response_matrices(freqs, meta)
+        return response.dot(np.squeeze(chunk))
 
-        freqs = rfftfreq(chunk_sc, float(sensor_data.sample_interval) / 1000.0)
-        x_fft = np.fft.rfft(x, axis=OVER_SAMPLES)
-        y_fft = np.fft.rfft(y, axis=OVER_SAMPLES)
-        z_fft = np.fft.rfft(z, axis=OVER_SAMPLES)
-        yz_fft_abs = np.sqrt(np.sum(np.absolute(i)**2
-                             for i in [x_fft, y_fft, z_fft]))/chunk_sc
+    __intermediates__ = ['fft_freqs', 'fft_abs']
 
-        resp = np.zeros((yz_fft_abs.shape[0], FreqPeakFilt.N))
-        for i, chunk in enumerate(yz_fft_abs):
-            resp[i,:] = FreqPeakFilt.calc_response(freqs, chunk, meta)
+    @staticmethod
+    def analyse_data_low(sensor_data, meta=None):
+        freqs = intermediates.get(sensor_data, 'fft_freqs')
+        yz_fft_abs = intermediates.get(sensor_data, 'fft_abs')
 
-        return resp
+        # calc_response() of every chunk in one product
+        response, _ = FreqPeakFilt.response_matrices(freqs, meta)
+        return yz_fft_abs.reshape(yz_fft_abs.shape[0], -1).dot(response.T)
 
 
 class FreqPeaks(Algorithm):
@@ -423,45 +565,45 @@ class FreqPeaks(Algorithm):
     __min__ = 0
     __max__ = 2.0
 
+    __intermediates__ = ['fft_freqs', 'fft_abs']
+
     @staticmethod
     def analyse_data_low(sensor_data, meta=None):
         AMP_CUTOFF = 0.05
 
-        x, y, z, _ = get_xyz(sensor_data)
-        param = Algorithm.get_parameters(meta)
-
-        chunk_sc = sensor_data.sample_count() / sensor_data.chunk_count()
-
-        freqs = rfftfreq(chunk_sc, float(sensor_data.sample_interval) / 1000.0)
-        x_fft = np.fft.rfft(x, axis=OVER_SAMPLES)
-        y_fft = np.fft.rfft(y, axis=OVER_SAMPLES)
-        z_fft = np.fft.rfft(z, axis=OVER_SAMPLES)
-        yz_fft_abs = np.sqrt(np.sum(np.absolute(i)**2
-                             for i in [x_fft, y_fft, z_fft]))/chunk_sc
-
-        resp = np.zeros(yz_fft_abs.shape[0])
-        order1 = np.zeros(yz_fft_abs.shape[0])
-        amp = np.zeros(yz_fft_abs.shape[0])
-        factor = np.zeros(yz_fft_abs.shape[0])
+        freqs = intermediates.get(sensor_data, 'fft_freqs')
+        yz_fft_abs = intermediates.get(sensor_data, 'fft_abs')
 
         search_freqs = FreqPeakFilt.get_search_freqs(meta)
 
-        for i, chunk in enumerate(np.squeeze(yz_fft_abs)):
-            r = FreqPeakFilt.calc_response(freqs, chunk)
-            max_idx = np.argmax(r)
-            resp[i] = r[max_idx]
-            order1[i] = search_freqs[max_idx]
-            fa = np.interp(order1[i] * FreqPeakFilt.MULTS[::2], freqs, chunk)
-            amp[i] = np.max(fa)
-            if amp[i] > AMP_CUTOFF:
-                factor[i] = np.sum(fa[1:3]) / fa[0]
-            else:
-                factor[i] = 0
-                order1[i] = 0
+        # Response of every chunk, then the amplitudes at the harmonics of each chunk's peak
+        spectra = yz_fft_abs.reshape(yz_fft_abs.shape[0], -1)
+        response, amplitude = FreqPeakFilt.response_matrices(freqs, meta)
+        r = spectra.dot(response.T)
+        max_idx = np.argmax(r, axis=1)
+        resp = r[np.arange(len(max_idx)), max_idx]
+        order1 = search_freqs[max_idx]
+        fa = np.einsum('cmf,cf->cm', amplitude[max_idx], spectra)
+        amp = np.max(fa, axis=1)
+
+        strong = amp > AMP_CUTOFF
+        factor = np.zeros(len(amp))
+        factor[strong] = np.sum(fa[strong, 1:3], axis=1) / fa[strong, 0]
+        order1[~strong] = 0
 
         return np.vstack((amp, resp, factor / 5.0, order1))
 
 
+@lru_cache(maxsize=16)
+def _response_matrices(freqs, search_freqs):
+    """FreqPeakFilt.response_matrices() of the float64 bytes of the FFT bins and search frequencies"""
+    freqs = np.frombuffer(freqs, dtype=np.float64)
+    search_freqs = np.frombuffer(search_freqs, dtype=np.float64)
+    W = FreqPeakFilt.interp_matrix(np.outer(search_freqs, FreqPeakFilt.MULTS).ravel(), freqs)
+    W = W.reshape(len(search_freqs), len(FreqPeakFilt.MULTS), len(freqs))
+    return np.einsum('m,jmf->jf', FreqPeakFilt.SIGNS, W), W[:, ::2, :].copy()
+
+
 Algorithms.attach(ActivityAngle)
 Algorithms.attach(ActivityFFT)
 Algorithms.attach(Transition)
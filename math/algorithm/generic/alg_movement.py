@@ -2,7 +2,8 @@ from math.algorithm.algorithms import Algorithm
 
 import numpy
 
-from math.algorithm.utils import get_xyz, OVER_SAMPLES
+from math.algorithm import intermediates
+from math.algorithm.utils import OVER_SAMPLES
 
 
 class ActivityMovement(Algorithm):
@@ -13,11 +14,13 @@ class ActivityMovement(Algorithm):
     __place__ = ['any']
     __input__ = ['acc/3ax/4g']
     __output__ = ['general/data/time', 'peakl/count']
+    __idle_result__ = [1, 0]  # Constant chunk, data present without movement
+    __intermediates__ = ['xyz']
 
     @classmethod
     def analyse_data_chunks(cls, sensor_data, parameters):
         assert(len(sensor_data.data.shape) == 3) # required for 'chunk' type
-        x, y, z, _ = get_xyz(sensor_data)
+        x, y, z, _ = intermediates.get(sensor_data, 'xyz')
         # todo: force chunk
         l = x*x + y*y + z*z
         lsum = numpy.zeros((sensor_data.chunk_count(),1))
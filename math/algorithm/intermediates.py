@@ -0,0 +1,157 @@
+import numpy as np
+from contextlib import contextmanager
+from math.algorithm.lowpass_filter import LowpassFilter
+from math.algorithm.utils import get_xyz, OVER_SAMPLES
+
+###############################################################
+##
+## Intermediate results (xyz views, chunk spectra, low-passed
+## axes) computed once per data window and shared by every
+## algorithm run on it. Producers name what they require, so
+## the intermediates form a DAG resolved on first use.
+##
+## Intermediates are only kept within run() or shared(), an
+## algorithm called on its own computes what it needs and
+## nothing outlives the call.
+##
+###############################################################
+
+_producers = {}
+_RESOLVING = object()
+
+
+def intermediate(name, *requires):
+    """Registers fn(sensor_data, *required values) as the producer of name"""
+    def register(fn):
+        _producers[name] = (fn, requires)
+        return fn
+    return register
+
+
+def get(sensor_data, name):
+    """
+    Intermediate name of sensor_data, computed with what it requires the first
+    time it is asked for. Shared between algorithms, so read only.
+    """
+    values = sensor_data.intermediates()
+    return _resolve(sensor_data, {} if values is None else values, name)
+
+
+def _resolve(sensor_data, values, name):
+    value = values.get(name)
+    if value is _RESOLVING:
+        raise ValueError("Intermediate %s requires itself" % name)
+    if value is None:
+        fn, requires = _producers[name]
+        values[name] = _RESOLVING
+        try:
+            value = fn(sensor_data, *[_resolve(sensor_data, values, r) for r in requires])
+        finally:
+            del values[name]
+        values[name] = value
+    return value
+
+
+def requirements(names):
+    """names and everything they require, in dependency order"""
+    order = []
+
+    def visit(name):
+        if name not in order:
+            for r in _producers[name][1]:
+                visit(r)
+            order.append(name)
+    for name in names:
+        visit(name)
+    return order
+
+
+@contextmanager
+def shared(*windows):
+    """Intermediates of the windows (SensorData2) are kept within the block and released after"""
+    started = [w for w in windows if w.intermediates() is None]
+    for w in started:
+        w.share_intermediates(True)
+    try:
+        yield
+    finally:
+        for w in started:
+            w.share_intermediates(False)
+
+
+def run(algorithms, window, *args):
+    """
+    Every algorithm on one data window: analyse_data_low(window, *args), or for
+    categorizers analyse_active_chunks(window, *args) with window the
+    {place: chunked SensorData2} of analyse_data(). The intermediates the
+    algorithms declare (__intermediates__) are computed once, released after
+    the last algorithm that needs them, and all are released on return.
+
+    :return: list of the results, in the order of algorithms
+    """
+    windows = list(window.values()) if isinstance(window, dict) else [window]
+    needs = [set(requirements(getattr(alg, '__intermediates__', []))) for alg in algorithms]
+    results = []
+    with shared(*windows):
+        for i, alg in enumerate(algorithms):
+            if alg.is_categorizer():
+                results.append(alg.analyse_active_chunks(window, *args))
+            else:
+                results.append(alg.analyse_data_low(window, *args))
+            still_needed = set().union(*needs[i + 1:])
+            for w in windows:
+                for name in needs[i] - still_needed:
+                    w.intermediates().pop(name, None)
+    return results
+
+
+@intermediate('xyz')
+def _xyz(sensor_data):
+    return get_xyz(sensor_data)
+
+
+@intermediate('chunk_samples')
+def _chunk_samples(sensor_data):
+    return int(sensor_data.sample_count() / sensor_data.chunk_count())
+
+
+@intermediate('sample_interval', 'chunk_samples')
+def _sample_interval(sensor_data, chunk_sc):
+    """Sample interval (ms) from the timestamps, ts of a chunked view are per chunk"""
+    ts = np.asarray(sensor_data.ts, dtype=np.float64)
+    if len(ts) > 1:
+        interval = np.median(np.diff(ts)) / (chunk_sc if sensor_data.is_chunked else 1)
+    else:
+        interval = float(sensor_data.end_ts - sensor_data.start_ts) / sensor_data.sample_count()
+    # Rounded so clock jitter does not make a new FFT bin grid per window
+    return round(interval, 2)
+
+
+@intermediate('fft_freqs', 'chunk_samples', 'sample_interval')
+def _fft_freqs(sensor_data, chunk_sc, interval):
+    """Frequencies (Hz) of the bins of 'fft'"""
+    return np.fft.rfftfreq(chunk_sc, interval / 1000.0)
+
+
+@intermediate('fft', 'xyz')
+def _fft(sensor_data, xyz):
+    """rfft() of every chunk of x, y and z"""
+    return tuple(np.fft.rfft(a, axis=OVER_SAMPLES) for a in xyz[:3])
+
+
+@intermediate('fft_abs', 'fft', 'chunk_samples')
+def _fft_abs(sensor_data, fft, chunk_sc):
+    """Magnitude of the x, y, z spectrum of every chunk, scaled by the chunk size"""
+    return np.sqrt(sum(np.absolute(i)**2 for i in fft))/chunk_sc
+
+
+def _lowpass(axis):
+    def lowpass(sensor_data, xyz):
+        # Shape of the get_xyz() axis, filtered over the chunks as one signal
+        a = xyz[axis]
+        return LowpassFilter(12.5, 0.5).filter(a.reshape(-1)).reshape(a.shape)
+    return lowpass
+
+
+for _axis, _name in enumerate(['lowpass_x', 'lowpass_y', 'lowpass_z']):
+    intermediate(_name, 'xyz')(_lowpass(_axis))
@@ -1,5 +1,6 @@
 import numpy as np
 import scipy.signal as sig
+from math.filter.fir import fir_filter, kaiser_lowpass
 
 
 class LowpassFilter:
@@ -10,23 +11,74 @@ class LowpassFilter:
         width = 1.0 / nyq_freq
         cutoff_freq = cutoff_hz
 
-        # Generate Filter
-        n, beta = sig.kaiserord(ripple_db, width)
-        taps = sig.firwin(n, cutoff_freq / nyq_freq, window=('kaiser', beta))
+        # Generate Filter (shared by filters with the same parameters)
+        taps = kaiser_lowpass(ripple_db, width, cutoff_freq / nyq_freq)
 
         self.taps = taps
         self.ltaps = len(self.taps)
         self.ltapsh = int(np.floor(len(self.taps) / 2))
 
     def filter(self, data, axis=-1):
+        """Filters along axis, [axes, samples] data is filtered in one pass"""
         data = np.atleast_2d(data)
         tapshl = self.ltaps // 2 + 1
         padding = [(0, 0)] * data.ndim
         padding[axis] = (tapshl, tapshl)
 
-        us_data = data.copy()
-        s_data = np.pad(us_data, padding, 'symmetric')
-        us_data = sig.lfilter(self.taps, 1.0, s_data, axis=axis)
+        s_data = np.pad(data, padding, 'symmetric')
+        us_data = fir_filter(self.taps, s_data, axis=axis)
 
         idxs = np.arange(2 * tapshl, us_data.shape[axis])
         return np.squeeze(us_data.take(idxs, axis=axis))
+
+
+class LowpassStream:
+    """
+    LowpassFilter.filter() of consecutive windows of a signal ([samples] or
+    [axes, samples]), carrying the lfilter() state between them. The output
+    equals filtering the joined windows in one call: push() returns what is
+    complete so far (it lags the input by ltaps // 2 + 1 samples) and finish()
+    the rest, with the same symmetric padding at both ends of the stream.
+    """
+
+    def __init__(self, lowpass):
+        self.lowpass = lowpass
+        self.tapshl = lowpass.ltaps // 2 + 1
+        self.zi = None
+        self.head = None  # Input until tapshl samples are there to mirror at the start
+        self.tail = None  # Last tapshl samples, mirrored at the end
+        self.skip = 2 * self.tapshl
+        self.ndim = None
+
+    def _run(self, data):
+        out, self.zi = sig.lfilter(self.lowpass.taps, 1.0, data, axis=-1, zi=self.zi)
+        skip = min(self.skip, out.shape[-1])
+        self.skip -= skip
+        return out[:, skip:]
+
+    def _out(self, out):
+        return out[0] if self.ndim == 1 else out
+
+    def push(self, data):
+        data = np.asarray(data)
+        self.ndim = data.ndim
+        data = np.atleast_2d(data)
+        if self.zi is None:
+            self.head = data if self.head is None else np.concatenate((self.head, data), axis=-1)
+            if self.head.shape[-1] < self.tapshl:
+                return self._out(self.head[:, :0].astype(np.float64))
+            data = self.head
+            self.head = None
+            self.zi = np.zeros((data.shape[0], self.lowpass.ltaps - 1))
+            self.tail = data[:, -self.tapshl:]
+            return self._out(self._run(np.concatenate((data[:, self.tapshl - 1::-1], data), axis=-1)))
+        self.tail = np.concatenate((self.tail, data), axis=-1)[:, -self.tapshl:]
+        return self._out(self._run(data))
+
+    def finish(self):
+        if self.zi is None:
+            # Shorter than the padding, mirror it like filter() does
+            if self.head is None:
+                return None
+            return self._out(self.lowpass.filter(self.head).reshape(self.head.shape))
+        return self._out(self._run(self.tail[:, ::-1]))
@@ -6,17 +6,18 @@ OVER_SAMPLES = 1
 
 
 def get_xyz(sensor_data):
-    data = sensor_data.samples()
-    last_axis = len(data.shape) - 1
-    x = data.take([0], axis=last_axis)
-    y = data.take([1], axis=last_axis)
-    z = data.take([2], axis=last_axis)
-    try:
-        valid = data.take([3], axis=last_axis)
-    except:
-        valid = numpy.ones(x.shape)
-    valid_bool = (valid==False)
-    x[valid_bool] = 0
-    y[valid_bool] = 0
-    z[valid_bool] = 0
+    """
+    x, y, z as [..., 1] views of the scaled samples (see SensorData2.axis_samples()),
+    read only. valid is the optional 4th axis, samples where it is 0 are zeroed
+    (then x, y, z are copies).
+    """
+    data = sensor_data.data
+    x = sensor_data.axis_samples(0)
+    y = sensor_data.axis_samples(1)
+    z = sensor_data.axis_samples(2)
+    if data.shape[-1] < 4:
+        return x, y, z, numpy.broadcast_to(numpy.ones(1, dtype=x.dtype), x.shape)
+    valid = sensor_data.axis_samples(3)
+    invalid = (valid == False)
+    x, y, z = [numpy.where(invalid, 0, a).astype(a.dtype) for a in (x, y, z)]
     return x, y, z, valid
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+import numpy
+
+TX_MS = 10.0  # Nominal length of a sensor tick
+MAX_DRIFT = 0.01  # Segments deviating more from TX_MS are sync noise, not drift
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class ClockModel(object):
+    """
+    Piecewise linear mapping from sensor timestamp_tx to unix ms, built from
+    the time syncs of a session
+
+    Between two syncs the tick length is fitted to both, so drift is spread
+    over the segment. Before the first and after the last sync, and across
+    segments too short to measure the drift reliably, the nominal tick length
+    is used from the preceding sync, like TimeSync.tx_to_utc(). Such a segment
+    is clamped to the time of the next sync, and sync times are made non
+    decreasing, so the mapping never goes back in time.
+    """
+
+    def __init__(self, sync_tx, sync_ms):
+        order = numpy.argsort(sync_tx, kind='stable')
+        self.sync_tx = numpy.asarray(sync_tx, dtype=numpy.int64)[order]
+        self.sync_ms = numpy.maximum.accumulate(numpy.asarray(sync_ms, dtype=numpy.float64)[order])
+        assert len(self.sync_tx) > 0, "ClockModel needs at least one time sync"
+
+        span_tx = numpy.diff(self.sync_tx).astype(numpy.float64)
+        span_ms = numpy.diff(self.sync_ms)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            slope = span_ms / span_tx
+        slope[~(numpy.abs(slope - TX_MS) <= TX_MS * MAX_DRIFT)] = TX_MS
+        self.slope = numpy.append(slope, TX_MS)
+        # End of each segment, where the next one starts
+        self.end_tx = numpy.append(self.sync_tx[1:], numpy.inf)
+        self.end_ms = numpy.append(self.sync_ms[1:], numpy.inf)
+
+    @classmethod
+    def from_timesyncs(cls, timesyncs):
+        return cls([ts.timestamp_tx for ts in timesyncs],
+                   [(ts.server_time - EPOCH).total_seconds() * 1000 for ts in timesyncs])
+
+    def __len__(self):
+        return len(self.sync_tx)
+
+    def tx_to_ms(self, tx):
+        """
+        :param tx: timestamp_tx, scalar or array
+        :return: numpy float64 unix ms, same shape as tx
+        """
+        tx = numpy.asarray(tx, dtype=numpy.float64)
+        seg = numpy.searchsorted(self.sync_tx, tx, side='right') - 1
+        before = seg < 0
+        seg = numpy.maximum(seg, 0)
+        slope = numpy.where(before, TX_MS, self.slope[seg])
+        end = numpy.where(before, self.sync_ms[0], self.end_ms[seg])
+        return numpy.minimum(self.sync_ms[seg] + (tx - self.sync_tx[seg]) * slope, end)
+
+    def tx_to_utc(self, tx):
+        """Scalar version of tx_to_ms(), returns a datetime"""
+        return EPOCH + timedelta(milliseconds=float(self.tx_to_ms(tx)))
+
+    def ms_to_tx(self, ms):
+        """
+        Inverse of tx_to_ms()
+
+        :param ms: unix ms, scalar or array
+        :return: numpy float64 timestamp_tx
+        """
+        ms = numpy.asarray(ms, dtype=numpy.float64)
+        seg = numpy.searchsorted(self.sync_ms, ms, side='right') - 1
+        before = seg < 0
+        seg = numpy.maximum(seg, 0)
+        slope = numpy.where(before, TX_MS, self.slope[seg])
+        end = numpy.where(before, self.sync_tx[0], self.end_tx[seg])
+        return numpy.minimum(self.sync_tx[seg] + (ms - self.sync_ms[seg]) / slope, end)
+
+    def utc_to_tx(self, dt):
+        return float(self.ms_to_tx((dt - EPOCH).total_seconds() * 1000))
+
+    def sample_ms(self, anchor_sample, anchor_tx, first, last):
+        """
+        Timestamps of samples [first, last), interpolating timestamp_tx between
+        anchors (e.g. the 0xFE frames of a frame index)
+
+        :param anchor_sample: sample position of each anchor, increasing
+        :param anchor_tx: timestamp_tx at each anchor
+        :return: numpy int64 unix ms [last - first]
+        """
+        anchor_tx = numpy.asarray(anchor_tx, dtype=numpy.float64)
+        ms = numpy.interp(numpy.arange(first, last, dtype=numpy.float64), anchor_sample, anchor_tx)
+        if len(anchor_tx) > 1 and numpy.any(numpy.diff(anchor_tx) < 0):
+            return self.tx_to_ms(ms).astype(numpy.int64)
+        # tx is increasing, so convert each clock segment in place instead of gathering per sample parameters
+        bounds = numpy.concatenate(([0], numpy.searchsorted(ms, self.sync_tx[1:], side='left'), [len(ms)]))
+        for k in range(len(self.sync_tx)):
+            part = ms[bounds[k]:bounds[k + 1]]
+            part -= self.sync_tx[k]
+            # Before the first sync the nominal tick is used
+            before = int(numpy.searchsorted(part, 0, side='left')) if k == 0 else 0
+            part[:before] *= TX_MS
+            part[before:] *= self.slope[k]
+            part += self.sync_ms[k]
+            numpy.minimum(part, self.end_ms[k], out=part)
+        return ms.astype(numpy.int64)
+
+    def ms_to_sample(self, anchor_sample, anchor_tx, ms):
+        """Inverse of sample_ms(), fractional sample position of unix ms"""
+        return numpy.interp(self.ms_to_tx(ms), numpy.asarray(anchor_tx, dtype=numpy.float64), anchor_sample)
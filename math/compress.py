@@ -1,5 +1,6 @@
 import numpy
 import struct
+from math.pack import DataFormatError
 
 CNT11 = 0
 CNT10 = 0
@@ -12,6 +13,7 @@ IDLE_WINDOW = 8
 
 # pack an x-width value into an integer
 def packval(val, offset, width):
+    val = int(val)
     # Max is width
     limit = 2**(width-1)
     #print("Max", limit)
@@ -29,7 +31,7 @@ def packuval(val, offset, width):
     # Max is width
     limit = 2**(width)
     #print("Max", limit)
-    assert((val < limt) and (val >= 0))
+    assert((val < limit) and (val >= 0))
     #print("%02X, %02X" % (signbits, valbits))
     return (val << offset)
 
@@ -80,7 +82,7 @@ def packvals(xyz, width):
 def tobytes(val, width_bytes):
     d = bytearray([])
     while width_bytes != 0:
-        d = bytearray([chr(val & 0xFF)]) + d
+        d = bytearray([val & 0xFF]) + d
         val = val >> 8
         width_bytes -= 1
     assert(val == 0)
@@ -249,7 +251,7 @@ def decompress(data):
     i = 0
     j = 0
     ref = numpy.array([0,0,0], dtype=numpy.int16)
-    res = numpy.zeros([1000000,3], dtype=numpy.int16)
+    res = numpy.zeros([decompressed_size(data),3], dtype=numpy.int16)
     while i < len(data):
         d = data[i]
         # Check frame
@@ -307,3 +309,615 @@ def decompress(data):
             pass
     return res[:j, :]
 
+
+
+###############################################################
+##
+## Vectorized decoder
+##
+###############################################################
+
+FRAME_B5 = 0
+FRAME_B10 = 1
+FRAME_B7 = 2
+FRAME_BI1 = 3
+FRAME_BI2 = 4
+FRAME_B11 = 5
+FRAME_IGNORE = 6
+FRAME_FILL = 7
+FRAME_INVALID = 8
+
+
+def _frame_kind(d):
+    # Same header classification as decompress()
+    if (0x80 & d) == 0:
+        return FRAME_B5, 2
+    elif (0x40 & d) == 0:
+        return FRAME_B10, 4
+    elif (0x20 & d) == 0:
+        return FRAME_B7, 3
+    elif (0x10 & d) == 0:
+        return FRAME_BI1, 1
+    elif (0x08 & d) == 0:
+        return FRAME_BI2, 2
+    elif (0x02 & d) == 0:
+        return FRAME_B11, 5
+    elif (0x01 & d) == 0:
+        return FRAME_IGNORE, 2  # + L bytes
+    elif d == 0xFF:
+        return FRAME_FILL, 1
+    else:
+        return FRAME_INVALID, 1
+
+
+FRAME_KIND = numpy.array([_frame_kind(d)[0] for d in range(256)], dtype=numpy.int8)
+FRAME_LEN = numpy.array([_frame_kind(d)[1] for d in range(256)], dtype=numpy.int64)
+
+# Payload width per frame kind, 0 for frames without xyz values
+FRAME_WIDTH = numpy.array([5, 10, 7, 0, 0, 11, 0, 0, 0], dtype=numpy.int64)
+
+
+def frame_starts(data):
+    """
+    Locate the byte offset of every frame in a compressed record
+
+    Frame lengths are looked up for every byte position at once, and the chain of
+    frames starting at offset 0 is then followed with pointer doubling, so no
+    python code runs per frame.
+
+    :param data: compressed bytes
+    :return: (buf, starts, kinds), buf is the data as uint8 padded with 8 zero bytes
+    """
+    n = len(data)
+    buf = numpy.zeros(n + 8, dtype=numpy.uint8)
+    buf[:n] = numpy.frombuffer(bytes(data), dtype=numpy.uint8)
+    if n == 0:
+        return buf, numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int8)
+
+    header = buf[:n]
+    step = FRAME_LEN[header]
+    ignore = FRAME_KIND[header] == FRAME_IGNORE
+    step[ignore] += buf[1:n + 1][ignore]
+
+    # jump[i] is the start of the frame following a frame starting at i, n is the end
+    jump = numpy.empty(n + 1, dtype=numpy.int64)
+    jump[:n] = numpy.minimum(numpy.arange(n, dtype=numpy.int64) + step, n)
+    jump[n] = n
+
+    starts = numpy.zeros(1, dtype=numpy.int64)
+    while True:
+        following = jump[starts]
+        starts = numpy.concatenate((starts, following))
+        if following[-1] == n:
+            break
+        jump = jump[jump]
+    starts = starts[starts < n]
+
+    kinds = FRAME_KIND[buf[starts]]
+    if numpy.any(kinds == FRAME_INVALID):
+        bad = starts[numpy.argmax(kinds == FRAME_INVALID)]
+        raise DataFormatError("Unexpected frame %02X at %d" % (buf[bad], bad))
+    return buf, starts, kinds
+
+
+def _frame_words(buf, starts, nbytes, end):
+    # Big-endian word of each frame, truncated frames at the end of the data are
+    # read as if left padded with zeros, like unpackval()/unpackvals() does
+    nbytes = numpy.minimum(nbytes, end - starts)
+    words = numpy.zeros(len(starts), dtype=numpy.uint64)
+    for k in range(int(numpy.max(nbytes, initial=0))):
+        has = nbytes > k
+        words[has] = (words[has] << numpy.uint64(8)) | buf[starts[has] + k].astype(numpy.uint64)
+    return words
+
+
+def _signed_field(words, offset, width):
+    field = ((words >> numpy.uint64(offset)) & numpy.uint64((1 << width) - 1)).astype(numpy.int64)
+    return field - ((field & (1 << (width - 1))) << 1)
+
+
+def _frame_counts(kinds, words):
+    counts = (FRAME_WIDTH[kinds] > 0).astype(numpy.int64)
+    bi1 = kinds == FRAME_BI1
+    counts[bi1] = (words[bi1] & numpy.uint64(0x0F)).astype(numpy.int64) + 6
+    bi2 = kinds == FRAME_BI2
+    counts[bi2] = (words[bi2] & numpy.uint64(0x7FF)).astype(numpy.int64) + 1
+    return counts
+
+
+def _decode_frames(data, ref=None):
+    buf, starts, kinds = frame_starts(data)
+    n = len(data)
+
+    widths = FRAME_WIDTH[kinds]
+    nbytes = FRAME_LEN[buf[starts]]
+    words = _frame_words(buf, starts, nbytes, n)
+
+    counts = _frame_counts(kinds, words)
+
+    values = numpy.zeros((len(starts), 3), dtype=numpy.int64)
+    for width in (5, 7, 10, 11):
+        sel = widths == width
+        if numpy.any(sel):
+            w = words[sel]
+            values[sel, 0] = _signed_field(w, width * 2, width)
+            values[sel, 1] = _signed_field(w, width, width)
+            values[sel, 2] = _signed_field(w, 0, width)
+
+    # Running sum of the deltas, restarted at every absolute B11 frame
+    absolute = kinds == FRAME_B11
+    deltas = values.copy()
+    deltas[absolute] = 0
+    running = numpy.cumsum(deltas, axis=0)
+    last_abs = numpy.maximum.accumulate(numpy.where(absolute, numpy.arange(len(starts)), -1))
+    has_abs = last_abs >= 0
+    anchor = last_abs[has_abs]
+    frame_ref = running
+    frame_ref[has_abs] += values[anchor] - running[anchor]
+    if ref is not None:
+        frame_ref[~has_abs] += numpy.asarray(ref, dtype=numpy.int64)
+    return buf, starts, kinds, frame_ref, counts
+
+
+def decompress_frames(data, ref=None):
+    """
+    Decode a compressed record into one reference value per frame
+
+    :param data: compressed bytes
+    :param ref: value to continue from when data does not start with a B11 frame
+    :return: (ref, counts), ref is int64 [frames, 3] holding the value after each
+             frame and counts the number of samples each frame produces
+    """
+    _, _, _, frame_ref, counts = _decode_frames(data, ref)
+    return frame_ref, counts
+
+
+def decompress_fast(data, ref=None):
+    """
+    Vectorized version of decompress(), returns exactly the same samples
+
+    :param data: compressed bytes
+    :param ref: value preceding data, when decoding a slice of a record
+    :return: numpy int16 [samples, 3]
+    """
+    ref, counts = decompress_frames(data, ref)
+    return numpy.repeat(ref, counts, axis=0).astype(numpy.int16)
+
+
+def frame_sample_counts(data):
+    """
+    Number of samples produced by each frame, without decoding the values
+
+    :param data: compressed bytes
+    :return: numpy int64 [frames]
+    """
+    buf, starts, kinds = frame_starts(data)
+    words = _frame_words(buf, starts, FRAME_LEN[buf[starts]], len(data))
+    return _frame_counts(kinds, words)
+
+
+def idle_mask(data, index=None, first_sample=0, last_sample=None):
+    """
+    Flag the samples that come from idle frames, read from the frame table
+    without decoding any values
+
+    Idle samples repeat the previous value exactly, so any span of them is
+    constant in the decoded data.
+
+    :param index: optional frame index, only the frames around the range are read
+    :return: numpy bool [samples] for samples [first_sample, last_sample)
+    """
+    base = 0
+    if index is not None:
+        index = load_index(index)
+        samples = index['sample']
+        last = int(samples[-1]) if last_sample is None else min(int(samples[-1]), last_sample)
+        k = max(0, int(numpy.searchsorted(samples[:-1], first_sample, side='right')) - 1)
+        j = min(len(index) - 1, int(numpy.searchsorted(samples, last, side='left')))
+        data = data[int(index['offset'][k]):int(index['offset'][j])]
+        base = int(samples[k])
+        last_sample = last
+    buf, starts, kinds = frame_starts(data)
+    counts = _frame_counts(kinds, _frame_words(buf, starts, FRAME_LEN[buf[starts]], len(data)))
+    idle = (kinds == FRAME_BI1) | (kinds == FRAME_BI2)
+    mask = numpy.repeat(idle, counts)
+    return mask[max(0, first_sample - base):None if last_sample is None else last_sample - base]
+
+
+# Sample range [first, last) of a record decoded from idle frames
+IDLE_RUN_DTYPE = numpy.dtype([('first', '<i8'), ('last', '<i8')])
+
+
+def load_idle_runs(runs):
+    """Returns runs (bytes or array) as an IDLE_RUN_DTYPE array"""
+    if isinstance(runs, numpy.ndarray):
+        return runs
+    return numpy.frombuffer(bytes(runs), dtype=IDLE_RUN_DTYPE)
+
+
+def idle_runs(data, sample=0):
+    """
+    Sample ranges of the idle frames of data, adjacent idle frames form one run
+
+    :param sample: samples decoded before data, when data is appended to a record
+    :return: IDLE_RUN_DTYPE array
+    """
+    buf, starts, kinds = frame_starts(data)
+    counts = _frame_counts(kinds, _frame_words(buf, starts, FRAME_LEN[buf[starts]], len(data)))
+    idle = ((kinds == FRAME_BI1) | (kinds == FRAME_BI2)) & (counts > 0)
+    ends = numpy.cumsum(counts)[idle] + sample
+    firsts = ends - counts[idle]
+    # Frames that do not continue the run of the previous idle frame start a run
+    starts_run = numpy.ones(len(ends), dtype=bool)
+    starts_run[1:] = firsts[1:] != ends[:-1]
+    ends_run = numpy.ones(len(ends), dtype=bool)
+    ends_run[:-1] = starts_run[1:]
+    runs = numpy.zeros(numpy.count_nonzero(starts_run), dtype=IDLE_RUN_DTYPE)
+    runs['first'] = firsts[starts_run]
+    runs['last'] = ends[ends_run]
+    return runs
+
+
+def extend_idle_runs(runs, data, sample):
+    """
+    Extend the idle runs of a record with data appended to it
+
+    :param runs: existing runs (bytes, array or None for a new record)
+    :param sample: samples of the record before data
+    :return: IDLE_RUN_DTYPE array covering the record including data
+    """
+    added = idle_runs(data, sample)
+    if runs is None or len(runs) == 0:
+        return added
+    runs = load_idle_runs(runs)
+    if len(added) and runs['last'][-1] == added['first'][0]:
+        runs = runs.copy()
+        runs['last'][-1] = added['last'][0]
+        added = added[1:]
+    return numpy.concatenate((runs, added))
+
+
+def idle_runs_mask(runs, first_sample, last_sample):
+    """idle_mask() of samples [first_sample, last_sample) from the stored idle runs of a record"""
+    runs = load_idle_runs(runs)
+    n = max(0, last_sample - first_sample)
+    lo = numpy.clip(runs['first'] - first_sample, 0, n)
+    hi = numpy.clip(runs['last'] - first_sample, 0, n)
+    edges = numpy.zeros(n + 1, dtype=numpy.int64)
+    numpy.add.at(edges, lo, 1)
+    numpy.add.at(edges, hi, -1)
+    return numpy.cumsum(edges[:n]) > 0
+
+
+def decompressed_size(data):
+    """
+    Sizing pass, number of samples decompress() will return for data
+
+    Equal to the sum of the sample counts reported by analyze_compressed().
+    """
+    return int(numpy.sum(frame_sample_counts(data)))
+
+
+def decompress_into(data, out):
+    """
+    Decompress straight into a preallocated array
+
+    :param data: compressed bytes
+    :param out: array [>= samples, 3], use decompressed_size() to size it
+    :return: number of samples written
+    """
+    ref, counts = decompress_frames(data)
+    total = int(numpy.sum(counts))
+    if total > len(out):
+        raise ValueError("Output holds %d samples, record has %d" % (len(out), total))
+    _expand_frames(ref, counts, out[:total])
+    return total
+
+
+def _expand_frames(ref, counts, out):
+    # Like out[:] = numpy.repeat(ref, counts, axis=0), but the only temporary is a frame number per sample
+    frame = numpy.repeat(numpy.arange(len(counts), dtype=numpy.int32), counts)[:len(out)]
+    numpy.take(ref.astype(out.dtype), frame, axis=0, out=out, mode='clip')
+
+
+def iter_decompress(data, block_size=4096):
+    """
+    Streaming decoder, yields the samples of data in blocks
+
+    Only one block of samples is materialized at a time, the frame table is
+    decoded once up front.
+
+    :param data: compressed bytes
+    :param block_size: samples per block, the last block may be shorter
+    :return: generator of numpy int16 [<= block_size, 3]
+    """
+    ref, counts = decompress_frames(data)
+    ends = numpy.cumsum(counts)
+    total = int(ends[-1]) if len(ends) else 0
+    for first in range(0, total, block_size):
+        last = min(first + block_size, total)
+        # Frames overlapping [first, last)
+        f0 = int(numpy.searchsorted(ends, first, side='right'))
+        f1 = int(numpy.searchsorted(ends, last - 1, side='right')) + 1
+        block_counts = counts[f0:f1].copy()
+        block_counts[0] = min(ends[f0], last) - first
+        if f1 - f0 > 1:
+            block_counts[-1] = last - (ends[f1 - 1] - counts[f1 - 1])
+        yield numpy.repeat(ref[f0:f1], block_counts, axis=0).astype(numpy.int16)
+
+
+###############################################################
+##
+## Frame index
+##
+###############################################################
+
+# One entry per anchor. An anchor is the start of the data or an ignore frame
+# carrying a timestamp_tx. The last entry always marks the end of the data.
+INDEX_DTYPE = numpy.dtype([('sample', '<i8'),   # samples decoded before the anchor
+                           ('tx', '<i8'),       # timestamp_tx in effect at the anchor
+                           ('offset', '<i8'),   # byte offset of the anchor
+                           ('ref', '<i2', 3)])  # reference value at the anchor
+
+
+def load_index(index):
+    """Returns index (bytes or array) as an INDEX_DTYPE array"""
+    if isinstance(index, numpy.ndarray):
+        return index
+    return numpy.frombuffer(bytes(index), dtype=INDEX_DTYPE)
+
+
+def build_index(data, sample=0, offset=0, tx=0, ref=None):
+    """
+    Build the frame index of a compressed record
+
+    :param data: compressed bytes
+    :param sample, offset, tx, ref: state at the start of data, used when data is
+                                    appended to an already indexed record
+    :return: INDEX_DTYPE array
+    """
+    buf, starts, kinds, frame_ref, counts = _decode_frames(data, ref)
+    start_ref = numpy.zeros(3, dtype=numpy.int64) if ref is None else numpy.asarray(ref, dtype=numpy.int64)
+
+    # Value and sample count before each frame
+    before_ref = numpy.vstack((start_ref[numpy.newaxis, :], frame_ref[:-1]))
+    before_sample = numpy.cumsum(counts) - counts
+
+    anchor = (kinds == FRAME_IGNORE) & (buf[starts + 1] >= 4)
+    anchor_starts = starts[anchor]
+    anchor_tx = numpy.zeros(len(anchor_starts), dtype=numpy.int64)
+    for k in range(2, 6):
+        anchor_tx = (anchor_tx << 8) | buf[anchor_starts + k].astype(numpy.int64)
+
+    at_start = len(anchor_starts) != 0 and anchor_starts[0] == 0
+    entries = len(anchor_starts) + (1 if at_start else 2)
+    index = numpy.zeros(entries, dtype=INDEX_DTYPE)
+    first = 0 if at_start else 1
+    if not at_start:
+        index[0] = (sample, tx, offset, start_ref)
+    index['sample'][first:-1] = before_sample[anchor] + sample
+    index['tx'][first:-1] = anchor_tx
+    index['offset'][first:-1] = anchor_starts + offset
+    index['ref'][first:-1] = before_ref[anchor]
+
+    end_tx = anchor_tx[-1] if len(anchor_tx) else tx
+    end_ref = frame_ref[-1] if len(frame_ref) else start_ref
+    index[-1] = (sample + int(numpy.sum(counts)), end_tx, offset + len(data), end_ref)
+    return index
+
+
+def extend_index(index, data):
+    """
+    Extend the index of a record with data appended to it
+
+    :param index: existing index (bytes, array or None for a new record)
+    :param data: the appended compressed bytes
+    :return: INDEX_DTYPE array covering the record including data
+    """
+    if index is None or len(index) == 0:
+        return build_index(data)
+    index = load_index(index)
+    end = index[-1]
+    added = build_index(data, sample=int(end['sample']), offset=int(end['offset']),
+                        tx=int(end['tx']), ref=end['ref'])
+    return numpy.concatenate((index[:-1], added))
+
+
+def decompress_range(data, index, first_sample, last_sample, out=None):
+    """
+    Decompress samples [first_sample, last_sample) of a record, only decoding
+    the frames between the surrounding anchors of the index
+
+    :param data: compressed bytes of the complete record
+    :param index: frame index of data, see build_index()
+    :param out: optional preallocated array, samples are written to the start of it
+    :return: numpy int16 [last_sample - first_sample, 3], a view of out if given
+    """
+    index = load_index(index)
+    first_sample = max(0, first_sample)
+    last_sample = min(int(index['sample'][-1]), last_sample)
+    if last_sample <= first_sample:
+        return numpy.zeros([0, 3], dtype=numpy.int16) if out is None else out[:0]
+    samples = index['sample']
+    k = max(0, int(numpy.searchsorted(samples[:-1], first_sample, side='right')) - 1)
+    j = min(len(index) - 1, int(numpy.searchsorted(samples, last_sample, side='left')))
+    part = data[int(index['offset'][k]):int(index['offset'][j])]
+    ref, counts = decompress_frames(part, index['ref'][k])
+    skip = first_sample - int(samples[k])
+    # Only expand the frames that overlap the range
+    ends = numpy.cumsum(counts)
+    f0 = int(numpy.searchsorted(ends, skip, side='right'))
+    keep = counts[f0:].copy()
+    keep[0] = ends[f0] - skip
+    if out is None:
+        out = numpy.empty([last_sample - first_sample, 3], dtype=numpy.int16)
+    out = out[:last_sample - first_sample]
+    _expand_frames(ref[f0:], keep, out)
+    return out
+
+
+def index_tx_to_sample(index, tx):
+    """
+    Estimate the sample offset of timestamp_tx values by interpolating between
+    the anchors of the index
+
+    :return: numpy float64 sample offsets
+    """
+    index = load_index(index)
+    anchors = index[index['tx'] > 0]
+    if len(anchors) < 2:
+        return numpy.zeros(numpy.shape(tx))
+    return numpy.interp(tx, anchors['tx'], anchors['sample'])
+
+
+###############################################################
+##
+## Vectorized encoder
+##
+###############################################################
+
+HEADER_B5 = 0x00
+HEADER_B7 = 0xC00000
+HEADER_B10 = 0x80000000
+HEADER_B11 = 0xFC00000000
+HEADER_IDLE = 0xF000
+
+
+def _pack_words(xyz, width, header):
+    mask = (1 << width) - 1
+    xyz = xyz.astype(numpy.int64) & mask
+    return ((xyz[:, 0] << (width * 2)) | (xyz[:, 1] << width) | xyz[:, 2] | header).astype(numpy.uint64)
+
+
+def _frames_to_bytes(words, sizes):
+    # Serialize frame words big-endian, each using sizes[k] bytes
+    if len(words) == 0:
+        return bytearray([])
+    words = numpy.asarray(words, dtype=numpy.uint64)
+    sizes = numpy.asarray(sizes, dtype=numpy.int64)
+    frame = numpy.repeat(numpy.arange(len(sizes)), sizes)
+    pos = numpy.arange(len(frame)) - numpy.repeat(numpy.cumsum(sizes) - sizes, sizes)
+    shift = (8 * (sizes[frame] - 1 - pos)).astype(numpy.uint64)
+    return bytearray(((words[frame] >> shift) & numpy.uint64(0xFF)).astype(numpy.uint8).tobytes())
+
+
+class _Packet:
+    def __init__(self):
+        self.words = []
+        self.sizes = []
+        self.size = 0
+
+    def add(self, words, sizes):
+        self.words.append(numpy.atleast_1d(words))
+        self.sizes.append(numpy.atleast_1d(sizes))
+        self.size += int(numpy.sum(sizes))
+
+    def tobytes(self):
+        if not self.words:
+            return bytearray([])
+        return _frames_to_bytes(numpy.concatenate(self.words), numpy.concatenate(self.sizes))
+
+
+def compress_fast(in_data, max_samples = 4000, max_packetsize = 1024):
+    """
+    Vectorized version of compress(), yields exactly the same packets
+
+    Frame types, sizes and idle candidates are computed for all samples at once.
+    The remaining loop runs once per packet, idle frame or idle candidate rather
+    than once per sample.
+    """
+    x = numpy.asarray(in_data, dtype=numpy.int64).reshape(-1, 3)
+    n = len(x)
+    if n and (numpy.min(x) < -1024 or numpy.max(x) >= 1024):
+        raise ValueError("Samples must fit in 11 bits")
+
+    # Absolute frames for every sample
+    b11_words = _pack_words(x, 11, HEADER_B11)
+
+    # Delta frames relative to the previous sample
+    diff = numpy.zeros((n, 3), dtype=numpy.int64)
+    diff[1:] = x[1:] - x[:-1]
+    dmin = numpy.minimum(numpy.minimum(diff[:, 0], diff[:, 1]), diff[:, 2])
+    dmax = numpy.maximum(numpy.maximum(diff[:, 0], diff[:, 1]), diff[:, 2])
+    delta_words = b11_words.copy()
+    delta_sizes = numpy.full(n, 5, dtype=numpy.int64)
+    for width, header, size in ((10, HEADER_B10, 4), (7, HEADER_B7, 3), (5, HEADER_B5, 2)):
+        limit = 2**(width-1)
+        sel = (dmin >= -limit) & (dmax < limit)
+        delta_words[sel] = _pack_words(diff[sel], width, header)
+        delta_sizes[sel] = size
+
+    # Samples that start at least IDLE_MIN_LEN samples within IDLE_WINDOW of the previous one
+    idle_ok = numpy.zeros(n, dtype=bool)
+    if n > IDLE_MIN_LEN:
+        m = n - IDLE_MIN_LEN
+        near = numpy.ones(m, dtype=bool)
+        for k in range(IDLE_MIN_LEN):
+            for axis in range(3):
+                near &= numpy.abs(x[1 + k:m + 1 + k, axis] - x[:m, axis]) <= IDLE_WINDOW
+        idle_ok[1:m + 1] = near
+
+    packet = _Packet()
+    prev = -1
+    i = 0
+    i_returned = 0
+    while i < n:
+        if packet.size == 0:
+            packet.add(b11_words[i], 5)
+            prev = i
+            i += 1
+        elif prev == i - 1:
+            # Run of delta frames up to the next idle candidate or the end of the packet
+            # Every delta frame takes at least 2 bytes, so the packet is full before i + max_packetsize // 2
+            end = min(n, i_returned + max_samples, i + max_packetsize // 2 + 1)
+            ends = packet.size + numpy.cumsum(delta_sizes[i:end])
+            befores = ends - delta_sizes[i:end]
+            full = (ends >= max_packetsize - 4)
+            last = i + (int(numpy.argmax(full)) if numpy.any(full) else end - i - 1)
+            cand = idle_ok[i:last + 1] & (befores[:last + 1 - i] < max_packetsize - 6)
+            cand &= numpy.arange(i, last + 1) <= i_returned + max_samples - IDLE_MIN_LEN
+            if numpy.any(cand):
+                last = i + int(numpy.argmax(cand)) - 1
+                if last >= i:
+                    packet.add(delta_words[i:last + 1], delta_sizes[i:last + 1])
+                    prev = last
+                    i = last + 1
+                i, prev = _compress_step(x, i, prev, i_returned, packet, max_samples, max_packetsize,
+                                         b11_words, delta_words, delta_sizes)
+            else:
+                packet.add(delta_words[i:last + 1], delta_sizes[i:last + 1])
+                prev = last
+                i = last + 1
+        else:
+            i, prev = _compress_step(x, i, prev, i_returned, packet, max_samples, max_packetsize,
+                                     b11_words, delta_words, delta_sizes)
+        if (i - i_returned) >= max_samples or packet.size >= max_packetsize - 4:
+            yield packet.tobytes()
+            packet = _Packet()
+            i_returned = i
+    yield packet.tobytes()
+
+
+def _compress_step(x, i, prev, i_returned, packet, max_samples, max_packetsize, b11_words, delta_words, delta_sizes):
+    # One iteration of compress() for sample i with an arbitrary previous sample
+    limit = min(2048, len(x) - i, max_samples - (i - i_returned))
+    if packet.size >= max_packetsize - 6:
+        limit = 0
+    l = 0
+    if limit > 0:
+        far = numpy.max(numpy.abs(x[i:i + limit] - x[prev]), axis=1) > IDLE_WINDOW
+        l = int(numpy.argmax(far)) if numpy.any(far) else limit
+    if l >= IDLE_MIN_LEN:
+        packet.add(numpy.uint64(HEADER_IDLE | (l - 1)), 2)
+        return i + l, prev
+    if prev == i - 1:
+        packet.add(delta_words[i], delta_sizes[i])
+    else:
+        d = x[i] - x[prev]
+        for width, header, size in ((5, HEADER_B5, 2), (7, HEADER_B7, 3), (10, HEADER_B10, 4)):
+            if within(numpy.max(d), numpy.min(d), width):
+                packet.add(_pack_words(d[numpy.newaxis, :], width, header)[0], size)
+                break
+        else:
+            packet.add(b11_words[i], 5)
+    return i + 1, i
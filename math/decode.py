@@ -0,0 +1,111 @@
+import numpy
+from math.compress import decompress_fast, decompress_into, decompressed_size, decompress_range, load_index, idle_mask
+from math.pack import legacy_segment_offsets, unpack_legacy_samples, LEGACY_SEGMENT_SAMPLES
+
+###############################################################
+##
+## Record decoding without any database access, so it can run in
+## worker processes. Formats match SensorRecord2.FORMAT_*
+##
+###############################################################
+
+FORMAT_SINGLE_UINT16 = 0
+FORMAT_LEGACY_3INT12 = 1
+FORMAT_COMPRESS_3INT12 = 2
+
+
+def sample_count(stream_type, data_format, bin_data, frame_index=None):
+    """Number of samples decode_samples() returns for bin_data"""
+    if stream_type == "acc/3ax/4g" and data_format == FORMAT_LEGACY_3INT12:
+        return len(legacy_segment_offsets(bin_data)[0]) * LEGACY_SEGMENT_SAMPLES
+    elif stream_type == "acc/3ax/4g" and data_format == FORMAT_COMPRESS_3INT12:
+        if frame_index is not None:
+            return int(load_index(frame_index)['sample'][-1])
+        return decompressed_size(bin_data)
+    else:
+        return len(bin_data) // 8
+
+
+def empty_samples(stream_type, count):
+    """Allocate an array that can hold count samples of the stream type"""
+    if stream_type == "acc/3ax/4g":
+        return numpy.zeros([count, 3], dtype=numpy.int16)
+    else:
+        return numpy.zeros([count, 1], dtype=numpy.uint16)
+
+
+def decode_samples(stream_type, data_format, bin_data, out=None):
+    """
+    Decode all samples of a record
+
+    :param out: optional preallocated array, samples are written to the start of it
+    :return: samples, a view of out if given
+    """
+    if stream_type == "acc/3ax/4g" and data_format == FORMAT_LEGACY_3INT12:
+        return _samples_out(unpack_legacy_samples(bin_data), out)
+    elif stream_type == "acc/3ax/4g" and data_format == FORMAT_COMPRESS_3INT12:
+        if out is not None:
+            return out[:decompress_into(bin_data, out)]
+        return decompress_fast(bin_data)
+    else:
+        # (ts, ts, ts, ts, data, data, na, na)
+        samples = numpy.frombuffer(bin_data, dtype='>u2')[2::4]
+        samples.shape = (samples.shape[0], 1)
+        return _samples_out(samples, out)
+
+
+def decode_samples_range(stream_type, data_format, bin_data, frame_index, first, last, out=None):
+    """
+    Decode samples [first, last) of a record. Indexed compressed records only
+    decode the frames covering the range, other records are decoded in full.
+    """
+    if stream_type == "acc/3ax/4g" and data_format == FORMAT_COMPRESS_3INT12 and frame_index is not None:
+        return decompress_range(bin_data, frame_index, first, last, out)
+    return _samples_out(decode_samples(stream_type, data_format, bin_data)[max(0, first):last], out)
+
+
+def idle_mask_range(stream_type, data_format, bin_data, frame_index, first, last):
+    """
+    Flags samples [first, last) of a record that are exact repeats from idle
+    frames. Only compressed records have idle frames, other formats are all False.
+    """
+    if stream_type == "acc/3ax/4g" and data_format == FORMAT_COMPRESS_3INT12:
+        return idle_mask(bin_data, frame_index, first, last)
+    return numpy.zeros(max(0, last - first), dtype=bool)
+
+
+def segment_bounds(tx_start, tx_end, max_gap):
+    """
+    Split records ordered by timestamp_tx into runs without gaps longer than max_gap
+
+    :return: list of (begin, end) record positions, end exclusive
+    """
+    tx_start = numpy.asarray(tx_start, dtype=numpy.float64)
+    tx_end = numpy.asarray(tx_end, dtype=numpy.float64)
+    breaks = numpy.flatnonzero(tx_start[1:] > tx_end[:-1] + max_gap) + 1
+    edges = numpy.concatenate(([0], breaks, [len(tx_start)])).astype(numpy.int64)
+    return [(int(b), int(e)) for b, e in zip(edges[:-1], edges[1:]) if e > b]
+
+
+def window_jobs(counts, padding, first, last):
+    """
+    Part of each record of a segment that falls in samples [first, last) of it
+
+    :param counts: samples of each record
+    :param padding: zero samples following each record
+    :return: list of (record position, lo, hi, row), samples [lo, hi) of the
+             record go to row onwards of the [last - first] output
+    """
+    counts = numpy.asarray(counts, dtype=numpy.int64)
+    offsets = numpy.cumsum(counts + numpy.asarray(padding, dtype=numpy.int64)) - counts - padding
+    lo = numpy.maximum(offsets, first)
+    hi = numpy.minimum(offsets + counts, last)
+    return [(int(i), int(lo[i] - offsets[i]), int(hi[i] - offsets[i]), int(lo[i] - first))
+            for i in numpy.flatnonzero(hi > lo)]
+
+
+def _samples_out(samples, out):
+    if out is None:
+        return samples
+    out[:len(samples)] = samples
+    return out[:len(samples)]
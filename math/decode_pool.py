@@ -0,0 +1,108 @@
+import mmap
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy
+from math.decode import decode_samples_range, empty_samples
+
+# Backing directory for the shared result buffers, tmpfs when available
+SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+class DecodeExecutor(object):
+    """
+    Decodes batches of records, either in-line or spread over a process pool
+
+    Workers write their samples straight into a shared memory mapped result
+    buffer, so only the compressed input is sent to them and nothing is sent
+    back. Batches smaller than min_samples are decoded in-line, where the pool
+    overhead would outweigh the gain.
+
+    Workers are started by a forkserver (spawn where there is none), never
+    forked from the web process: a forked child would inherit its open
+    database and Redis sockets, and the locks other request threads hold.
+    """
+
+    def __init__(self, workers=0, min_samples=100000):
+        self.workers = workers
+        self.min_samples = min_samples
+        self._pool = None
+
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_pool_context())
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def decode(self, stream_type, data_format, jobs, rows, parallel=None):
+        """
+        Decode many records into one array
+
+        :param jobs: list of (bin_data, frame_index, first, last, row), samples
+                     [first, last) of each record are written from row onwards
+        :param rows: total rows of the result, rows not covered by a job are zero
+        :param parallel: force (True) or prevent (False) use of the pool
+        :return: numpy array [rows, width]
+        """
+        if parallel is None:
+            parallel = self.workers > 1 and len(jobs) > 1 and rows >= self.min_samples
+        if not parallel:
+            out = empty_samples(stream_type, rows)
+            for bin_data, frame_index, first, last, row in jobs:
+                decode_samples_range(stream_type, data_format, bin_data, frame_index, first, last,
+                                     out=out[row:row + last - first])
+            return out
+        return self._decode_parallel(stream_type, data_format, jobs, rows)
+
+    def _decode_parallel(self, stream_type, data_format, jobs, rows):
+        template = empty_samples(stream_type, 0)
+        nbytes = max(1, rows * template.shape[1] * template.itemsize)
+        fd, path = tempfile.mkstemp(prefix='decode-', dir=SHM_DIR)
+        try:
+            os.ftruncate(fd, nbytes)
+            buffer = mmap.mmap(fd, nbytes)
+            futures = [self.pool().submit(_decode_worker, path, stream_type, data_format, rows, chunk)
+                       for chunk in _split_jobs(jobs, self.workers * 2)]
+            for f in futures:
+                f.result()
+        finally:
+            os.close(fd)
+            os.unlink(path)
+        # The array keeps the mapping alive after the file is unlinked
+        out = numpy.frombuffer(buffer, dtype=template.dtype, count=rows * template.shape[1])
+        return out.reshape(rows, template.shape[1])
+
+
+def _pool_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def _split_jobs(jobs, parts):
+    # Contiguous chunks of roughly equal sample counts
+    sizes = numpy.cumsum([last - first for _, _, first, last, _ in jobs])
+    bounds = numpy.searchsorted(sizes, numpy.linspace(0, sizes[-1], parts + 1)[1:-1], side='right')
+    chunks = []
+    begin = 0
+    for end in list(bounds) + [len(jobs)]:
+        if end > begin:
+            chunks.append(jobs[begin:end])
+            begin = end
+    return chunks
+
+
+def _decode_worker(path, stream_type, data_format, rows, jobs):
+    template = empty_samples(stream_type, 0)
+    with open(path, 'r+b') as f:
+        buffer = mmap.mmap(f.fileno(), 0)
+    out = numpy.frombuffer(buffer, dtype=template.dtype, count=rows * template.shape[1]).reshape(rows, template.shape[1])
+    for bin_data, frame_index, first, last, row in jobs:
+        decode_samples_range(stream_type, data_format, bin_data, frame_index, first, last,
+                             out=out[row:row + last - first])
+    del out
+    buffer.close()
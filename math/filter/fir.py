@@ -0,0 +1,45 @@
+import numpy
+import scipy.signal as sig
+
+###############################################################
+##
+## FIR designs shared by LowpassFilter and UpsampleFilter, and
+## filtering that switches to FFT convolution for long taps
+##
+###############################################################
+
+# Taps from which oaconvolve() is faster than lfilter() (see bench/bench_filters.py)
+FFT_MIN_TAPS = 96
+
+_designs = {}
+
+
+def kaiser_lowpass(ripple_db, width, cutoff):
+    """
+    firwin() kaiser window lowpass, designed once per parameters. The taps are
+    shared between filters and read only.
+
+    :param width: transition width, relative to the nyquist frequency
+    :param cutoff: relative to the nyquist frequency
+    """
+    key = (ripple_db, width, cutoff)
+    taps = _designs.get(key)
+    if taps is None:
+        n, beta = sig.kaiserord(ripple_db, width)
+        taps = sig.firwin(n, cutoff, window=('kaiser', beta))
+        taps.setflags(write=False)
+        _designs[key] = taps
+    return taps
+
+
+def fir_filter(taps, data, axis=-1):
+    """
+    lfilter(taps, 1.0, data, axis) of all other axes at once, through overlap
+    add FFT convolution when there are at least FFT_MIN_TAPS taps
+    """
+    if len(taps) < FFT_MIN_TAPS:
+        return sig.lfilter(taps, 1.0, data, axis=axis)
+    shape = [1] * data.ndim
+    shape[axis] = len(taps)
+    filtered = sig.oaconvolve(data, numpy.reshape(taps, shape), mode='full', axes=axis)
+    return filtered.take(numpy.arange(data.shape[axis]), axis=axis)
@@ -1,7 +1,7 @@
-import scipy
 import numpy
-from numpy import pi, absolute, floor
-from scipy.signal import firwin, kaiserord, lfilter
+from numpy import floor
+from scipy.signal import upfirdn
+from math.filter.fir import kaiser_lowpass
 
 
 class UpsampleFilter:
@@ -15,9 +15,8 @@ class UpsampleFilter:
         width = 1.0/nyq_freq
         cutoff_freq = source_freq * 0.40
 
-        # Generate Filter
-        N, beta = kaiserord(ripple_db, width)
-        taps = firwin(N, cutoff_freq/nyq_freq, window=('kaiser', beta))
+        # Generate Filter (shared by filters with the same parameters)
+        taps = kaiser_lowpass(ripple_db, width, cutoff_freq/nyq_freq)
 
         self.taps = taps
         self.source_freq = source_freq
@@ -25,13 +24,21 @@ class UpsampleFilter:
         self.upsample_factor = upsample_factor
         self.ltaps = len(self.taps)
         self.ltapsh = int(floor(len(self.taps)/2))
+        # Repeating samples is zero stuffing followed by a boxcar
+        self.repeat_taps = numpy.convolve(taps, numpy.ones(upsample_factor))
 
     def upsample(self, data):
+        """
+        lfilter() of the repeated and symmetric padded samples, computed at the
+        source rate with upfirdn(). Padding by whole samples before repeating
+        mirrors the same way as padding the repeated samples.
+        """
         tapshl = self.ltaps//2 + 1
-        padding = ((tapshl, tapshl), (0,0))
+        pad = -(-tapshl // self.upsample_factor)
 
-        us_data = numpy.repeat(data, self.upsample_factor, 0)
-        us_data = numpy.pad(us_data, padding, 'symmetric')
-        us_data = scipy.signal.lfilter(self.taps, 1.0, us_data, axis=0)
+        padded = numpy.pad(data, ((pad, pad), (0, 0)), 'symmetric')
+        us_data = upfirdn(self.repeat_taps, padded, up=self.upsample_factor, axis=0)
 
-        return us_data[self.ltaps+2:,:]
+        # Index 0 of the repeated data padded by tapshl
+        offset = pad * self.upsample_factor - tapshl
+        return us_data[offset + self.ltaps + 2:offset + len(data) * self.upsample_factor + 2 * tapshl, :]
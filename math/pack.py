@@ -28,18 +28,70 @@ def unpack10bit(data):
     if len(data) % 4:
         raise DataFormatError()
 
-    a = numpy.ndarray(len(data) // 4 * 3, dtype = numpy.int16)
+    return _unpack10bit_words(numpy.frombuffer(bytes(data), dtype='>u4')).reshape(-1)
 
-    for i in range(len(data) // 4):
-        # 32bit int
-        val = struct.unpack(">I", data[i*4:(i+1)*4])[0]
-
-        a[i*3]   = ((val >> 20) & 0x1FF) - (val >> 20 & 0x200)
-        a[i*3+1] = ((val >> 10) & 0x1FF) - (val >> 10 & 0x200)
-        a[i*3+2] = ((val      ) & 0x1FF) - (val       & 0x200)
 
+def _unpack10bit_words(words):
+    # words: big-endian 32bit values, returns int16 [len(words), 3]
+    words = words.astype(numpy.int64)
+    a = numpy.empty((len(words), 3), dtype=numpy.int16)
+    for k, shift in enumerate((20, 10, 0)):
+        val = words >> shift
+        a[:, k] = (val & 0x1FF) - (val & 0x200)
     return a
 
+
+LEGACY_SEGMENT_SAMPLES = 125
+
+
+def legacy_segment_offsets(data):
+    """
+    Find the segments of a FORMAT_LEGACY_3INT12 record, each one is a 32bit
+    timestamp, a length byte (in 32bit words) and the packed samples
+
+    :return: (offsets, word_counts) of the segment payloads
+    """
+    offsets = []
+    word_counts = []
+    i = 0
+    while i < len(data):
+        word_counts.append(data[i + 4])
+        offsets.append(i + 5)
+        i += 5 + data[i + 4] * 4
+    return numpy.array(offsets, dtype=numpy.int64), numpy.array(word_counts, dtype=numpy.int64)
+
+
+def unpack_legacy_samples(data):
+    """
+    Unpack all segments of a FORMAT_LEGACY_3INT12 record at once
+
+    Segments hold either LEGACY_SEGMENT_SAMPLES samples, or a single sample that
+    stands for the whole segment. The z axis is offset corrected by -20.
+
+    :return: numpy [samples, 3], int16, or float64 if any segment held a single sample
+    """
+    offsets, word_counts = legacy_segment_offsets(data)
+    if numpy.any((word_counts != 1) & (word_counts != LEGACY_SEGMENT_SAMPLES)):
+        raise DataFormatError()
+
+    # Gather the payload bytes of all segments and read them as one word array
+    byte_counts = word_counts * 4
+    byte_idx = numpy.repeat(offsets - (numpy.cumsum(byte_counts) - byte_counts), byte_counts) + \
+        numpy.arange(int(numpy.sum(byte_counts)))
+    buf = numpy.frombuffer(bytes(data), dtype=numpy.uint8)
+    if len(byte_idx) and byte_idx[-1] >= len(buf):
+        raise DataFormatError()
+    words = buf[byte_idx].view('>u4')
+    samples = _unpack10bit_words(words)
+
+    single = word_counts == 1
+    if numpy.any(single):
+        samples = numpy.repeat(samples.astype(numpy.float64),
+                               numpy.where(single, LEGACY_SEGMENT_SAMPLES, 1).repeat(word_counts), axis=0)
+    samples[:, 2] = samples[:, 2] - 20
+    return samples
+
+
 #10  = 0x 0A =    0000.1010
 #50  = 0x 32 =    0011.0010
 #100 = 0x 64 =    0110.0100
@@ -0,0 +1,90 @@
+import numpy
+
+###############################################################
+##
+## Downsampling pyramid of raw samples: per time bucket min, max,
+## mean and median of every axis, for charts spanning hours to days
+##
+###############################################################
+
+# Bucket lengths of the levels, finest first
+PYRAMID_LEVELS_MS = (1000, 10000, 120000, 900000)
+
+
+def pyramid_dtype(axes):
+    return numpy.dtype([('ts', '<i8'),            # unix ms of the bucket start, a multiple of the level
+                        ('count', '<i4'),         # samples in the bucket
+                        ('min', '<f4', axes),
+                        ('max', '<f4', axes),
+                        ('mean', '<f4', axes),
+                        ('median', '<f4', axes)])
+
+
+def load_pyramid(data, axes):
+    """Returns level data (bytes or array) as a pyramid_dtype(axes) array"""
+    if isinstance(data, numpy.ndarray):
+        return data
+    return numpy.frombuffer(bytes(data), dtype=pyramid_dtype(axes))
+
+
+def pick_level(resolution_ms):
+    """Coarsest level with buckets no longer than resolution_ms, None if raw samples are needed"""
+    levels = [level for level in PYRAMID_LEVELS_MS if level <= resolution_ms]
+    return levels[-1] if len(levels) else None
+
+
+def bucket_stats(ts, samples, bucket_ms):
+    """
+    :param ts: numpy int64 unix ms of each sample, increasing
+    :param samples: numpy [n, axes]
+    :return: pyramid_dtype(axes) array, one entry per non-empty bucket
+    """
+    axes = samples.shape[1]
+    if len(ts) == 0:
+        return numpy.zeros(0, dtype=pyramid_dtype(axes))
+    bucket = ts // bucket_ms
+    starts = numpy.flatnonzero(numpy.concatenate(([True], bucket[1:] != bucket[:-1])))
+    out = numpy.zeros(len(starts), dtype=pyramid_dtype(axes))
+    counts = numpy.diff(numpy.append(starts, len(ts)))
+    out['ts'] = bucket[starts] * bucket_ms
+    out['count'] = counts
+    out['min'] = numpy.minimum.reduceat(samples, starts, axis=0)
+    out['max'] = numpy.maximum.reduceat(samples, starts, axis=0)
+    out['mean'] = numpy.add.reduceat(samples, starts, axis=0, dtype=numpy.float64) / counts[:, numpy.newaxis]
+
+    # Sort every bucket at once (bucket id as the primary key), the median is then in the middle of each bucket
+    group = numpy.repeat(numpy.arange(len(starts)), counts)
+    lower = starts + (counts - 1) // 2
+    upper = starts + counts // 2
+    for axis in range(axes):
+        column = samples[:, axis]
+        ordered = column[numpy.lexsort((column, group))].astype(numpy.float64)
+        out['median'][:, axis] = (ordered[lower] + ordered[upper]) / 2
+    return out
+
+
+def merge_buckets(parts, axes):
+    """
+    Concatenate the levels of consecutive records, merging buckets split
+    between records. min/max/mean stay exact, the median of a split bucket is
+    the count weighted mean of the part medians.
+
+    :param parts: pyramid_dtype(axes) arrays, in time order
+    :return: pyramid_dtype(axes) array
+    """
+    parts = [p for p in parts if len(p)]
+    if len(parts) == 0:
+        return numpy.zeros(0, dtype=pyramid_dtype(axes))
+    buckets = numpy.concatenate(parts)
+    starts = numpy.flatnonzero(numpy.concatenate(([True], buckets['ts'][1:] != buckets['ts'][:-1])))
+    if len(starts) == len(buckets):
+        return buckets
+    counts = buckets['count'].astype(numpy.float64)[:, numpy.newaxis]
+    out = buckets[starts].copy()
+    out['count'] = numpy.add.reduceat(buckets['count'], starts)
+    total = out['count'].astype(numpy.float64)[:, numpy.newaxis]
+    out['min'] = numpy.minimum.reduceat(buckets['min'], starts, axis=0)
+    out['max'] = numpy.maximum.reduceat(buckets['max'], starts, axis=0)
+    out['mean'] = numpy.add.reduceat(buckets['mean'] * counts, starts, axis=0) / total
+    out['median'] = numpy.add.reduceat(buckets['median'] * counts, starts, axis=0) / total
+    return out
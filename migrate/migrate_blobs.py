@@ -0,0 +1,49 @@
+from components import db
+from flaskapp import app
+from migrate import MSG
+from models.sensordata.blob_store import get_blob_store
+from models.sensordata.session import Stream2
+from models.sensordata.sensor_record import SensorRecord2, get_bindata, load_all_bindata
+
+
+def migrate_bindata_to_blob_store(batch_size=500, max_batches=None):
+    """
+    Move the bin_data of closed records from the database to the blob store,
+    open records are left alone as ingest still appends to them
+    """
+    if not app.config['ALLOW_MIGRATE'] is True:
+        return
+
+    store = get_blob_store()
+    batches = 0
+    moved = 0
+    while max_batches is None or batches < max_batches:
+        records = SensorRecord2.query.join(Stream2, Stream2.id == SensorRecord2.stream_id)\
+            .filter(SensorRecord2.datastore.in_([SensorRecord2.DATASTORE_LOCAL, SensorRecord2.DATASTORE_SEGMENTS]))\
+            .filter((Stream2.open_record_tx == None) | (Stream2.open_record_tx != SensorRecord2.timestamp_tx))\
+            .order_by(SensorRecord2.stream_id, SensorRecord2.timestamp_tx)\
+            .limit(batch_size).all()
+        if len(records) == 0:
+            break
+
+        load_all_bindata(records)
+        for r in records:
+            # Written before the rows are removed, a failed commit leaves an unused blob behind
+            store.put(r.uuid, bytes(get_bindata(r)))
+            if r.datastore == SensorRecord2.DATASTORE_LOCAL:
+                db.session.delete(r.bindata_cached)
+            else:
+                for segment in r.segments_cached:
+                    db.session.delete(segment)
+            r.datastore = SensorRecord2.DATESTORE_S3
+            r.segment_count = None
+            r.bindata_cached = None
+            r.segments_cached = None
+            r.segments_joined = None
+        db.session.commit()
+
+        batches += 1
+        moved += len(records)
+        MSG("- Moved %d records" % moved)
+
+    MSG("Blob migration done, %d records moved" % moved)
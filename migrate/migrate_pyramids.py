@@ -0,0 +1,37 @@
+from sqlalchemy import and_, or_
+from components import db
+from flaskapp import app
+from migrate import MSG
+from models.sensordata.sensor_record import SensorRecord2
+from query.sensordata.pyramid_query import build_missing_pyramids, records_without_pyramid
+
+
+def migrate_record_pyramids(batch_size=200, max_batches=None):
+    """
+    Build the downsampling pyramids of closed records that have none yet,
+    including records without utc_start (see migrate_record_times.py), which
+    the pyramid worker (/internal/worker/pyramids) leaves out
+    """
+    if not app.config['ALLOW_MIGRATE'] is True:
+        return
+
+    last_key = (-1, -1)  # Records of sessions without time syncs are skipped, so page on the primary key
+    batches = 0
+    built = 0
+    while max_batches is None or batches < max_batches:
+        records = records_without_pyramid()\
+            .filter(or_(SensorRecord2.stream_id > last_key[0],
+                        and_(SensorRecord2.stream_id == last_key[0], SensorRecord2.timestamp_tx > last_key[1])))\
+            .order_by(SensorRecord2.stream_id, SensorRecord2.timestamp_tx)\
+            .limit(batch_size).all()
+        if len(records) == 0:
+            break
+
+        built += build_missing_pyramids(records)
+        last_key = (records[-1].stream_id, records[-1].timestamp_tx)
+        db.session.commit()
+
+        batches += 1
+        MSG("- Built pyramids of %d records" % built)
+
+    MSG("Pyramid migration done, %d records built" % built)
@@ -0,0 +1,46 @@
+from sqlalchemy import and_, or_
+from components import db
+from flaskapp import app
+from migrate import MSG
+from models.sensordata.session import Stream2
+from models.sensordata.sensor_record import SensorRecord2
+from models.sensordata.timesync import get_clock_models
+
+
+def migrate_record_utc_times(batch_size=1000, max_batches=None):
+    """
+    Fill utc_start/utc_end of records stored before they were set at ingest.
+    Like ingest, each record is converted with the ClockModel of its session.
+    """
+    if not app.config['ALLOW_MIGRATE'] is True:
+        return
+
+    last_key = (-1, -1)  # Records without time syncs stay unset, so page on the primary key
+    batches = 0
+    updated = 0
+    while max_batches is None or batches < max_batches:
+        rows = db.session.query(SensorRecord2, Stream2.session_id)\
+            .join(Stream2, Stream2.id == SensorRecord2.stream_id)\
+            .filter(SensorRecord2.utc_start == None)\
+            .filter(or_(SensorRecord2.stream_id > last_key[0],
+                        and_(SensorRecord2.stream_id == last_key[0], SensorRecord2.timestamp_tx > last_key[1])))\
+            .order_by(SensorRecord2.stream_id, SensorRecord2.timestamp_tx)\
+            .limit(batch_size).all()
+        if len(rows) == 0:
+            break
+
+        clocks = get_clock_models([session_id for record, session_id in rows])
+        for record, session_id in rows:
+            clock = clocks.get(session_id)
+            if clock is None:
+                continue
+            record.utc_start = clock.tx_to_utc(record.timestamp_tx)
+            record.utc_end = clock.tx_to_utc(record.timestamp_tx_end)
+            updated += 1
+        last_key = (rows[-1][0].stream_id, rows[-1][0].timestamp_tx)
+        db.session.commit()
+
+        batches += 1
+        MSG("- Updated %d records" % updated)
+
+    MSG("Record time migration done, %d records updated" % updated)
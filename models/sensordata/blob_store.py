@@ -0,0 +1,173 @@
+import os
+import threading
+from collections import OrderedDict
+from flaskapp import app
+
+
+class BlobStore(object):
+    """
+    Write-once object storage for record bin_data, keyed by the record uuid.
+    Backends implement put/get/delete, get_many and ranged reads default to get().
+    """
+
+    def put(self, key, data):
+        raise NotImplementedError()
+
+    def get(self, key, start=0, end=None):
+        """
+        :param start: first byte
+        :param end: byte after the last, None reads to the end
+        :return: bytes, None if key does not exist
+        """
+        raise NotImplementedError()
+
+    def get_many(self, keys):
+        """:return: dict key -> bytes, missing keys are left out"""
+        result = {}
+        for key in keys:
+            data = self.get(key)
+            if data is not None:
+                result[key] = data
+        return result
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Stand-in for an object store, one file per blob in a two level directory
+    tree named after the key
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        name = bytes(key).hex()
+        return os.path.join(self.root, name[0:2], name[2:4], name)
+
+    def put(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary name first so readers never see a partial blob
+        tmp_path = path + '.tmp%d' % os.getpid()
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key, start=0, end=None):
+        try:
+            with open(self.path(key), 'rb') as f:
+                if start:
+                    f.seek(start)
+                return f.read() if end is None else f.read(max(0, end - start))
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+class SizedLRU(object):
+    """
+    Thread safe LRU mapping bounded by the total size of its values, values
+    larger than the bound are not kept
+    """
+
+    def __init__(self, max_bytes, sizeof=len):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.items:
+                self.size -= self.sizeof(self.items.pop(key))
+            self.items[key] = value
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self.items.popitem(last=False)
+                self.size -= self.sizeof(evicted)
+
+    def remove(self, key):
+        with self.lock:
+            if key in self.items:
+                self.size -= self.sizeof(self.items.pop(key))
+
+
+class CachedBlobStore(BlobStore):
+    """
+    LRU read cache in front of another store, bounded by the total size of the
+    cached blobs. Ranged reads are served from the cache but do not fill it.
+    """
+
+    def __init__(self, store, max_bytes):
+        self.store = store
+        self.cache = SizedLRU(max_bytes)
+
+    def put(self, key, data):
+        self.cache.remove(bytes(key))
+        self.store.put(key, data)
+
+    def get(self, key, start=0, end=None):
+        key = bytes(key)
+        data = self.cache.get(key)
+        if data is not None:
+            return data[start:end]
+        if start != 0 or end is not None:
+            return self.store.get(key, start, end)
+        data = self.store.get(key)
+        if data is not None:
+            self.cache.put(key, data)
+        return data
+
+    def get_many(self, keys):
+        result = {}
+        missing = []
+        for key in keys:
+            key = bytes(key)
+            data = self.cache.get(key)
+            if data is not None:
+                result[key] = data
+            else:
+                missing.append(key)
+        if len(missing):
+            loaded = self.store.get_many(missing)
+            for key, data in loaded.items():
+                self.cache.put(key, data)
+            result.update(loaded)
+        return result
+
+    def delete(self, key):
+        self.cache.remove(bytes(key))
+        self.store.delete(key)
+
+
+_blob_store = None
+
+
+def get_blob_store():
+    global _blob_store
+    if _blob_store is None:
+        assert app.config.get('BLOB_STORE_DIR'), "BLOB_STORE_DIR not configured"
+        # Not relative to the working directory, which differs between the web server, workers and migrations
+        store = LocalBlobStore(os.path.join(app.instance_path, app.config['BLOB_STORE_DIR']))
+        cache_bytes = app.config.get('BLOB_CACHE_BYTES', 0)
+        _blob_store = CachedBlobStore(store, cache_bytes) if cache_bytes else store
+    return _blob_store
@@ -0,0 +1,136 @@
+import struct
+import threading
+import numpy
+import lz4.frame
+from components import redis_store
+from flaskapp import app
+from models.sensordata.blob_store import SizedLRU
+
+# Redis values: magic, version, dtype, columns, rows, then the lz4 compressed little endian samples
+_HEADER = struct.Struct('<2sBcBI')
+_MAGIC = b'SC'
+_VERSION = 1
+# dtypes of the decoded samples, legacy broadcast records decode to float64
+_DTYPES = {b'h': numpy.dtype('<i2'), b'H': numpy.dtype('<u2'), b'f': numpy.dtype('<f4'), b'd': numpy.dtype('<f8')}
+_CODES = {v: k for k, v in _DTYPES.items()}
+
+
+def encode_samples(samples):
+    """:return: Redis value, None if the dtype of samples has no code"""
+    code = _CODES.get(samples.dtype.newbyteorder('<'))
+    if code is None:
+        return None
+    data = numpy.ascontiguousarray(samples, dtype=samples.dtype.newbyteorder('<'))
+    return _HEADER.pack(_MAGIC, _VERSION, code, samples.shape[1], samples.shape[0]) + lz4.frame.compress(data.tobytes())
+
+
+def decode_samples_value(value):
+    magic, version, code, columns, rows = _HEADER.unpack_from(value)
+    if magic != _MAGIC or version != _VERSION or code not in _DTYPES:
+        return None
+    samples = numpy.frombuffer(lz4.frame.decompress(value[_HEADER.size:]), dtype=_DTYPES[code])
+    return samples.reshape(rows, columns).astype(_DTYPES[code].newbyteorder('='))
+
+
+class SampleCache(object):
+    """
+    Decoded samples of closed records, keyed by (stream_id, timestamp_tx,
+    stream_cnt_end). A byte bounded process LRU in front of an optional shared
+    Redis tier. The open record of a stream is never cached as it still grows.
+
+    Cached arrays are shared, callers must not modify them.
+    """
+
+    def __init__(self, max_bytes, redis=None, redis_ttl_s=24*3600):
+        self.local = SizedLRU(max_bytes, sizeof=lambda samples: samples.nbytes)
+        self.redis = redis
+        self.redis_ttl_s = redis_ttl_s
+        self.lock = threading.Lock()
+        self.hits_local = 0
+        self.hits_redis = 0
+        self.misses = 0
+        self.redis_errors = 0
+        self.unencodable = 0
+
+    @staticmethod
+    def key(record, stream):
+        if record.timestamp_tx == stream.open_record_tx:
+            return None
+        return record.stream_id, record.timestamp_tx, record.stream_cnt_end
+
+    @staticmethod
+    def _redis_key(key):
+        return 'samples:%d:%d:%d' % key
+
+    def _count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def peek(self, record, stream):
+        """Samples held by the process LRU, without counting a lookup or asking Redis"""
+        key = self.key(record, stream)
+        return None if key is None else self.local.get(key)
+
+    def get(self, record, stream):
+        """:return: samples, None if not cached"""
+        key = self.key(record, stream)
+        if key is None:
+            return None
+        samples = self.local.get(key)
+        if samples is not None:
+            self._count('hits_local')
+            return samples
+        if self.redis is not None:
+            try:
+                value = self.redis.get(self._redis_key(key))
+            except Exception:
+                value = None
+                self._count('redis_errors')
+            samples = decode_samples_value(value) if value is not None else None
+            if samples is not None:
+                samples.flags.writeable = False
+                self.local.put(key, samples)
+                self._count('hits_redis')
+                return samples
+        self._count('misses')
+        return None
+
+    def put(self, record, stream, samples):
+        key = self.key(record, stream)
+        if key is None:
+            return
+        samples = numpy.array(samples)
+        samples.flags.writeable = False
+        self.local.put(key, samples)
+        if self.redis is not None:
+            value = encode_samples(samples)
+            if value is None:
+                self._count('unencodable')
+                return
+            try:
+                self.redis.setex(self._redis_key(key), self.redis_ttl_s, value)
+            except Exception:
+                self._count('redis_errors')
+
+    def stats(self):
+        lookups = self.hits_local + self.hits_redis + self.misses
+        return {'hits_local': self.hits_local,
+                'hits_redis': self.hits_redis,
+                'misses': self.misses,
+                'redis_errors': self.redis_errors,
+                'unencodable': self.unencodable,
+                'hit_rate': (self.hits_local + self.hits_redis) / lookups if lookups else 0.0,
+                'local_bytes': self.local.size,
+                'local_entries': len(self.local.items)}
+
+
+_sample_cache = None
+
+
+def get_sample_cache():
+    global _sample_cache
+    if _sample_cache is None:
+        redis = redis_store if app.config.get('SAMPLE_CACHE_REDIS') else None
+        _sample_cache = SampleCache(app.config.get('SAMPLE_CACHE_BYTES', 0), redis,
+                                    app.config.get('SAMPLE_CACHE_REDIS_TTL_S', 24*3600))
+    return _sample_cache
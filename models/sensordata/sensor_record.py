@@ -2,9 +2,15 @@ import uuid
 from datetime import datetime, timedelta
 import struct
 import numpy
+from sqlalchemy import func
 from components import db
-from math.pack import unpack10bit
-from math.compress import decompress
+from models.sensordata.blob_store import get_blob_store
+from models.sensordata.sample_cache import get_sample_cache
+from models.sensordata.session import Stream2
+from models.sensordata.timesync import TimeSync
+from math.compress import decompress_fast, extend_index, extend_idle_runs, load_index
+from math.pack import unpack_legacy_samples
+from math.decode import sample_count, decode_samples, decode_samples_range, empty_samples as empty_stream_samples
 
 UINT32_STRUCT = struct.Struct('>L')
 
@@ -17,9 +23,20 @@ class SensorBinData(db.Model):
     bin_data = db.Column(db.LargeBinary, nullable=False)
 
 
+class SensorBinSegment(db.Model):
+    """Append-only storage, the bin_data of a record is its segments joined in seq order"""
+    __tablename__ = "sensor_bin_segments"
+    __bind_key__ = 'sensordata'
+
+    uuid = db.Column(db.BINARY(16), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    bin_data = db.Column(db.LargeBinary, nullable=False)
+
+
 class SensorRecord2(db.Model):
     __tablename__ = "sensor_records2"
     __bind_key__ = 'sensordata'
+    __table_args__ = (db.Index('ix_sensor_records2_stream_utc_start', 'stream_id', 'utc_start'),)
 
     # Fields
     stream_id = db.Column(db.Integer, db.ForeignKey('streams2.id'), nullable=False, primary_key=True)
@@ -29,33 +46,185 @@ class SensorRecord2(db.Model):
     stream_cnt_end = db.Column(db.Integer, nullable=False)
     datastore = db.Column(db.Integer, nullable=False)
     uuid = db.Column(db.BINARY(16), nullable=False)
+    frame_index = db.Column(db.LargeBinary, nullable=True)  # FORMAT_COMPRESS_3INT12 only, see math.compress.build_index
+    idle_runs = db.Column(db.LargeBinary, nullable=True)  # FORMAT_COMPRESS_3INT12 only, see math.compress.idle_runs
+    segment_count = db.Column(db.Integer, nullable=True)  # DATASTORE_SEGMENTS only
+    utc_start = db.Column(db.DateTime, nullable=True)  # timestamp_tx and timestamp_tx_end converted at ingest
+    utc_end = db.Column(db.DateTime, nullable=True)
 
     DATASTORE_DIRECT = 0  # (Up to 16 bytes)
     DATASTORE_LOCAL = 1
     DATESTORE_S3 = 2
+    DATASTORE_SEGMENTS = 3
+
+    MAX_DURATION = timedelta(minutes=25)  # Records are closed after 20 minutes, plus the samples of the last packet
 
     FORMAT_SINGLE_UINT16 = 0
     FORMAT_LEGACY_3INT12 = 1
     FORMAT_COMPRESS_3INT12 = 2
 
     bindata_cached = None
+    segments_cached = None
+    segments_joined = None
+    blob_cached = None
+    summary_cached = None
+
+    @classmethod
+    def overlapping(cls, start_time, end_time, clock):
+        """
+        Filter of the records overlapping start_time, end_time. utc_start is
+        bounded from below so the (stream_id, utc_start) index is used. Records
+        stored before utc_start/utc_end were added (see
+        migrate/migrate_record_times.py) are matched by their timestamp_tx,
+        converted with the clock model of their session.
+        """
+        start_tx = max(0, clock.utc_to_tx(start_time - cls.MAX_DURATION))
+        end_tx = clock.utc_to_tx(end_time)
+        return ((cls.utc_start > start_time - cls.MAX_DURATION) & (cls.utc_start < end_time) &
+                (cls.utc_end >= start_time)) | \
+               ((cls.utc_start == None) & (cls.timestamp_tx > start_tx) & (cls.timestamp_tx < end_tx))
+
+
+class SensorRecordSummary(db.Model):
+    """
+    Per-record statistics computed from the samples decoded at ingest, lets
+    listings and overviews skip loading and decoding bin_data
+    """
+    __tablename__ = "sensor_record_summaries"
+    __bind_key__ = 'sensordata'
+
+    stream_id = db.Column(db.Integer, db.ForeignKey('streams2.id'), nullable=False, primary_key=True)
+    timestamp_tx = db.Column(db.BigInteger, nullable=False, primary_key=True)
+    sample_count = db.Column(db.Integer, nullable=False)
+    x_min = db.Column(db.Integer, nullable=True)
+    x_max = db.Column(db.Integer, nullable=True)
+    x_mean = db.Column(db.Float, nullable=True)
+    y_min = db.Column(db.Integer, nullable=True)  # y and z are null for single axis streams
+    y_max = db.Column(db.Integer, nullable=True)
+    y_mean = db.Column(db.Float, nullable=True)
+    z_min = db.Column(db.Integer, nullable=True)
+    z_max = db.Column(db.Integer, nullable=True)
+    z_mean = db.Column(db.Float, nullable=True)
+    mag_min = db.Column(db.Float, nullable=True)
+    mag_max = db.Column(db.Float, nullable=True)
+
+    AXES = ('x', 'y', 'z')
+
+    def add_samples(self, samples):
+        """
+        Merge a block of decoded samples into the summary
+
+        :param samples: numpy [n, 1] or [n, 3]
+        """
+        count = len(samples)
+        if count == 0:
+            return
+        prev_count = self.sample_count or 0
+        total = prev_count + count
+        for axis, column in zip(self.AXES, samples.T):
+            lo, hi, mean = int(column.min()), int(column.max()), float(column.mean(dtype=numpy.float64))
+            if prev_count != 0 and getattr(self, axis + '_min') is not None:
+                lo = min(lo, getattr(self, axis + '_min'))
+                hi = max(hi, getattr(self, axis + '_max'))
+                mean = (getattr(self, axis + '_mean') * prev_count + mean * count) / total
+            setattr(self, axis + '_min', lo)
+            setattr(self, axis + '_max', hi)
+            setattr(self, axis + '_mean', mean)
+        mag = numpy.sqrt(numpy.sum(numpy.square(samples, dtype=numpy.float64), axis=1))
+        mag_min, mag_max = float(mag.min()), float(mag.max())
+        if prev_count != 0 and self.mag_min is not None:
+            mag_min = min(mag_min, self.mag_min)
+            mag_max = max(mag_max, self.mag_max)
+        self.mag_min = mag_min
+        self.mag_max = mag_max
+        self.sample_count = total
+
+
+class SensorRecordPyramid(db.Model):
+    """
+    One level of the downsampling pyramid (see math/pyramid.py) of a closed
+    record, so long charts do not need its bin_data
+    """
+    __tablename__ = "sensor_record_pyramids"
+    __bind_key__ = 'sensordata'
+
+    stream_id = db.Column(db.Integer, db.ForeignKey('streams2.id'), nullable=False, primary_key=True)
+    timestamp_tx = db.Column(db.BigInteger, nullable=False, primary_key=True)
+    level_ms = db.Column(db.Integer, nullable=False, primary_key=True)
+    timestamp_tx_end = db.Column(db.BigInteger, nullable=False)  # Of the record when built, a reopened record is rebuilt
+    data = db.Column(db.LargeBinary, nullable=False)  # pyramid_dtype array
+
+
+def invalidate_record_pyramids(session_id, timestamp_tx):
+    """
+    Drop the stored pyramids of the records of a session that a new time sync
+    at timestamp_tx refits: those ending after the sync before it, whose
+    bucket times came from the previous ClockModel. The pyramid worker
+    rebuilds them.
+    """
+    previous = db.session.query(func.max(TimeSync.timestamp_tx)).filter(TimeSync.session_id == session_id)\
+        .filter(TimeSync.timestamp_tx < timestamp_tx).scalar()
+    streams = db.session.query(Stream2.id).filter(Stream2.session_id == session_id)
+    pyramids = SensorRecordPyramid.query.filter(SensorRecordPyramid.stream_id.in_(streams))
+    if previous is not None:
+        pyramids = pyramids.filter(SensorRecordPyramid.timestamp_tx_end > previous)
+    pyramids.delete(synchronize_session=False)
+
+
+def add_record_summary(record, stream, samples, new_record):
+    """Merge the samples of a packet into the summary of the record, before its bin_data is added"""
+    if record.summary_cached is None:
+        if not new_record:
+            record.summary_cached = SensorRecordSummary.query.get((record.stream_id, record.timestamp_tx))
+        if record.summary_cached is None:
+            record.summary_cached = SensorRecordSummary(stream_id = record.stream_id, timestamp_tx = record.timestamp_tx,
+                                                        sample_count = 0)
+            db.session.add(record.summary_cached)
+            if not new_record:
+                # Stored before summaries were added, seeded with the samples already stored
+                record.summary_cached.add_samples(decode_samples(stream.stream_type, stream.data_format,
+                                                                 get_bindata(record)))
+    record.summary_cached.add_samples(samples)
+
+
+def _add_segment(record, data):
+    # Appending never reads back the data already stored
+    segment = SensorBinSegment(uuid = record.uuid, seq = record.segment_count, bin_data = data)
+    record.segment_count += 1
+    if record.segments_cached is not None:
+        record.segments_cached.append(segment)
+    record.segments_joined = None
+    db.session.add(segment)
 
 
 def add_bin_data(record, data):
     if record.datastore == 0:
         # Empty
-        data_uuid = uuid.uuid4().bytes
-        record.bindata_cached = SensorBinData(uuid = data_uuid, bin_data = data)
-        record.datastore = 1
-        record.uuid = data_uuid
-        db.session.add(record.bindata_cached)
+        record.uuid = uuid.uuid4().bytes
+        record.datastore = SensorRecord2.DATASTORE_SEGMENTS
+        record.segment_count = 0
+        record.segments_cached = []
+    elif record.datastore == SensorRecord2.DATESTORE_S3:
+        # Blobs are write-once, a migrated record that is reopened goes back to
+        # segments under a new uuid (migrate_blobs.py stores it as a new blob once
+        # closed). The previous blob is left for readers that still have the old uuid.
+        blob = get_bindata(record)
+        record.uuid = uuid.uuid4().bytes
+        record.datastore = SensorRecord2.DATASTORE_SEGMENTS
+        record.segment_count = 0
+        record.segments_cached = []
+        record.blob_cached = None
+        _add_segment(record, blob)
+    if record.datastore == SensorRecord2.DATASTORE_SEGMENTS:
+        _add_segment(record, data)
     else:
+        # Records stored before segments were added
         if record.bindata_cached == None:
             record.bindata_cached = SensorBinData.query.get(record.uuid)
         record.bindata_cached.bin_data += data
 
 
-def add_records(session, stream, records_to_add, timesync):
+def add_records(session, stream, records_to_add, clock):
     # Lookup previous db record in stream
     if stream.open_record_tx != None:
         record = SensorRecord2.query.filter(SensorRecord2.stream_id == stream.id).filter(SensorRecord2.timestamp_tx == stream.open_record_tx).first()
@@ -65,7 +234,7 @@ def add_records(session, stream, records_to_add, timesync):
     for (timestamp_tx, counter, bin_data) in records_to_add:
 
         # Validate timestamp
-        real_ts = timesync.tx_to_utc(timestamp_tx)
+        real_ts = clock.tx_to_utc(timestamp_tx)
         timediff = datetime.utcnow() - real_ts
 
         if timediff < -timedelta(minutes=5):
@@ -93,21 +262,39 @@ def add_records(session, stream, records_to_add, timesync):
             record = SensorRecord2(stream_id = stream.id, timestamp_tx = timestamp_tx, timestamp_tx_end = timestamp_tx,\
                                     stream_cnt_begin = counter, stream_cnt_end = counter, datastore = 0, uuid = bytearray([]))
             db.session.add(record)
+        new_record = record.datastore == 0
         sample_count = 1 # Default
         if stream.data_format == SensorRecord2.FORMAT_LEGACY_3INT12:
             bin_data = UINT32_STRUCT.pack(timestamp_tx) + bytearray([len(bin_data)/4]) + bin_data # prepend length so we can split it
             sample_count = ord(bin_data[0:1])
+            samples = unpack_legacy_samples(bin_data)
         elif stream.data_format == SensorRecord2.FORMAT_COMPRESS_3INT12:
             bin_data = bytearray([0xFE, 0x04]) + UINT32_STRUCT.pack(timestamp_tx) + bin_data  # prepend timestamp
-            sample_count = len(decompress(bin_data))
+            ref = None
+            if new_record or record.frame_index is not None:
+                # Records stored before indexing was added stay unindexed
+                index = load_index(record.frame_index) if record.frame_index is not None else None
+                ref = index['ref'][-1] if index is not None else None
+                record.frame_index = extend_index(index, bin_data).tobytes()
+                if new_record or record.idle_runs is not None:
+                    # Records indexed before idle runs were added read them from the frame table
+                    start = int(index['sample'][-1]) if index is not None else 0
+                    record.idle_runs = extend_idle_runs(record.idle_runs, bin_data, start).tobytes()
+            samples = decompress_fast(bin_data, ref)
+            sample_count = len(samples)
         else:
             bin_data = UINT32_STRUCT.pack(timestamp_tx) + bin_data # prepend timestamp
+            samples = decode_samples(stream.stream_type, stream.data_format, bin_data)
+        add_record_summary(record, stream, samples, new_record)
         add_bin_data(record, bin_data)
         rate = stream.get_rate()
         if rate != None:
             record.timestamp_tx_end = timestamp_tx + sample_count*100*rate
         else:
             record.timestamp_tx_end = timestamp_tx
+        if record.utc_start is None:
+            record.utc_start = clock.tx_to_utc(record.timestamp_tx)
+        record.utc_end = clock.tx_to_utc(record.timestamp_tx_end)
         record.stream_cnt_end = counter
         stream.last_record_added_tx = timestamp_tx
         stream.open_record_tx = record.timestamp_tx
@@ -131,61 +318,105 @@ def get_bindata(record):
         if record.bindata_cached == None:
             record.bindata_cached = SensorBinData.query.get(record.uuid)
         return record.bindata_cached.bin_data
+    elif record.datastore == SensorRecord2.DATASTORE_SEGMENTS:
+        if record.segments_cached == None:
+            record.segments_cached = SensorBinSegment.query.filter(SensorBinSegment.uuid == record.uuid)\
+                .order_by(SensorBinSegment.seq).all()
+        if record.segments_joined == None:
+            record.segments_joined = b''.join(s.bin_data for s in record.segments_cached)
+        return record.segments_joined
+    elif record.datastore == SensorRecord2.DATESTORE_S3:
+        if record.blob_cached == None:
+            record.blob_cached = get_blob_store().get(record.uuid)
+            assert record.blob_cached is not None, "Missing blob for record %s" % bytes(record.uuid).hex()
+        return record.blob_cached
     else:
         assert(False)
 
 
+def get_bindata_range(record, start, end):
+    """Bytes [start, end) of the bin_data of a record, blob store records only read the range"""
+    if record.datastore == SensorRecord2.DATESTORE_S3 and record.blob_cached == None:
+        return get_blob_store().get(record.uuid, start, end)
+    return get_bindata(record)[start:end]
+
+
+def get_sample_count(record, stream):
+    """
+    Number of samples get_samples() returns for a record, used to size output
+    arrays before decoding
+    """
+    cached = get_sample_cache().peek(record, stream)
+    if cached is not None:
+        return len(cached)
+    return sample_count(stream.stream_type, stream.data_format, get_bindata(record), record.frame_index)
+
+
+def empty_samples(stream, count):
+    """Allocate an array that can hold count samples of the stream"""
+    return empty_stream_samples(stream.stream_type, count)
+
+
 # New
-def get_samples(record, stream):
-    if stream.stream_type == "acc/3ax/4g" and stream.data_format == SensorRecord2.FORMAT_LEGACY_3INT12:
-        bin_data = get_bindata(record)
-        parts = []
-        i = 0
-        while i < len(bin_data):
-            i += 4  # timestamp
-            l = bin_data[i]*4
-            i += 1
-            p = bin_data[i:i+l]
-            i += l
-            a = unpack10bit(p)
-            if len(a) == 3:
-                b = numpy.zeros([125, 3])
-                b[:,0] = a[0]
-                b[:,1] = a[1]
-                b[:,2] = a[2]-20
-                a = b
-            else:
-                a.shape = (125,3)
-                a[:,2] = a[:, 2]-20
-            parts.append(a)
-        return numpy.vstack(parts)
-    elif stream.stream_type == "acc/3ax/4g" and stream.data_format == SensorRecord2.FORMAT_COMPRESS_3INT12:
-        bin_data = get_bindata(record)
-        parts = []
-        i = 0
-        st = datetime.utcnow().replace(minute=37, second=30)
-        #print("----------------------------------------------")
-        #print(st + timedelta(seconds=record.timestamp_tx/100))
-        #print(".".join(["%02X" % x for x in bytearray(bin_data)]))
-        values = decompress(bytearray(bin_data))
-        #print(values.shape)
-        #print(len(values))
-        return values
-    else:
-        bin_data = get_bindata(record)
-        # (ts, ts, ts, ts, data, data, na, na)
-        samples = numpy.frombuffer(bin_data, dtype='>u2')[2::4]
-        samples.shape = (samples.shape[0], 1)
-        return samples
+def get_samples(record, stream, out=None):
+    """
+    Decode the samples of a record, closed records are served from and added
+    to the sample cache
+
+    :param out: optional preallocated array (see get_sample_count()), samples are
+                written to the start of it
+    :return: samples, a view of out if given. Without out cached samples are
+             returned as is and must not be modified
+    """
+    cache = get_sample_cache()
+    cached = cache.get(record, stream)
+    if cached is not None:
+        if out is None:
+            return cached
+        out[:len(cached)] = cached
+        return out[:len(cached)]
+    samples = decode_samples(stream.stream_type, stream.data_format, get_bindata(record), out)
+    cache.put(record, stream, samples)
+    return samples
+
+
+def get_samples_range(record, stream, first, last, out=None):
+    """
+    Decode samples [first, last) of a record. Indexed compressed records only
+    decode the frames covering the range, other records are decoded in full.
+
+    :param out: optional preallocated array, samples are written to the start of it
+    :return: samples, a view of out if given
+    """
+    return decode_samples_range(stream.stream_type, stream.data_format, get_bindata(record),
+                                record.frame_index, first, last, out)
 
 
 def load_all_bindata(records):
     local_ids = {}
+    segment_ids = {}
+    blob_ids = {}
     for r in records:
         if r.datastore == 1 and r.bindata_cached == None:
             local_ids[r.uuid] = r
+        elif r.datastore == SensorRecord2.DATASTORE_SEGMENTS and r.segments_cached == None:
+            segment_ids[r.uuid] = r
+        elif r.datastore == SensorRecord2.DATESTORE_S3 and r.blob_cached == None:
+            blob_ids[bytes(r.uuid)] = r
 
     if len(local_ids):
         bindata = SensorBinData.query.filter(SensorBinData.uuid.in_(local_ids.keys())).all()
         for data in bindata:
             local_ids[data.uuid].bindata_cached = data
+
+    if len(segment_ids):
+        for r in segment_ids.values():
+            r.segments_cached = []
+        segments = SensorBinSegment.query.filter(SensorBinSegment.uuid.in_(segment_ids.keys()))\
+            .order_by(SensorBinSegment.uuid, SensorBinSegment.seq).all()
+        for segment in segments:
+            segment_ids[segment.uuid].segments_cached.append(segment)
+
+    if len(blob_ids):
+        for key, data in get_blob_store().get_many(blob_ids.keys()).items():
+            blob_ids[key].blob_cached = data
@@ -1,5 +1,7 @@
 from datetime import timedelta
+from sqlalchemy import func
 from components import db
+from math.clock import ClockModel
 
 
 class SyncEvent(db.Model):
@@ -26,3 +28,77 @@ class TimeSync(db.Model):
 
     def tx_to_utc(self, timestamp_tx):
         return self.server_time + timedelta(seconds=((timestamp_tx - self.timestamp_tx) * 0.01))
+
+
+_clock_models = {}
+CLOCK_MODEL_CACHE_SIZE = 1000
+
+
+def get_clock_model(session_id, latest=None):
+    """
+    Cached ClockModel of a session, rebuilt when a time sync was added since it
+    was built (here or by another process)
+
+    :param latest: the newest TimeSync of the session if already known, saves a query
+    :return: ClockModel, None if the session has no time syncs
+    """
+    if latest is not None:
+        key = (latest.timestamp_tx, None)
+    else:
+        key = db.session.query(func.max(TimeSync.timestamp_tx), func.count(TimeSync.timestamp_tx))\
+            .filter(TimeSync.session_id == session_id).one()
+        key = (key[0], key[1])
+    cached = _clock_models.get(session_id)
+    if cached is not None and cached[0][0] == key[0] and (key[1] is None or cached[0][1] == key[1]):
+        return cached[1]
+    if key[0] is None:
+        return None
+
+    timesyncs = TimeSync.query.filter(TimeSync.session_id == session_id).order_by(TimeSync.timestamp_tx).all()
+    return _cache_clock_model(session_id, timesyncs)
+
+
+def get_clock_models(session_ids):
+    """
+    Batched get_clock_model(), one query to validate the cached models and one
+    to load the time syncs of all sessions that need a new model
+
+    :return: dict session_id -> ClockModel, sessions without time syncs are left out
+    """
+    session_ids = list(set(session_ids))
+    if len(session_ids) == 0:
+        return {}
+    keys = db.session.query(TimeSync.session_id, func.max(TimeSync.timestamp_tx), func.count(TimeSync.timestamp_tx))\
+        .filter(TimeSync.session_id.in_(session_ids)).group_by(TimeSync.session_id).all()
+    models = {}
+    stale = []
+    for session_id, max_tx, count in keys:
+        cached = _clock_models.get(session_id)
+        if cached is not None and cached[0] == (max_tx, count):
+            models[session_id] = cached[1]
+        else:
+            stale.append(session_id)
+    if len(stale):
+        timesyncs = {session_id: [] for session_id in stale}
+        for ts in TimeSync.query.filter(TimeSync.session_id.in_(stale)).order_by(TimeSync.session_id, TimeSync.timestamp_tx):
+            timesyncs[ts.session_id].append(ts)
+        for session_id in stale:
+            model = _cache_clock_model(session_id, timesyncs[session_id])
+            if model is not None:
+                models[session_id] = model
+    return models
+
+
+def _cache_clock_model(session_id, timesyncs):
+    if len(timesyncs) == 0:
+        return None
+    model = ClockModel.from_timesyncs(timesyncs)
+    _clock_models.pop(session_id, None)
+    if len(_clock_models) >= CLOCK_MODEL_CACHE_SIZE:
+        del _clock_models[next(iter(_clock_models))]
+    _clock_models[session_id] = ((int(model.sync_tx[-1]), len(model)), model)
+    return model
+
+
+def invalidate_clock_model(session_id):
+    _clock_models.pop(session_id, None)
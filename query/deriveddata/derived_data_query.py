@@ -1,8 +1,6 @@
 import json
-import pickle
 from datetime import timedelta, datetime
 import time
-import lz4.frame
 import numpy
 from components import db
 from flaskapp import app
@@ -10,8 +8,10 @@ from math.algorithm.algorithms import AlgorithmMeta, Algorithms, Algorithm
 from models import CacheDerivedData
 from models.cache.cache_queue_entry import CacheQueueEntry
 from query.sensordata.sensor_query import extend_sensors_remote_details
-from query.sensordata.sensordata_query import fetch_sensor_data_bundle_for_sensor
+from query.sensordata.sensordata_query import fetch_sensor_data_bundles
+from types.bundle_container import loads_bundle
 from types.derived_data import DerivedData
+from types.sensor_data import SensorData2
 from types.sensor_data_bundle import SensorDataBundle
 from utils import time_int_mult, floor_time_to, ceil_time_to, unixts, floor_datetime, datetime_matches
 
@@ -55,7 +55,7 @@ def fetch_cached_derived_data_hour(sensor_map, alg_profile, parameters, start_ti
     entry = CacheDerivedData.query.get(cache_id)
 
     if entry is not None:
-        return pickle.loads(lz4.frame.decompress(entry.data))
+        return loads_bundle(entry.data)
     else:
         start_time_day = floor_datetime(start_time, 'day')
         cache_q_id = CacheDerivedData.make_cache_id(sensor_map, alg_profile, start_time_day)
@@ -116,10 +116,14 @@ def generate_derived_data(sensor_device_map, profile, parameters, start_time, en
     if isinstance(sensor_device_map, list):
         sensor_device_map = {x: v for x,v in zip(alg.__place__, sensor_device_map)}
 
+    # All placements (e.g. person/thigh + person/chest) are fetched and decoded together
+    bundles = fetch_sensor_data_bundles(list(sensor_device_map.values()), start_time - timedelta(minutes=5),
+                                        end_time + timedelta(minutes=5), 'acc/3ax/4g', window_s=90,
+                                        with_idle=alg.supports_idle_chunks())
     any_empty = False
     data_map = {}
     for p, sd in sensor_device_map.items():
-        sensor_data = fetch_sensor_data_bundle_for_sensor(sd, start_time - timedelta(minutes=5), end_time + timedelta(minutes=5), 'acc/3ax/4g', window_s=90)
+        sensor_data = bundles[sd.id]
         any_empty |= not sensor_data.has_data()
         data_map[p] = sensor_data
 
@@ -135,6 +139,67 @@ def generate_derived_data(sensor_device_map, profile, parameters, start_time, en
         assert(len(data_map) <= 2)
 
 
+def _hour_bundle(hour_start, parts):
+    """SensorDataBundle of an hour from the DerivedData parts of its chunks"""
+    bundle = SensorDataBundle(start_time=hour_start, end_time=hour_start + timedelta(hours=1), stream_type='derived')
+    parts = [d for d in parts if d.has_data()]
+    if len(parts) != 0:
+        source = SensorData2(unixts(hour_start), unixts(hour_start + timedelta(hours=1)), None, None, None)
+        bundle.add(DerivedData(derived_type=parts[0].derived_type, data=numpy.concatenate([d.data for d in parts]),
+                               source=source, ts=numpy.concatenate([d.ts for d in parts])))
+    return bundle
+
+
+def generate_derived_data_hours(sensor_device_map, profile, parameters, hour_starts):
+    """
+    generate_derived_data() of many hours as one continuous stream, see
+    Algorithm.analyse_stream(). Every hour is fetched once without padding,
+    the chunks of consecutive hours line up as if the run was analysed in one
+    call. A chunk belongs to the hour it starts in.
+
+    params:
+        sensor_map  - Dict object [placement -> sensor_device]
+        hour_starts - increasing datetime objects on the hour, consecutive
+                      hours are streamed, a missing hour restarts the stream
+    return:
+        generator of (hour start, SensorDataBundle)
+    """
+    alg = Algorithms.get(profile.algorithm)
+    hour = timedelta(hours=1)
+
+    if isinstance(sensor_device_map, list):
+        sensor_device_map = {x: v for x,v in zip(alg.__place__, sensor_device_map)}
+
+    state = None
+    pending = None  # (hour start, parts), completed by chunks that start in it and end in the next hour
+    for hour_start in hour_starts:
+        if pending is not None and pending[0] + hour != hour_start:
+            yield pending[0], _hour_bundle(*pending)
+            pending = None
+            state = None
+
+        # Window bounds are exclusive and ts integer ms, so [hour_start, hour_start + hour)
+        bundles = fetch_sensor_data_bundles(list(sensor_device_map.values()), hour_start - timedelta(milliseconds=1),
+                                            hour_start + hour, 'acc/3ax/4g', with_idle=alg.supports_idle_chunks())
+        data_map = {p: bundles[sd.id] for p, sd in sensor_device_map.items()}
+        derived, state = alg.analyse_stream(data_map, parameters, state)
+
+        parts = []
+        if derived is not None:
+            split = int(numpy.searchsorted(derived.ts, unixts(hour_start), side='left'))
+            if pending is not None and split > 0:
+                pending[1].append(DerivedData(derived_type=derived.derived_type, data=derived.data[:split],
+                                              source=derived.source, ts=derived.ts[:split]))
+            parts.append(DerivedData(derived_type=derived.derived_type, data=derived.data[split:],
+                                     source=derived.source, ts=derived.ts[split:]))
+        if pending is not None:
+            yield pending[0], _hour_bundle(*pending)
+        pending = (hour_start, parts)
+
+    if pending is not None:
+        yield pending[0], _hour_bundle(*pending)
+
+
 def check_derived_data_bins(sensor_map, profile, parameters, start_time, hours=24, bins_per_hour=4, override_cache=False):
 
     hour = timedelta(hours=1)
@@ -189,15 +254,18 @@ def fetch_derived_data_bins(sensor_map, alg_profile, parameters, start_time, hou
             notReady = True
             hour_cnt += hour
             continue
+        data = derived_data.get_data()
+        if data.has_data():
+            # All bins of the hour in one lookup
+            bin_starts = [hour_cnt + bin_width * i for i in range(int(hour / bin_width))]
+            bin_windows = data.derived_windows(bin_starts, [bin_start + bin_width for bin_start in bin_starts])
         delta = timedelta(0)
+        bin_idx = 0
         while delta < hour:
-            data = derived_data.get_data()
-
             sum = 0
             values = {}
             if data.has_data():
-                window_derived = derived_data.get_data().derived_window(
-                    hour_cnt + delta, hour_cnt + delta + bin_width)
+                window_derived = bin_windows[bin_idx]
                 summed = numpy.sum(window_derived, axis=0)
                 #print(hour_cnt + delta, summed)
 
@@ -236,6 +304,7 @@ def fetch_derived_data_bins(sensor_map, alg_profile, parameters, start_time, hou
                         'summary': values
                         })
             delta += bin_width
+            bin_idx += 1
         hour_cnt += hour
     return out if not notReady else DataNotReady
 
@@ -0,0 +1,49 @@
+import numpy
+from math.aggregate import PYRAMID_AGGREGATES, aggregate_pyramid, aggregate_samples, pyramid_level_for
+from math.decode import empty_samples
+from math.pyramid import PYRAMID_LEVELS_MS
+from query.sensordata.pyramid_query import fetch_sensor_pyramid
+from query.sensordata.sensordata_query import fetch_sensor_data_bundle_for_sensor
+from types.sensor_data import sample_scale
+from utils import unixts
+
+
+def fetch_sensor_aggregate(sensor, start_time, end_time, stream_type, bucket_ms, aggregate, percentile=50.0):
+    """
+    Aggregate of a sensor stream in buckets of bucket_ms from start_time to
+    end_time. Served from the pyramid when one of its levels nests in the
+    buckets and holds the aggregate, otherwise from the decoded samples.
+
+    :param aggregate: one of math.aggregate.AGGREGATES
+    :return: bucket start ts numpy int64, values numpy float64 [buckets, axes] in
+             SensorData2.samples() units, only buckets with samples
+    """
+    start_ts = unixts(start_time)
+    end_ts = unixts(end_time)
+    axes = empty_samples(stream_type, 0).shape[1]
+
+    level_ms = None
+    if aggregate in PYRAMID_AGGREGATES:
+        level_ms = pyramid_level_for(start_ts, end_ts, bucket_ms, PYRAMID_LEVELS_MS)
+
+    if level_ms is not None:
+        parts = fetch_sensor_pyramid(sensor, start_time, end_time, stream_type, level_ms)
+        if len(parts) == 0:
+            return numpy.zeros(0, dtype=numpy.int64), numpy.zeros((0, axes))
+        # Parts of several sessions or streams can overlap, bucketing needs increasing ts
+        buckets = numpy.concatenate(parts)
+        buckets = buckets[numpy.argsort(buckets['ts'], kind='mergesort')]
+        bucket_ts, values = aggregate_pyramid(buckets, start_ts, bucket_ms, aggregate)
+    else:
+        data_bundle = fetch_sensor_data_bundle_for_sensor(sensor, start_time, end_time, stream_type)
+        if not data_bundle.has_data():
+            return numpy.zeros(0, dtype=numpy.int64), numpy.zeros((0, axes))
+        ts = numpy.concatenate([d.ts for d in data_bundle])
+        data = numpy.concatenate([d.data for d in data_bundle])
+        order = numpy.argsort(ts, kind='mergesort')
+        ts, data = ts[order], data[order]
+        bucket_ts, values = aggregate_samples(ts, data, start_ts, bucket_ms, aggregate, percentile)
+
+    if aggregate != 'count':
+        values *= sample_scale(stream_type)
+    return bucket_ts, values
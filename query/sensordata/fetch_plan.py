@@ -0,0 +1,113 @@
+import threading
+from sqlalchemy import event, or_
+from components import db
+from models import Session2, Stream2, SensorRecord2, get_clock_models, load_all_bindata
+from models.sensordata.sample_cache import get_sample_cache
+
+_sql_counter = threading.local()
+
+
+@event.listens_for(db.get_engine(bind='sensordata'), 'after_execute', named=True)
+def _count_plan_sql(**kw):
+    if getattr(_sql_counter, 'count', None) is not None:
+        _sql_counter.count += 1
+
+
+class FetchPlan(object):
+    """
+    Everything needed to fetch the sensor data of one or many sensors in an
+    interval, resolved in a fixed number of batched queries: sessions, streams,
+    clock models, records and bin_data
+
+    With skip_cached the bin_data of records whose samples are held by the
+    process sample cache is not loaded (get_bindata() still loads it on demand).
+    """
+
+    def __init__(self, sensors, start_time, end_time, stream_type, with_bindata=True, skip_cached=False):
+        self.sensors = sensors
+        self.start_time = start_time
+        self.end_time = end_time
+        self.stream_type = stream_type
+        self.with_bindata = with_bindata
+        self.skip_cached = skip_cached
+
+        self.sessions = {}  # sensor id -> [Session2] ordered by start_time
+        self.streams = {}  # session id -> [Stream2]
+        self.clocks = {}  # session id -> ClockModel
+        self.records = {}  # stream id -> [SensorRecord2] ordered by timestamp_tx
+        self.sql_count = 0  # Queries run by resolve() against the sensordata database
+
+    def resolve(self):
+        _sql_counter.count = 0
+        try:
+            self._resolve()
+        finally:
+            self.sql_count = _sql_counter.count
+            _sql_counter.count = None
+        return self
+
+    def _resolve(self):
+        sensor_ids = [s.id for s in self.sensors]
+        self.sessions = {sensor_id: [] for sensor_id in sensor_ids}
+        if len(sensor_ids) == 0:
+            return
+
+        # todo: important! sensor access check
+        sessions = Session2.query.filter(Session2.motion_device_id.in_(sensor_ids)) \
+            .filter(Session2.start_time < self.end_time) \
+            .filter((Session2.end_time > self.start_time) | (Session2.end_time == None)) \
+            .order_by(Session2.start_time).all()
+        for s in sessions:
+            self.sessions[s.motion_device_id].append(s)
+            self.streams[s.id] = []
+        if len(sessions) == 0:
+            return
+
+        streams = Stream2.query.filter(Stream2.session_id.in_(self.streams.keys())) \
+            .filter(Stream2.stream_type == self.stream_type).all()
+        for stream in streams:
+            self.streams[stream.session_id].append(stream)
+            self.records[stream.id] = []
+        if len(streams) == 0:
+            return
+
+        self.clocks = get_clock_models([stream.session_id for stream in streams])
+
+        # Streams of sessions without time syncs are left out by stream_parts(), the
+        # others are matched with the clock model of their session (see SensorRecord2.overlapping())
+        session_streams = {}
+        for stream in streams:
+            if stream.session_id in self.clocks:
+                session_streams.setdefault(stream.session_id, []).append(stream.id)
+        if len(session_streams) == 0:
+            return
+        records = SensorRecord2.query.filter(SensorRecord2.stream_id.in_(self.records.keys())) \
+            .filter(or_(*[SensorRecord2.stream_id.in_(stream_ids) &
+                          SensorRecord2.overlapping(self.start_time, self.end_time, self.clocks[session_id])
+                          for session_id, stream_ids in session_streams.items()])) \
+            .order_by(SensorRecord2.stream_id, SensorRecord2.timestamp_tx).all()
+        for r in records:
+            self.records[r.stream_id].append(r)
+
+        if self.with_bindata:
+            if self.skip_cached:
+                # Legacy single blob records are still needed to detect truncated blobs
+                streams_by_id = {stream.id: stream for stream in streams}
+                cache = get_sample_cache()
+                records = [r for r in records if r.datastore == SensorRecord2.DATASTORE_LOCAL
+                           or cache.peek(r, streams_by_id[r.stream_id]) is None]
+            load_all_bindata(records)
+
+    def stream_parts(self, sensor):
+        """
+        :return: [(stream, records, clock)] of the sensor, in session order,
+                 streams of sessions without time syncs are left out
+        """
+        parts = []
+        for session in self.sessions.get(sensor.id, []):
+            clock = self.clocks.get(session.id)
+            if clock is None:
+                continue
+            for stream in self.streams[session.id]:
+                parts.append((stream, self.records[stream.id], clock))
+        return parts
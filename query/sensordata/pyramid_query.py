@@ -0,0 +1,162 @@
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
+from components import db
+from flaskapp import app
+from math.decode import empty_samples, segment_bounds
+from math.pyramid import PYRAMID_LEVELS_MS, bucket_stats, load_pyramid, merge_buckets
+from models import SensorRecord2, SensorRecordPyramid, Stream2, get_clock_models, load_all_bindata
+from models.sensordata.blob_store import SizedLRU
+from query.sensordata.fetch_plan import FetchPlan
+from query.sensordata.sensordata_query import _combine_records
+from utils import unixts
+
+
+def build_record_pyramid(record, stream, clock):
+    """
+    Decode a record and compute every pyramid level
+
+    :return: dict level_ms -> pyramid_dtype array
+    """
+    ts, samples, _ = _combine_records([record], stream, clock)
+    return {level_ms: bucket_stats(ts, samples, level_ms) for level_ms in PYRAMID_LEVELS_MS}
+
+
+def store_record_pyramid(record, levels):
+    for level_ms, buckets in levels.items():
+        db.session.merge(SensorRecordPyramid(stream_id=record.stream_id, timestamp_tx=record.timestamp_tx,
+                                             level_ms=level_ms, timestamp_tx_end=record.timestamp_tx_end,
+                                             data=buckets.tobytes()))
+
+
+_built_pyramids = None
+
+
+def _built_pyramid_cache():
+    """
+    Levels built on a request, of the open record and of closed records the
+    pyramid worker has not reached yet. Keyed by record, valid for the
+    timestamp_tx_end and clock model they were built with.
+    """
+    global _built_pyramids
+    if _built_pyramids is None:
+        _built_pyramids = SizedLRU(app.config.get('PYRAMID_CACHE_BYTES', 0),
+                                   sizeof=lambda entry: sum(level.nbytes for level in entry[1].values()))
+    return _built_pyramids
+
+
+def fetch_stream_pyramid(stream, records, clock, level_ms):
+    """
+    One pyramid level of records of a stream. Records without a (current)
+    stored pyramid are decoded and kept in a process cache until they grow or
+    the clock model changes, nothing is stored (see build_pending_pyramids()).
+
+    :return: dict timestamp_tx -> pyramid_dtype array
+    """
+    axes = empty_samples(stream.stream_type, 0).shape[1]
+    stored = SensorRecordPyramid.query.filter(SensorRecordPyramid.stream_id == stream.id) \
+        .filter(SensorRecordPyramid.level_ms == level_ms) \
+        .filter(SensorRecordPyramid.timestamp_tx.in_([r.timestamp_tx for r in records])).all()
+    stored = {p.timestamp_tx: p for p in stored}
+
+    cache = _built_pyramid_cache()
+    clock_key = (int(clock.sync_tx[-1]), len(clock))
+    levels = {}
+    missing = []
+    for r in records:
+        p = stored.get(r.timestamp_tx)
+        built = cache.get((stream.id, r.timestamp_tx))
+        if p is not None and p.timestamp_tx_end == r.timestamp_tx_end:
+            levels[r.timestamp_tx] = load_pyramid(p.data, axes)
+        elif built is not None and built[0] == (r.timestamp_tx_end, clock_key):
+            levels[r.timestamp_tx] = built[1][level_ms]
+        else:
+            missing.append(r)
+
+    load_all_bindata(missing)
+    for r in missing:
+        record_levels = build_record_pyramid(r, stream, clock)
+        cache.put((stream.id, r.timestamp_tx), ((r.timestamp_tx_end, clock_key), record_levels))
+        levels[r.timestamp_tx] = record_levels[level_ms]
+    return levels
+
+
+def fetch_sensor_pyramid(sensor, start_time, end_time, stream_type, level_ms):
+    """
+    Downsampled counterpart of fetch_sensor_data_bundle_for_sensor(), only
+    reads bin_data of records whose pyramid has not been built yet
+
+    :param level_ms: one of PYRAMID_LEVELS_MS, see pick_level()
+    :return: list of pyramid_dtype arrays, one per contiguous run of records
+    """
+    plan = FetchPlan([sensor], start_time, end_time, stream_type, with_bindata=False).resolve()
+    start_ts = unixts(start_time)
+    end_ts = unixts(end_time)
+
+    parts = []
+    for stream, records, clock in plan.stream_parts(sensor):
+        if len(records) == 0:
+            continue
+        levels = fetch_stream_pyramid(stream, records, clock, level_ms)
+        axes = empty_samples(stream.stream_type, 0).shape[1]
+        segments = segment_bounds([r.timestamp_tx for r in records], [r.timestamp_tx_end for r in records], 10000)
+        for begin, end in segments:
+            buckets = merge_buckets([levels[r.timestamp_tx] for r in records[begin:end]], axes)
+            buckets = buckets[(buckets['ts'] + level_ms > start_ts) & (buckets['ts'] < end_ts)]
+            if len(buckets):
+                parts.append(buckets)
+
+    return parts
+
+
+def records_without_pyramid():
+    """Query of the closed records that have no current stored pyramid (reopened records are outdated)"""
+    return SensorRecord2.query.join(Stream2, Stream2.id == SensorRecord2.stream_id)\
+        .outerjoin(SensorRecordPyramid, and_(SensorRecordPyramid.stream_id == SensorRecord2.stream_id,
+                                             SensorRecordPyramid.timestamp_tx == SensorRecord2.timestamp_tx,
+                                             SensorRecordPyramid.level_ms == PYRAMID_LEVELS_MS[0],
+                                             SensorRecordPyramid.timestamp_tx_end == SensorRecord2.timestamp_tx_end))\
+        .filter(SensorRecordPyramid.stream_id == None)\
+        .filter((Stream2.open_record_tx == None) | (Stream2.open_record_tx != SensorRecord2.timestamp_tx))
+
+
+def build_missing_pyramids(records):
+    """
+    Store the pyramids of closed records that have none yet
+
+    :return: number of records built
+    """
+    streams = {s.id: s for s in Stream2.query.filter(Stream2.id.in_(set(r.stream_id for r in records))).all()}
+    clocks = get_clock_models([s.session_id for s in streams.values()])
+    built = 0
+    load_all_bindata(records)
+    for r in records:
+        stream = streams[r.stream_id]
+        clock = clocks.get(stream.session_id)
+        if clock is None or r.timestamp_tx == stream.open_record_tx:
+            continue
+        store_record_pyramid(r, build_record_pyramid(r, stream, clock))
+        built += 1
+    return built
+
+
+def build_pending_pyramids(batch_size):
+    """
+    Worker step, store the pyramids of the most recent closed records that
+    have none: records that closed since the last step, or whose pyramid was
+    dropped because the clock model of their session changed (see
+    invalidate_record_pyramids()). Records of sessions without time syncs have
+    no utc_start and are left to the backfill.
+
+    :return: number of records built
+    """
+    records = records_without_pyramid().filter(SensorRecord2.utc_start != None)\
+        .order_by(SensorRecord2.utc_start.desc()).limit(batch_size).all()
+    if len(records) == 0:
+        return 0
+    built = build_missing_pyramids(records)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored the same pyramids first, they are equal
+        db.session.rollback()
+    return built
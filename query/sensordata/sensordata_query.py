@@ -1,5 +1,10 @@
-from models import Session2, TimeSync, SensorRecord2, get_samples, load_all_bindata
-from datetime import datetime, timedelta
+from flaskapp import app
+from math.compress import idle_runs_mask, load_index
+from math.decode import idle_mask_range, segment_bounds, window_jobs
+from math.decode_pool import DecodeExecutor
+from query.sensordata.fetch_plan import FetchPlan
+from models.sensordata.sample_cache import get_sample_cache
+from models import Session2, SensorRecord2, SensorRecordSummary, get_bindata, get_sample_count, get_clock_model, load_all_bindata
 from types.sensor_data import SensorData2
 from types.sensor_data_bundle import SensorDataBundle
 from utils import unixts, tx_format
@@ -23,29 +28,17 @@ def fetch_records_for_stream(stream, period_start, period_end):
     :param stream: 
     :param period_start: 
     :param period_end: 
-    :return: [records], epoch
+    :return: [records], clock model of the session
     """
-
-    timestamp = period_start
-
-    # Find time offset
-    timesync = TimeSync.query.filter(TimeSync.session_id == stream.session.id).filter(TimeSync.server_time <= timestamp).order_by(TimeSync.server_time.desc()).first()
-
-    print("1", timesync)
-    if timesync is None or period_start - timesync.server_time > timedelta(hours=2):
-        timesync2 = TimeSync.query.filter(TimeSync.session_id == stream.session.id).filter(TimeSync.server_time > timestamp).order_by(TimeSync.server_time).first()
-        print("2", timesync2)
-        if timesync2 is not None:
-            if timesync is None or period_start - timesync.server_time > timesync2.server_time - period_start:
-                timesync = timesync2
-    if timesync is None:
+    clock = get_clock_model(stream.session_id)
+    if clock is None:
         return None, None
 
-    epoch = timesync.server_time - timedelta(seconds=timesync.timestamp_tx*0.01)
-
-    period_start_tx = max(0, (period_start - epoch).total_seconds()*100 - 25*60*100)
-    period_end_tx = (period_end - epoch).total_seconds()*100
-    return fetch_records_for_stream_tx(stream, period_start_tx, period_end_tx), epoch
+    records = SensorRecord2.query.filter(SensorRecord2.stream_id == stream.id)\
+        .filter(SensorRecord2.overlapping(period_start, period_end, clock))\
+        .order_by(SensorRecord2.timestamp_tx).all()
+    load_all_bindata(records)
+    return records, clock
 
 
 def fetch_records_for_stream_tx(stream, start_tx, end_tx):
@@ -54,69 +47,200 @@ def fetch_records_for_stream_tx(stream, start_tx, end_tx):
     return records
 
 
+def fetch_record_summaries_for_stream_tx(stream, start_tx, end_tx):
+    """
+    Summaries of the records in the interval, no bin_data is loaded
+
+    :return: [SensorRecordSummary] ordered by timestamp_tx
+    """
+    return SensorRecordSummary.query.filter(SensorRecordSummary.stream_id == stream.id) \
+        .filter(SensorRecordSummary.timestamp_tx > start_tx) \
+        .filter(SensorRecordSummary.timestamp_tx < end_tx) \
+        .order_by(SensorRecordSummary.timestamp_tx).all()
+
+
+def summary_envelope(summaries):
+    """
+    Combine record summaries into one envelope
+
+    :return: dict with sample_count, per axis min/max/mean and mag_min/mag_max, None if empty
+    """
+    summaries = [s for s in summaries if s.sample_count]
+    if len(summaries) == 0:
+        return None
+    counts = numpy.array([s.sample_count for s in summaries], dtype=numpy.float64)
+    envelope = {'sample_count': int(numpy.sum(counts)),
+                'mag_min': min(s.mag_min for s in summaries),
+                'mag_max': max(s.mag_max for s in summaries)}
+    for axis in SensorRecordSummary.AXES:
+        if getattr(summaries[0], axis + '_min') is None:
+            continue
+        envelope[axis + '_min'] = min(getattr(s, axis + '_min') for s in summaries)
+        envelope[axis + '_max'] = max(getattr(s, axis + '_max') for s in summaries)
+        envelope[axis + '_mean'] = float(numpy.dot([getattr(s, axis + '_mean') for s in summaries], counts) / numpy.sum(counts))
+    return envelope
+
+
+_decode_executor = None
+
+
+def get_decode_executor():
+    """Process wide DecodeExecutor, configured by DECODE_WORKERS and DECODE_PARALLEL_MIN_SAMPLES"""
+    global _decode_executor
+    if _decode_executor is None:
+        _decode_executor = DecodeExecutor(workers=app.config.get('DECODE_WORKERS', 0),
+                                          min_samples=app.config.get('DECODE_PARALLEL_MIN_SAMPLES', 100000))
+    return _decode_executor
+
+
 # New todo: not really view specific
-def _combine_records(records, stream, epoch):
-    if len(records) == 0:
-        return numpy.array([]), numpy.array([])
-    samples = []
-    last_record_len = 0
-    last_r = None
-    consumed = 0
+def _combine_records(records, stream, clock, start_ts=None, end_ts=None, with_idle=False):
+    """
+    Combine a run of contiguous records (see segment_bounds()) into one array
+
+    :param start_ts, end_ts: optional unix ms bounds (exclusive), only samples
+                             within them are decoded
+    :param with_idle: also return the idle sample mask read from the frame tables
+    :return: ts, samples, idle mask (None unless with_idle)
+    """
+    ts, jobs = _plan_records(records, stream, clock, start_ts, end_ts)
+    all_samples = _decode_jobs(stream.stream_type, stream.data_format,
+                               [(stream,) + job for job in jobs], len(ts))
+    idle = _idle_mask(stream, jobs, len(ts)) if with_idle else None
+    return ts, all_samples, idle
+
+
+def _plan_records(records, stream, clock, start_ts=None, end_ts=None):
+    """
+    Timestamps and decode jobs of the samples of a run of contiguous records
+    within start_ts, end_ts
+
+    :return: ts, jobs [(record, record sample count, first, last, row)]
+    """
+    # Sizing pass, how many samples each record holds
+    counts = []
+    padding = []
     for r in records:
-        if last_r is not None and r.timestamp_tx > last_r.timestamp_tx_end + 10000:
-            break
-        last_r = r
-        consumed += 1
-        s = get_samples(r, stream)
-        samples.append(s)
-        last_record_len = len(s[:, 0])
-        # HACK FOR BUFFER OVERRUN
-        if len(r.bindata_cached.bin_data) == 65535:
+        count = get_sample_count(r, stream)
+        missing_cnt = 0
+        # HACK FOR BUFFER OVERRUN, single blob records were truncated by the column size
+        if r.datastore == SensorRecord2.DATASTORE_LOCAL and len(get_bindata(r)) == 65535:
             expected_cnt = int((r.timestamp_tx_end - r.timestamp_tx) / 100 * 90)
-            missing_cnt = expected_cnt - len(s)
-            if missing_cnt > 0:
-                samples.append(numpy.zeros((missing_cnt, 3)))
-                last_record_len += missing_cnt
+            missing_cnt = max(0, expected_cnt - count)
+        counts.append(count)
+        padding.append(missing_cnt)
+    total = sum(counts) + sum(padding)
+
+    # Timestamps interpolated between the start of each record (or the packets of indexed records) and the end
+    anchor_sample = []
+    anchor_tx = []
+    offset = 0
+    for r, count, missing_cnt in zip(records, counts, padding):
+        if r.frame_index is not None:
+            index = load_index(r.frame_index)[:-1]
+            index = index[index['tx'] > 0]
+            anchor_sample.append(index['sample'] + offset)
+            anchor_tx.append(index['tx'])
+        else:
+            anchor_sample.append([offset])
+            anchor_tx.append([r.timestamp_tx])
+        offset += count + missing_cnt
+    anchor_sample.append([total])
+    anchor_tx.append([records[-1].timestamp_tx_end])
+    anchor_sample = numpy.concatenate(anchor_sample)
+    anchor_tx = numpy.concatenate(anchor_tx)
+
+    # Only compute timestamps around the window, the full range if the estimate is off
+    lo = 0 if start_ts is None else int(min(max(clock.ms_to_sample(anchor_sample, anchor_tx, start_ts) - 2, 0), total))
+    hi = total if end_ts is None else int(min(max(clock.ms_to_sample(anchor_sample, anchor_tx, end_ts) + 3, lo), total))
+    ts = clock.sample_ms(anchor_sample, anchor_tx, lo, hi)
+    if (lo > 0 and (len(ts) == 0 or ts[0] > start_ts)) or (hi < total and (len(ts) == 0 or ts[-1] < end_ts)):
+        lo, hi = 0, total
+        ts = clock.sample_ms(anchor_sample, anchor_tx, lo, hi)
+
+    # Timestamps are known before decoding, so only the selected samples are decoded
+    first = lo if start_ts is None else lo + int(numpy.searchsorted(ts, start_ts, side='right'))
+    last = hi if end_ts is None else lo + int(numpy.searchsorted(ts, end_ts, side='left'))
+    last = max(first, last)
 
-    all_samples = numpy.vstack(samples)
-    if len(records) > 1:
-        period = ((last_r.timestamp_tx - records[0].timestamp_tx)*10.0)/(len(all_samples[:,0])-last_record_len)
-    else:
-        period = ((last_r.timestamp_tx_end - records[0].timestamp_tx)*10.0)/(len(all_samples[:,0]))
-    ts = (numpy.arange(len(all_samples[:,0]))*period).astype(numpy.int64) + unixts(epoch) + records[0].timestamp_tx * 10
-    return ts, all_samples, consumed
+    # Every record is decoded straight into its slot, padding stays zero
+    jobs = [(records[i], counts[i], r_lo, r_hi, row) for i, r_lo, r_hi, row in window_jobs(counts, padding, first, last)]
+    return ts[first - lo:last - lo], jobs
 
 
-def fetch_sensor_data_for_stream(data_bundle, stream, start_time, end_time, window_s):
+def _decode_jobs(stream_type, data_format, jobs, rows):
+    """
+    Decode jobs [(stream, record, count, first, last, row)] into one array.
+    Cached records are copied, the rest go to the DecodeExecutor and closed
+    records decoded in full are added to the sample cache.
+    """
+    cache = get_sample_cache()
+    cached = []
+    decode = []
+    for stream, record, count, first, last, row in jobs:
+        samples = cache.get(record, stream)
+        if samples is not None:
+            cached.append((samples[first:last], row))
+        else:
+            decode.append((stream, record, count, first, last, row))
+
+    out = get_decode_executor().decode(stream_type, data_format,
+                                       [(get_bindata(record), record.frame_index, first, last, row)
+                                        for stream, record, count, first, last, row in decode], rows)
+    for samples, row in cached:
+        out[row:row + len(samples)] = samples
+    for stream, record, count, first, last, row in decode:
+        if first == 0 and last == count:
+            cache.put(record, stream, out[row:row + count])
+    return out
+
+
+def _idle_mask(stream, jobs, rows):
+    idle = numpy.zeros(rows, dtype=bool)
+    for record, count, r_lo, r_hi, row in jobs:
+        if record.idle_runs is not None:
+            # Stored at ingest, no frame table to read
+            idle[row:row + r_hi - r_lo] = idle_runs_mask(record.idle_runs, r_lo, r_hi)
+        else:
+            idle[row:row + r_hi - r_lo] = idle_mask_range(stream.stream_type, stream.data_format,
+                                                          get_bindata(record), record.frame_index, r_lo, r_hi)
+    return idle
+
+
+def fetch_sensor_data_for_stream(data_bundle, stream, start_time, end_time, window_s, with_idle=False):
     """
     
     :param stream: 
     :param start_time: 
     :param end_time: 
+    :param with_idle: attach the idle sample mask to the SensorData2 parts
     :return: ts(numpy(1)), data(numpy(x,y) int64 ), shape
     """
     # Fetch records in interval here
-    records, epoch = fetch_records_for_stream(stream, start_time, end_time)
+    records, clock = fetch_records_for_stream(stream, start_time, end_time)
 
     if records is None:
         return
 
-    consumed = 0
-    while consumed < len(records):
-        ts, data, cons = _combine_records(records[consumed:], stream, epoch)
-        print(consumed, cons, len(records))
-        consumed += cons
-        select = (ts > unixts(start_time)-window_s*1000) & (ts < unixts(end_time)+window_s*1000)
-        data = data[select]
-        ts = ts[select].astype(numpy.int64)
+    add_stream_records(data_bundle, stream, records, clock, start_time, end_time, window_s, with_idle)
+
+
+def add_stream_records(data_bundle, stream, records, clock, start_time, end_time, window_s, with_idle=False):
+    """Decode records of a stream (bin_data already loaded) and add them to data_bundle"""
+    start_ts = unixts(start_time) - window_s*1000
+    end_ts = unixts(end_time) + window_s*1000
+    segments = segment_bounds([r.timestamp_tx for r in records], [r.timestamp_tx_end for r in records], 10000)
+    for begin, end in segments:
+        ts, data, idle = _combine_records(records[begin:end], stream, clock, start_ts, end_ts, with_idle)
+        if len(ts) == 0:
+            continue
         sensor_data = SensorData2(start_ts=ts[0], end_ts=ts[-1], ts=ts,
-                                  stream_type=stream.stream_type, data=data)
-        print(datetime.utcfromtimestamp(ts[0]/1000).isoformat(), datetime.utcfromtimestamp(ts[-1]/1000).isoformat())
+                                  stream_type=stream.stream_type, data=data, idle=idle)
         data_bundle.add(sensor_data)
 
 
 # Primary
-def fetch_sensor_data_bundle_for_sensor(sensor, start_time, end_time, stream_type, window_s=0):
+def fetch_sensor_data_bundle_for_sensor(sensor, start_time, end_time, stream_type, window_s=0, with_idle=False):
     """
     
     :param sensor: 
@@ -124,14 +248,57 @@ def fetch_sensor_data_bundle_for_sensor(sensor, start_time, end_time, stream_typ
     :param end_time:
     :param stream_type:
     :param window_s: 
+    :param with_idle: attach idle sample masks, see SensorData2.idle
     :return: SensorDataBundle
     """
-    # Find all sessions in interval
     data_bundle = SensorDataBundle(start_time, end_time, stream_type)
-    sessions = fetch_sessions_in_interval(sensor, start_time, end_time)
-    for s in sessions:
-        for stream in s.streams:
-            if stream.stream_type == stream_type:
-                fetch_sensor_data_for_stream(data_bundle, stream, start_time, end_time, window_s)
+    plan = FetchPlan([sensor], start_time, end_time, stream_type, skip_cached=not with_idle).resolve()
+    for stream, records, clock in plan.stream_parts(sensor):
+        add_stream_records(data_bundle, stream, records, clock, start_time, end_time, window_s, with_idle)
 
     return data_bundle
+
+
+def fetch_sensor_data_bundles(sensors, start_time, end_time, stream_type, window_s=0, with_idle=False):
+    """
+    fetch_sensor_data_bundle_for_sensor() for many sensors, the records of all
+    sensors are resolved by one FetchPlan and decoded in one DecodeExecutor
+    call per data format, so they are spread over its workers together
+
+    :return: dict sensor id -> SensorDataBundle
+    """
+    sensors = list({sensor.id: sensor for sensor in sensors}.values())
+    plan = FetchPlan(sensors, start_time, end_time, stream_type, skip_cached=not with_idle).resolve()
+    start_ts = unixts(start_time) - window_s*1000
+    end_ts = unixts(end_time) + window_s*1000
+
+    parts = []  # (sensor id, stream, ts, jobs) in the order they are added to the bundles
+    for sensor in sensors:
+        for stream, records, clock in plan.stream_parts(sensor):
+            segments = segment_bounds([r.timestamp_tx for r in records], [r.timestamp_tx_end for r in records], 10000)
+            for begin, end in segments:
+                ts, jobs = _plan_records(records[begin:end], stream, clock, start_ts, end_ts)
+                if len(ts) != 0:
+                    parts.append((sensor.id, stream, ts, jobs))
+
+    samples = [None] * len(parts)
+    for data_format in set(stream.data_format for _, stream, _, _ in parts):
+        group = [i for i, part in enumerate(parts) if part[1].data_format == data_format]
+        all_jobs = []
+        rows = 0
+        for i in group:
+            stream = parts[i][1]
+            all_jobs.extend((stream, record, count, lo, hi, row + rows) for record, count, lo, hi, row in parts[i][3])
+            rows += len(parts[i][2])
+        all_samples = _decode_jobs(stream_type, data_format, all_jobs, rows)
+        rows = 0
+        for i in group:
+            samples[i] = all_samples[rows:rows + len(parts[i][2])]
+            rows += len(parts[i][2])
+
+    bundles = {sensor.id: SensorDataBundle(start_time, end_time, stream_type) for sensor in sensors}
+    for (sensor_id, stream, ts, jobs), data in zip(parts, samples):
+        idle = _idle_mask(stream, jobs, len(ts)) if with_idle else None
+        bundles[sensor_id].add(SensorData2(start_ts=ts[0], end_ts=ts[-1], ts=ts,
+                                           stream_type=stream.stream_type, data=data, idle=idle))
+    return bundles
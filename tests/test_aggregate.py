@@ -0,0 +1,88 @@
+import numpy
+import pytest
+from bench.bench_compress import accelerometer_signal
+from math.aggregate import AGGREGATES, PYRAMID_AGGREGATES, aggregate_pyramid, aggregate_samples
+from math.pyramid import bucket_stats
+
+START_TS = 1577836800000
+BUCKET_MS = 10000
+
+
+def reference_aggregate(ts, samples, start_ts, bucket_ms, aggregate, percentile=50.0):
+    bucket = (ts - start_ts) // bucket_ms
+    bucket_ts, rows = [], []
+    for b in numpy.unique(bucket):
+        part = samples[bucket == b].astype(numpy.float64)
+        bucket_ts.append(b * bucket_ms + start_ts)
+        if aggregate == 'percentile':
+            rows.append(numpy.percentile(part, percentile, axis=0))
+        elif aggregate == 'count':
+            rows.append(numpy.full(samples.shape[1], float(len(part))))
+        else:
+            rows.append(getattr(numpy, aggregate)(part, axis=0))
+    return numpy.array(bucket_ts, dtype=numpy.int64), numpy.array(rows).reshape(-1, samples.shape[1])
+
+
+def gapped_signal(sample_count=6000, seed=3):
+    """Samples 80 ms apart with two gaps longer than a bucket, some exactly on bucket edges"""
+    data = accelerometer_signal(sample_count, seed=seed)
+    step = numpy.full(sample_count, 80, dtype=numpy.int64)
+    step[0] = 0
+    step[2000] += 3 * BUCKET_MS
+    step[4000] += 7 * BUCKET_MS + 20
+    return START_TS + numpy.cumsum(step), data
+
+
+@pytest.mark.parametrize('aggregate', AGGREGATES)
+def test_aggregate_samples_matches_numpy(aggregate):
+    ts, data = gapped_signal()
+    for start_ts in (START_TS, START_TS - 40, START_TS + 3):
+        expected_ts, expected = reference_aggregate(ts, data, start_ts, BUCKET_MS, aggregate, 90.0)
+        bucket_ts, values = aggregate_samples(ts, data, start_ts, BUCKET_MS, aggregate, 90.0)
+        assert numpy.array_equal(bucket_ts, expected_ts)
+        assert numpy.allclose(values, expected, rtol=1e-9, atol=1e-6)
+
+
+def test_bucket_edges_and_empty_buckets():
+    ts = START_TS + numpy.array([0, BUCKET_MS - 1, BUCKET_MS, 4 * BUCKET_MS - 1, 4 * BUCKET_MS], dtype=numpy.int64)
+    data = numpy.arange(len(ts) * 3, dtype=numpy.int16).reshape(-1, 3)
+    bucket_ts, values = aggregate_samples(ts, data, START_TS, BUCKET_MS, 'count')
+    # A sample on a bucket start belongs to that bucket, buckets without samples are left out
+    assert list(bucket_ts - START_TS) == [0, BUCKET_MS, 3 * BUCKET_MS, 4 * BUCKET_MS]
+    assert list(values[:, 0]) == [2, 1, 1, 1]
+    bucket_ts, values = aggregate_samples(ts[:0], data[:0], START_TS, BUCKET_MS, 'mean')
+    assert bucket_ts.dtype == numpy.int64 and values.shape == (0, 3)
+
+
+@pytest.mark.parametrize('aggregate', PYRAMID_AGGREGATES)
+def test_aggregate_pyramid_matches_samples(aggregate):
+    ts, data = gapped_signal()
+    start_ts = START_TS - START_TS % 60000
+    level = bucket_stats(ts, data, 1000)
+    bucket_ts, values = aggregate_pyramid(level, start_ts, 60000, aggregate)
+    expected_ts, expected = aggregate_samples(ts, data, start_ts, 60000, aggregate)
+    assert numpy.array_equal(bucket_ts, expected_ts)
+    assert numpy.allclose(values, expected, rtol=1e-6)
+    assert aggregate_pyramid(level[:0], start_ts, 60000, aggregate)[1].shape == (0, 3)
+
+
+def test_overlapping_parts_in_time_order():
+    # Two streams covering the same time, concatenated the way fetch_sensor_aggregate() gets them
+    ts, data = gapped_signal()
+    first, second = slice(0, 3000), slice(2500, 6000)
+    parts_ts = numpy.concatenate((ts[second], ts[first]))
+    parts_data = numpy.concatenate((data[second], data[first]))
+    order = numpy.argsort(parts_ts, kind='mergesort')
+    for aggregate in AGGREGATES:
+        expected_ts, expected = reference_aggregate(parts_ts, parts_data, START_TS, BUCKET_MS, aggregate)
+        bucket_ts, values = aggregate_samples(parts_ts[order], parts_data[order], START_TS, BUCKET_MS, aggregate)
+        assert numpy.array_equal(bucket_ts, expected_ts)
+        assert numpy.allclose(values, expected, rtol=1e-9, atol=1e-6)
+    levels = numpy.concatenate((bucket_stats(ts[second], data[second], 1000),
+                                bucket_stats(ts[first], data[first], 1000)))
+    levels = levels[numpy.argsort(levels['ts'], kind='mergesort')]
+    for aggregate in PYRAMID_AGGREGATES:
+        expected_ts, expected = reference_aggregate(parts_ts, parts_data, START_TS, BUCKET_MS, aggregate)
+        bucket_ts, values = aggregate_pyramid(levels, START_TS, BUCKET_MS, aggregate)
+        assert numpy.array_equal(bucket_ts, expected_ts)
+        assert numpy.allclose(values, expected, rtol=1e-6, atol=1e-5)
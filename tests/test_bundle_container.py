@@ -0,0 +1,79 @@
+import pickle
+from datetime import datetime
+import lz4.frame
+import numpy
+import pytest
+from bench.bench_compress import accelerometer_signal
+from bench.bench_container import OUTPUTS, derived_hour
+from types.bundle_container import BundleContainer, dumps_bundle, is_container, loads_bundle
+from types.sensor_data import SensorData2
+from types.sensor_data_bundle import SensorDataBundle
+
+START = datetime(2020, 1, 1)
+
+
+def mixed_bundle():
+    """A derived hour plus a raw part with an odd row count, so the arrays after it need padding"""
+    bundle = derived_hour(START, seed=3)
+    bundle.start_time, bundle.end_time = START, datetime(2020, 1, 1, 1)
+    data = accelerometer_signal(1001, seed=3).astype(numpy.int16)
+    ts = 1577836800000 + numpy.arange(len(data), dtype=numpy.int64) * 80
+    bundle.add(SensorData2(ts[0], ts[-1], ts, 'acc/3ax/4g', data))
+    return bundle
+
+
+def assert_parts_equal(loaded, bundle):
+    assert len(loaded.data) == len(bundle.data)
+    for got, part in zip(loaded.data, bundle.data):
+        assert type(got) is type(part)
+        assert (got.start_ts, got.end_ts) == (part.start_ts, part.end_ts)
+        assert numpy.array_equal(got.ts, part.ts) and got.ts.dtype == part.ts.dtype
+        assert numpy.array_equal(got.data, part.data) and got.data.dtype == part.data.dtype
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_roundtrip(compress):
+    bundle = mixed_bundle()
+    value = dumps_bundle(bundle, compress)
+    assert is_container(value) and value[:4] == b'SDBC'
+
+    container = BundleContainer(value)
+    assert container.compressed == compress
+    assert container.meta['stream_type'] == bundle.stream_type
+    assert container.column_names(0) == OUTPUTS and container.column_names(1) is None
+    loaded = loads_bundle(value)
+    assert (loaded.start_time, loaded.end_time, loaded.stream_type) == (START, bundle.end_time, bundle.stream_type)
+    assert list(loaded.data[0].derived_type) == OUTPUTS and loaded.data[1].stream_type == 'acc/3ax/4g'
+    assert_parts_equal(loaded, bundle)
+
+    derived = bundle.data[0].data
+    names = [OUTPUTS[3], OUTPUTS[0]]
+    assert numpy.array_equal(loads_bundle(value, names).data[0].data, derived[:, [3, 0]])
+    assert numpy.array_equal(container.column(0, OUTPUTS[8]), derived[:, 8])
+
+
+def test_arrays_are_aligned_views():
+    value = dumps_bundle(mixed_bundle())
+    container = BundleContainer(value)
+    base = numpy.frombuffer(value, dtype=numpy.uint8)
+    for part in range(len(container.parts)):
+        for array in (container.ts(part), container.data(part)[:, 0]):
+            assert not array.flags.writeable
+            assert numpy.shares_memory(array, base)
+            assert (array.__array_interface__['data'][0] - base.__array_interface__['data'][0]) % 64 == 0
+
+
+def test_reads_legacy_pickle():
+    bundle = mixed_bundle()
+    legacy = lz4.frame.compress(pickle.dumps(bundle))
+    assert not is_container(legacy)
+    loaded = loads_bundle(legacy)
+    assert (loaded.start_time, loaded.stream_type) == (START, bundle.stream_type)
+    assert_parts_equal(loaded, bundle)
+
+
+def test_unsupported_version():
+    value = bytearray(dumps_bundle(mixed_bundle()))
+    value[4] = 99
+    with pytest.raises(ValueError):
+        BundleContainer(bytes(value))
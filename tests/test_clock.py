@@ -0,0 +1,35 @@
+import numpy
+from math.clock import ClockModel, TX_MS
+
+
+def test_fitted_segment():
+    clock = ClockModel([0, 1000], [0, 10050])
+    assert numpy.isclose(clock.tx_to_ms(500), 5025)
+    assert numpy.isclose(clock.ms_to_tx(5025), 500)
+
+
+def test_rejected_segment_is_monotonic():
+    # 9.8 ms ticks deviate more than MAX_DRIFT, the nominal tick is clamped to the next sync
+    clock = ClockModel([0, 1000], [0, 9800])
+    ms = clock.sample_ms([0, 2000], [0, 2000], 0, 2000)
+    assert numpy.all(numpy.diff(ms) >= 0)
+    assert ms[999] <= 9800 and ms[1000] == 9800
+    assert numpy.all(numpy.diff(clock.tx_to_ms(numpy.arange(-100, 2000))) >= 0)
+    assert clock.tx_to_ms(100) == 100 * TX_MS
+
+
+def test_sync_going_back_is_monotonic():
+    clock = ClockModel([0, 1000, 2000], [0, 10000, 9000])
+    tx = numpy.arange(-100, 3000)
+    ms = clock.tx_to_ms(tx)
+    assert numpy.all(numpy.diff(ms) >= 0)
+    assert numpy.array_equal(clock.sample_ms([0, len(tx)], [-100, 3000], 0, len(tx)), ms.astype(numpy.int64))
+
+
+def test_ms_to_tx_inverts_tx_to_ms():
+    clock = ClockModel([0, 1000, 1100, 5000], [1000, 11000, 11900, 51200])
+    tx = numpy.arange(-50, 6000, 7.0)
+    ms = clock.tx_to_ms(tx)
+    # Inverse of the clamped part of a rejected segment is its end
+    back = clock.tx_to_ms(clock.ms_to_tx(ms))
+    assert numpy.allclose(back, ms)
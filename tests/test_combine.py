@@ -0,0 +1,110 @@
+import numpy
+from bench.bench_combine import combine_preallocated, make_day
+from math.clock import ClockModel
+from math.compress import decompress_fast, load_index
+from math.decode import segment_bounds, window_jobs
+from math.decode_pool import DecodeExecutor
+
+
+# Record combining before segment_bounds() and window_jobs(), as it was: the
+# contiguous records at the start of records, timestamps of every sample, then
+# the window
+
+def baseline_contiguous(tx_start, tx_end, max_gap):
+    consumed = 0
+    runs = []
+    while consumed < len(tx_start):
+        last = None
+        count = 0
+        for start, end in zip(tx_start[consumed:], tx_end[consumed:]):
+            if last is not None and start > last + max_gap:
+                break
+            last = end
+            count += 1
+        runs.append((consumed, consumed + count))
+        consumed += count
+    return runs
+
+
+def baseline_jobs(counts, padding, first, last):
+    jobs = []
+    offset = 0
+    for i, (count, missing_cnt) in enumerate(zip(counts, padding)):
+        lo = max(offset, first)
+        hi = min(offset + count, last)
+        if hi > lo:
+            jobs.append((i, lo - offset, hi - offset, lo - first))
+        offset += count + missing_cnt
+    return jobs
+
+
+def baseline_sample_ms(clock, anchor_sample, anchor_tx, count):
+    tx = numpy.interp(numpy.arange(count), anchor_sample, numpy.asarray(anchor_tx, dtype=numpy.float64))
+    return clock.tx_to_ms(tx).astype(numpy.int64)
+
+
+def baseline_combine(records, clock, start_ts, end_ts):
+    parts = [decompress_fast(r.bin_data) for r in records]
+    total = sum(len(p) for p in parts)
+    anchor_sample = []
+    anchor_tx = []
+    offset = 0
+    for r, p in zip(records, parts):
+        index = load_index(r.frame_index)[:-1]
+        anchor_sample.append(index['sample'] + offset)
+        anchor_tx.append(index['tx'])
+        offset += len(p)
+    anchor_sample.append([total])
+    anchor_tx.append([records[-1].timestamp_tx_end])
+    ts = baseline_sample_ms(clock, numpy.concatenate(anchor_sample), numpy.concatenate(anchor_tx), total)
+    first = int(numpy.searchsorted(ts, start_ts, side='right'))
+    last = max(first, int(numpy.searchsorted(ts, end_ts, side='left')))
+    return ts[first:last], numpy.vstack(parts)[first:last]
+
+
+def test_segment_bounds_matches_baseline():
+    rng = numpy.random.RandomState(0)
+    for _ in range(50):
+        n = rng.randint(1, 30)
+        lengths = rng.randint(1, 50000, n)
+        gaps = rng.choice([0, 5000, 10000, 10001, 80000], n)
+        tx_start = numpy.cumsum(lengths + gaps) - lengths
+        tx_end = tx_start + lengths
+        assert segment_bounds(tx_start, tx_end, 10000) == baseline_contiguous(tx_start, tx_end, 10000)
+
+
+def test_window_jobs_matches_baseline():
+    rng = numpy.random.RandomState(1)
+    for _ in range(200):
+        n = rng.randint(1, 10)
+        counts = rng.randint(0, 300, n)
+        padding = rng.choice([0, 0, 0, 25], n)
+        total = int(numpy.sum(counts + padding))
+        first = rng.randint(0, total + 1)
+        last = rng.randint(first, total + 1)
+        assert window_jobs(counts, padding, first, last) == baseline_jobs(counts, padding, first, last)
+
+
+def test_sample_ms_matches_baseline():
+    anchor_sample = numpy.array([0, 4000, 8000, 15000])
+    anchor_tx = numpy.array([100000, 132000, 164000, 220000])
+    for clock in (ClockModel([0], [1.6e12]),
+                  ClockModel([0, 150000, 190000], [1.6e12, 1.6e12 + 1500100, 1.6e12 + 1900000]),
+                  ClockModel([120000, 200000], [1.6e12, 1.6e12 + 800050])):
+        full = baseline_sample_ms(clock, anchor_sample, anchor_tx, 15000)
+        for first, last in ((0, 15000), (0, 1), (3999, 8001), (14999, 15000), (7000, 7000)):
+            assert numpy.array_equal(clock.sample_ms(anchor_sample, anchor_tx, first, last), full[first:last])
+
+
+def test_combine_matches_baseline():
+    records = make_day(6, 3000, 1000)
+    clock = ClockModel([0, 150000], [1.6e12, 1.6e12 + 1500200])
+    day_start = int(clock.tx_to_ms(records[0].timestamp_tx))
+    day_end = int(clock.tx_to_ms(records[-1].timestamp_tx_end))
+    executor = DecodeExecutor(workers=0)
+    for start_ts, end_ts in ((day_start - 3600000, day_end + 3600000), (day_start + 60000, day_end - 60000),
+                             (day_start + 100000, day_start + 100080)):
+        ts, samples = combine_preallocated(records, clock, start_ts, end_ts, executor)
+        ref_ts, ref_samples = baseline_combine(records, clock, start_ts, end_ts)
+        assert numpy.array_equal(ts, ref_ts)
+        assert numpy.array_equal(samples, ref_samples)
@@ -0,0 +1,81 @@
+import struct
+import numpy
+import pytest
+from bench.bench_compress import accelerometer_signal, random_signal, synthetic_record
+from math.compress import compress, compress_fast, decompress, decompress_fast, decompress_into, iter_decompress, \
+    decompressed_size, build_index, extend_index, decompress_range, IDLE_WINDOW
+
+SIGNALS = [(random_signal, 0), (random_signal, 3000), (accelerometer_signal, 5000), (accelerometer_signal, 45000)]
+
+
+def record(data, tx=1000, max_samples=4000, max_packetsize=1024):
+    """Packets of data each behind a timestamp_tx ignore frame, like SensorRecord2 stores them"""
+    blob = bytearray()
+    for k, packet in enumerate(compress(data, max_samples, max_packetsize)):
+        blob += bytearray([0xFE, 0x04]) + struct.pack('>I', tx + k * 100) + packet
+    return blob
+
+
+@pytest.mark.parametrize('generator, sample_count', SIGNALS)
+@pytest.mark.parametrize('max_samples, max_packetsize', [(4000, 1024), (400, 128), (13, 12)])
+def test_compress_fast_matches_compress(generator, sample_count, max_samples, max_packetsize):
+    data = generator(sample_count, seed=sample_count)
+    packets = [bytes(p) for p in compress(data, max_samples, max_packetsize)]
+    assert [bytes(p) for p in compress_fast(data, max_samples, max_packetsize)] == packets
+
+
+@pytest.mark.parametrize('generator, sample_count', SIGNALS)
+def test_roundtrip(generator, sample_count):
+    data = generator(sample_count, seed=sample_count)
+    blob = bytearray().join(compress_fast(data))
+    decoded = decompress_fast(blob)
+    assert decoded.shape == numpy.shape(data)
+    assert numpy.max(numpy.abs(decoded - data), initial=0) <= IDLE_WINDOW
+
+
+@pytest.mark.parametrize('frame_count', [0, 1, 1000, 20000])
+def test_decompress_fast_matches_decompress(frame_count):
+    data = synthetic_record(frame_count, seed=frame_count)
+    ref = decompress(data)
+    assert numpy.array_equal(decompress_fast(data), ref)
+    assert decompressed_size(data) == len(ref)
+    out = numpy.zeros((len(ref) + 5, 3), dtype=numpy.int16)
+    assert decompress_into(data, out) == len(ref)
+    assert numpy.array_equal(out[:len(ref)], ref)
+    blocks = list(iter_decompress(data, 1000))
+    assert numpy.array_equal(numpy.concatenate(blocks) if blocks else ref[:0], ref)
+
+
+def test_decompress_range_matches_slices():
+    data = accelerometer_signal(20000, seed=7)
+    blob = record(data, max_packetsize=256)
+    ref = decompress(blob)
+    index = build_index(blob)
+    assert len(index) > 10 and index['sample'][-1] == len(ref)
+    rng = numpy.random.RandomState(0)
+    ranges = [(0, len(ref)), (0, 1), (len(ref) - 1, len(ref)), (-5, 10), (len(ref) - 10, len(ref) + 5), (50, 50)]
+    ranges += [tuple(sorted(rng.randint(0, len(ref), 2))) for _ in range(50)]
+    for first, last in ranges:
+        assert numpy.array_equal(decompress_range(blob, index, first, last), ref[max(0, first):last])
+    # Anchor boundaries, where the reference value of the next packet starts
+    for sample in index['sample'][1:-1]:
+        assert numpy.array_equal(decompress_range(blob, index, sample - 1, sample + 1), ref[sample - 1:sample + 1])
+
+
+def test_decompress_range_into_out():
+    blob = record(accelerometer_signal(5000, seed=2), max_packetsize=128)
+    ref = decompress(blob)
+    out = numpy.zeros((1000, 3), dtype=numpy.int16)
+    part = decompress_range(blob, build_index(blob), 1200, 1900, out=out)
+    assert numpy.array_equal(part, ref[1200:1900])
+    assert numpy.array_equal(out[:700], ref[1200:1900])
+
+
+def test_extend_index_matches_build_index():
+    data = accelerometer_signal(12000, seed=4)
+    first, second = record(data[:7000], tx=1000), record(data[7000:], tx=9000)
+    blob = first + second
+    index = extend_index(extend_index(None, first), second)
+    assert numpy.array_equal(index, build_index(blob))
+    ref = decompress(blob)
+    assert numpy.array_equal(decompress_range(blob, index, 6500, 7500), ref[6500:7500])
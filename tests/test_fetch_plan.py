@@ -0,0 +1,75 @@
+import os
+from datetime import datetime, timedelta
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+os.environ.setdefault('SENS_CONFIG', 'unittest')
+
+from components import db
+from models.sensordata import timesync
+from models.sensordata.motion_device import MotionDevice
+from models.sensordata.session import Session2, Stream2
+from models.sensordata.sensor_record import SensorRecord2, add_bin_data
+from models.sensordata.timesync import TimeSync
+from query.sensordata.fetch_plan import FetchPlan
+
+START = datetime(2020, 1, 1)
+RECORD_TX = 60000  # 10 minutes of 10 ms ticks
+
+
+@pytest.fixture
+def sensors():
+    """Sensors with two sessions each, every session an acc and a volt stream of 3 records"""
+    created = []
+    for n in range(4):
+        sensor = MotionDevice(mac=0xF00000 + n, last_seen=START)
+        db.session.add(sensor)
+        for k in range(2):
+            session_start = START + timedelta(hours=k)
+            session = Session2(created=session_start, start_time=session_start,
+                               end_time=session_start + timedelta(minutes=30), motion_device=sensor)
+            db.session.add(session)
+            db.session.flush()
+            db.session.add(TimeSync(session_id=session.id, timestamp_tx=0, server_time=session_start))
+            db.session.add(TimeSync(session_id=session.id, timestamp_tx=3 * RECORD_TX,
+                                    server_time=session_start + timedelta(minutes=30)))
+            for stream_type, data_format in (('acc/3ax/4g', Stream2.FORMAT_COMPRESS_3INT12),
+                                             ('volt/system/mv', Stream2.FORMAT_SINGLE_UINT16)):
+                stream = Stream2(stream_type=stream_type, data_format=data_format, session=session,
+                                 properties='{"rate": "60"}')
+                db.session.add(stream)
+                db.session.flush()
+                for r in range(3):
+                    record = SensorRecord2(stream_id=stream.id, timestamp_tx=r * RECORD_TX,
+                                           timestamp_tx_end=(r + 1) * RECORD_TX, stream_cnt_begin=0,
+                                           stream_cnt_end=0, datastore=0, uuid=bytearray([]),
+                                           utc_start=session_start + timedelta(minutes=10 * r),
+                                           utc_end=session_start + timedelta(minutes=10 * (r + 1)))
+                    db.session.add(record)
+                    add_bin_data(record, bytearray(8))
+        created.append(sensor)
+    db.session.flush()
+    yield created
+    db.session.rollback()
+
+
+def resolved(sensors, stream_type):
+    # Clock models and loaded bin_data are cached between plans, start every plan from the same state
+    timesync._clock_models.clear()
+    db.session.expunge_all()
+    return FetchPlan(sensors, START, START + timedelta(hours=2), stream_type).resolve()
+
+
+def test_sql_count_is_constant(sensors):
+    one = resolved(sensors[:1], 'acc/3ax/4g')
+    many = resolved(sensors, 'acc/3ax/4g')
+    assert sum(len(r) for r in one.records.values()) == 2 * 3
+    assert sum(len(r) for r in many.records.values()) == len(sensors) * 2 * 3
+    assert one.sql_count == many.sql_count
+    assert resolved(sensors, 'volt/system/mv').sql_count == many.sql_count
+
+
+def test_sql_count_without_matches(sensors):
+    plan = FetchPlan(sensors, START - timedelta(days=2), START - timedelta(days=1), 'acc/3ax/4g').resolve()
+    assert plan.sql_count == 1
+    assert all(len(s) == 0 for s in plan.sessions.values())
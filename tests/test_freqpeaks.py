@@ -0,0 +1,106 @@
+import numpy as np
+import numpy
+from numpy.fft import rfftfreq
+from bench.bench_compress import accelerometer_signal
+from bench.bench_freqpeaks import chunked_hour
+from math.algorithm import intermediates
+from math.algorithm.algorithms import FreqPeakFilt, FreqPeaks
+from math.algorithm.utils import get_xyz, OVER_SAMPLES
+
+# FreqPeakFilt / FreqPeaks before the interpolation matrices, as they were. Only
+# baseline_spectrum() differs: SensorData2 has no sample_interval attribute, current
+# numpy wants an integer rfftfreq() size and no np.sum() of a generator.
+SAMPLE_INTERVAL_MS = 80.0
+
+N = 100
+MULTS = np.array([1, 1.5, 2, 2.5, 3, 3.5, 4])
+SIGNS = np.array([1, -1, 1, -1, 1, -1, 1])
+
+
+def baseline_search_freqs(meta=None):
+    return np.linspace(0.2, 1.8, N)
+
+
+def baseline_calc_response(freqs, chunk, meta=None):
+    search_freqs = baseline_search_freqs(meta)
+    r = np.zeros(N)
+    chunk = np.squeeze(chunk)
+    for j, f in enumerate(search_freqs):
+        r[j] = np.dot(np.interp(f * MULTS, freqs, chunk), SIGNS)
+    return r
+
+
+def baseline_spectrum(sensor_data):
+    x, y, z, _ = get_xyz(sensor_data)
+    chunk_sc = sensor_data.sample_count() / sensor_data.chunk_count()
+    freqs = rfftfreq(int(chunk_sc), SAMPLE_INTERVAL_MS / 1000.0)
+    x_fft = np.fft.rfft(x, axis=OVER_SAMPLES)
+    y_fft = np.fft.rfft(y, axis=OVER_SAMPLES)
+    z_fft = np.fft.rfft(z, axis=OVER_SAMPLES)
+    yz_fft_abs = np.sqrt(sum(np.absolute(i)**2 for i in [x_fft, y_fft, z_fft]))/chunk_sc
+    return freqs, yz_fft_abs
+
+
+def baseline_freq_peak_filt(sensor_data, meta=None):
+    freqs, yz_fft_abs = baseline_spectrum(sensor_data)
+    resp = np.zeros((yz_fft_abs.shape[0], N))
+    for i, chunk in enumerate(yz_fft_abs):
+        resp[i, :] = baseline_calc_response(freqs, chunk, meta)
+    return resp
+
+
+def baseline_freq_peaks(sensor_data, meta=None):
+    AMP_CUTOFF = 0.05
+    freqs, yz_fft_abs = baseline_spectrum(sensor_data)
+
+    resp = np.zeros(yz_fft_abs.shape[0])
+    order1 = np.zeros(yz_fft_abs.shape[0])
+    amp = np.zeros(yz_fft_abs.shape[0])
+    factor = np.zeros(yz_fft_abs.shape[0])
+
+    search_freqs = baseline_search_freqs(meta)
+
+    for i, chunk in enumerate(np.squeeze(yz_fft_abs)):
+        r = baseline_calc_response(freqs, chunk)
+        max_idx = np.argmax(r)
+        resp[i] = r[max_idx]
+        order1[i] = search_freqs[max_idx]
+        fa = np.interp(order1[i] * MULTS[::2], freqs, chunk)
+        amp[i] = np.max(fa)
+        if amp[i] > AMP_CUTOFF:
+            factor[i] = np.sum(fa[1:3]) / fa[0]
+        else:
+            factor[i] = 0
+            order1[i] = 0
+
+    return np.vstack((amp, resp, factor / 5.0, order1))
+
+
+def test_sample_interval_from_ts():
+    chunked = chunked_hour(numpy.zeros((6400, 3), dtype=numpy.int16), 64)
+    assert intermediates.get(chunked, 'sample_interval') == 80.0
+    assert numpy.isclose(intermediates.get(chunked, 'fft_freqs')[-1], 6.25)
+
+
+def test_matches_baseline():
+    data = accelerometer_signal(20000, seed=1)
+    for chunk_samples in (64, 125):
+        chunked = chunked_hour(data, chunk_samples)
+        assert numpy.allclose(FreqPeakFilt.analyse_data_low(chunked), baseline_freq_peak_filt(chunked),
+                              rtol=0, atol=1e-12)
+        assert numpy.allclose(FreqPeaks.analyse_data_low(chunked), baseline_freq_peaks(chunked),
+                              rtol=0, atol=1e-12)
+
+
+def test_response_matrices_per_search_freqs(monkeypatch):
+    freqs = rfftfreq(64, 0.08)
+    default, _ = FreqPeakFilt.response_matrices(freqs)
+    assert FreqPeakFilt.response_matrices(freqs)[0] is default
+    # Search frequencies from the meta get their own matrices
+    monkeypatch.setattr(FreqPeakFilt, 'get_search_freqs',
+                        staticmethod(lambda meta=None: np.linspace(0.2, 1.8 if meta is None else 1.2, N)))
+    narrow, _ = FreqPeakFilt.response_matrices(freqs, {'narrow': True})
+    chunk = np.random.RandomState(0).rand(len(freqs))
+    assert numpy.allclose(narrow.dot(chunk), [np.dot(np.interp(f * MULTS, freqs, chunk), SIGNS)
+                                              for f in np.linspace(0.2, 1.2, N)], rtol=0, atol=1e-12)
+    assert FreqPeakFilt.response_matrices(freqs)[0] is default
@@ -0,0 +1,66 @@
+import struct
+import numpy
+from bench.bench_compress import accelerometer_signal
+from math.compress import compress, build_index, idle_mask, idle_runs, extend_idle_runs, idle_runs_mask
+from math.algorithm.generic.alg_movement import ActivityMovement
+from types.sensor_data import SensorData2
+from types.sensor_data_bundle import SensorDataBundle
+
+
+def packets(data, tx=1000):
+    """Packets of data each behind a timestamp_tx ignore frame, like SensorRecord2 stores them"""
+    return [bytearray([0xFE, 0x04]) + struct.pack('>I', tx + k * 100) + p
+            for k, p in enumerate(compress(data, max_packetsize=256))]
+
+
+def test_idle_runs_match_idle_mask():
+    parts = packets(accelerometer_signal(20000, seed=9))
+    blob = bytearray().join(parts)
+    index = build_index(blob)
+    total = int(index['sample'][-1])
+    full = idle_mask(blob)
+    assert full.any() and not full.all()
+
+    runs = None
+    for k, part in enumerate(parts):
+        runs = extend_idle_runs(runs, part, int(index['sample'][k]))
+    assert numpy.array_equal(runs, idle_runs(blob))
+    assert numpy.all(runs['first'][1:] > runs['last'][:-1])
+
+    rng = numpy.random.RandomState(0)
+    for first, last in [(0, total), (0, 0), (total - 3, total)] + [sorted(rng.randint(0, total, 2)) for _ in range(50)]:
+        assert numpy.array_equal(idle_runs_mask(runs, first, last), idle_mask(blob, index, first, last))
+
+
+class CountingMovement(ActivityMovement):
+    analysed = []
+
+    @classmethod
+    def analyse_data_chunks(cls, sensor_data, parameters):
+        cls.analysed.append(sensor_data.chunk_count())
+        return super(CountingMovement, cls).analyse_data_chunks(sensor_data, parameters)
+
+
+def test_idle_chunks_skip_categorizer():
+    data = accelerometer_signal(64 * 40, seed=2).astype(numpy.int16)
+    idle = numpy.zeros(len(data), dtype=bool)
+    for chunk in (0, 1, 7, 20, 21, 22, 39):
+        data[chunk * 64:(chunk + 1) * 64] = data[chunk * 64]
+    for chunk in (0, 20, 21, 22):
+        idle[chunk * 64:(chunk + 1) * 64] = True
+    # Constant, but the first sample of the chunk is not from an idle frame
+    for chunk in (1, 7, 39):
+        idle[chunk * 64 + 1:(chunk + 1) * 64] = True
+    ts = 1577836800000 + numpy.arange(len(data), dtype=numpy.int64) * 80
+
+    def analyse(mask):
+        bundle = SensorDataBundle(None, None, 'acc/3ax/4g')
+        bundle.add(SensorData2(ts[0], ts[-1], ts, 'acc/3ax/4g', data, idle=mask))
+        CountingMovement.analysed = []
+        return CountingMovement.analyse_data({'any': bundle}, None).get_data().data
+
+    res = analyse(idle)
+    assert CountingMovement.analysed == [40 - 4]
+    assert numpy.array_equal(res[[0, 20, 21, 22]], [CountingMovement.__idle_result__] * 4)
+    assert numpy.array_equal(res, analyse(None))
+    assert CountingMovement.analysed == [40]
@@ -0,0 +1,49 @@
+import numpy
+from bench.bench_compress import accelerometer_signal
+from math.algorithm import algorithms, intermediates
+from types.sensor_data import SensorData2
+
+
+def chunked_window(seed=0):
+    data = accelerometer_signal(6400, seed=seed)
+    return SensorData2(0, 512000, numpy.arange(len(data)) * 80.0, 'acc/3ax/4g', data).chunked_view(64)
+
+
+def test_run_matches_algorithms_alone():
+    algs = [algorithms.SmoothXYZ, algorithms.SampleFFT, algorithms.Transition,
+            algorithms.FreqPeakFilt, algorithms.FreqPeaks]
+    window = chunked_window()
+    results = intermediates.run(algs, window)
+    for alg, result in zip(algs, results):
+        assert numpy.array_equal(result, alg.analyse_data_low(chunked_window()))
+
+
+def test_released_after_run():
+    window = chunked_window()
+    intermediates.run([algorithms.SampleFFT, algorithms.FreqPeaks], window)
+    assert window.intermediates() is None
+    # Not kept outside of run() or shared()
+    intermediates.get(window, 'fft_abs')
+    assert window.intermediates() is None
+
+
+def test_shared_computes_once():
+    window = chunked_window()
+    with intermediates.shared(window):
+        fft = intermediates.get(window, 'fft')
+        assert intermediates.get(window, 'fft_abs') is intermediates.get(window, 'fft_abs')
+        assert intermediates.get(window, 'fft') is fft
+    assert window.intermediates() is None
+
+
+def test_sample_fft_leaves_shared_spectra():
+    window = chunked_window()
+    with intermediates.shared(window):
+        algorithms.SampleFFT.analyse_data_low(window, 3)
+        assert numpy.all(intermediates.get(window, 'fft')[0][3, 0] != 0)
+
+
+def test_requirements_in_dependency_order():
+    order = intermediates.requirements(['fft_abs'])
+    assert order.index('xyz') < order.index('fft') < order.index('fft_abs')
+    assert order.index('chunk_samples') < order.index('fft_abs')
@@ -0,0 +1,88 @@
+import struct
+import numpy
+import pytest
+from math.pack import DataFormatError, legacy_segment_offsets, unpack10bit, unpack_legacy_samples
+
+
+# FORMAT_LEGACY_3INT12 unpacking before it was vectorized, as it was
+
+def baseline_unpack10bit(data):
+    if len(data) % 4:
+        raise DataFormatError()
+
+    a = numpy.ndarray(len(data) // 4 * 3, dtype = numpy.int16)
+
+    for i in range(len(data) // 4):
+        # 32bit int
+        val = struct.unpack(">I", data[i*4:(i+1)*4])[0]
+
+        a[i*3]   = ((val >> 20) & 0x1FF) - (val >> 20 & 0x200)
+        a[i*3+1] = ((val >> 10) & 0x1FF) - (val >> 10 & 0x200)
+        a[i*3+2] = ((val      ) & 0x1FF) - (val       & 0x200)
+
+    return a
+
+
+def baseline_legacy_segments(bin_data):
+    parts = []
+    i = 0
+    while i < len(bin_data):
+        i += 4  # timestamp
+        l = bin_data[i]*4
+        i += 1
+        parts.append(bin_data[i:i+l])
+        i += l
+    return parts
+
+
+def baseline_legacy_samples(bin_data):
+    parts = []
+    for p in baseline_legacy_segments(bin_data):
+        a = baseline_unpack10bit(p)
+        if len(a) == 3:
+            b = numpy.zeros([125, 3])
+            b[:,0] = a[0]
+            b[:,1] = a[1]
+            b[:,2] = a[2]-20
+            a = b
+        else:
+            a.shape = (125,3)
+            a[:,2] = a[:, 2]-20
+        parts.append(a)
+    return numpy.vstack(parts)
+
+
+def legacy_record(word_counts, seed=0):
+    """Segments of a timestamp, a word count byte and random packed samples"""
+    rng = numpy.random.RandomState(seed)
+    data = bytearray()
+    for k, words in enumerate(word_counts):
+        data += struct.pack('>I', 1000 + k * 125) + bytearray([words])
+        data += rng.randint(0, 256, words * 4).astype(numpy.uint8).tobytes()
+    return bytes(data)
+
+
+@pytest.mark.parametrize('word_counts', [[125], [125] * 20, [1], [125, 1, 125, 125, 1], [1, 1, 1]])
+def test_matches_baseline_loop(word_counts):
+    data = legacy_record(word_counts, seed=len(word_counts))
+    ref = baseline_legacy_samples(bytearray(data))
+    samples = unpack_legacy_samples(data)
+    assert samples.dtype == ref.dtype
+    assert numpy.array_equal(samples, ref)
+    offsets, counts = legacy_segment_offsets(data)
+    assert [bytes(data[o:o + c * 4]) for o, c in zip(offsets, counts)] == \
+        [bytes(p) for p in baseline_legacy_segments(bytearray(data))]
+
+
+def test_unpack10bit_matches_baseline():
+    data = numpy.random.RandomState(1).randint(0, 256, 4 * 1000).astype(numpy.uint8).tobytes()
+    assert numpy.array_equal(unpack10bit(data), baseline_unpack10bit(data))
+    with pytest.raises(DataFormatError):
+        unpack10bit(data[:5])
+
+
+def test_invalid_segments():
+    with pytest.raises(DataFormatError):
+        unpack_legacy_samples(legacy_record([125, 3]))
+    with pytest.raises(DataFormatError):
+        unpack_legacy_samples(legacy_record([125])[:-4])
@@ -0,0 +1,72 @@
+import numpy
+import pytest
+from bench.bench_compress import accelerometer_signal
+from math.pyramid import bucket_stats, merge_buckets, pyramid_dtype
+from types.sensor_data import SensorData2
+from types.sensor_data_bundle import SensorDataBundle
+
+BUCKET_MS = 120000
+
+
+def chunk_ts(sample_count, chunk_size, step_ms=79):
+    """Timestamps putting every chunk_size samples in their own BUCKET_MS bucket"""
+    k = numpy.arange(sample_count)
+    return (k // chunk_size) * BUCKET_MS + (k % chunk_size) * step_ms
+
+
+def reference_stats(ts, samples, bucket_ms):
+    bucket = ts // bucket_ms
+    rows = []
+    for b in numpy.unique(bucket):
+        part = samples[bucket == b]
+        rows.append((b * bucket_ms, len(part), part.min(axis=0), part.max(axis=0),
+                     part.mean(axis=0), numpy.median(part, axis=0)))
+    return numpy.array(rows, dtype=pyramid_dtype(samples.shape[1]))
+
+
+def without_holes(values, var_names):
+    keep = [i for i, v in enumerate(values[var_names[0]]) if v is not None]
+    return {k: [v[i] for i in keep] for k, v in values.items()}
+
+
+@pytest.mark.parametrize('bucket_ms', [1000, 10000, 120000])
+def test_bucket_stats_matches_numpy(bucket_ms):
+    data = accelerometer_signal(20000, seed=5)
+    ts = 1577836800000 + numpy.cumsum(numpy.random.RandomState(5).randint(60, 100, len(data)))
+    assert numpy.array_equal(bucket_stats(ts, data, bucket_ms), reference_stats(ts, data, bucket_ms))
+
+
+def test_merge_buckets_of_split_records():
+    data = accelerometer_signal(20000, seed=6)
+    ts = 1577836800000 + numpy.arange(len(data)) * 80
+    whole = bucket_stats(ts, data, BUCKET_MS)
+    cuts = [0, 1000, 1001, 9999, 20000]
+    parts = [bucket_stats(ts[a:b], data[a:b], BUCKET_MS) for a, b in zip(cuts[:-1], cuts[1:])]
+    merged = merge_buckets(parts, 3)
+    for field in ('ts', 'count', 'min', 'max'):
+        assert numpy.array_equal(merged[field], whole[field])
+    assert numpy.allclose(merged['mean'], whole['mean'], rtol=1e-6)
+    # Buckets not split between records keep their exact median
+    split = numpy.unique(ts[cuts[1:-1]] // BUCKET_MS * BUCKET_MS)
+    kept = ~numpy.isin(whole['ts'], split)
+    assert numpy.array_equal(merged['median'][kept], whole['median'][kept])
+    assert merge_buckets([parts[0][:0]], 3).dtype == pyramid_dtype(3)
+
+
+def test_format_pyramid_matches_format_samples():
+    pytest.importorskip('flask_restful')
+    from api.sensor_data import format_samples, format_pyramid
+    # format_samples() sizes its chunks from the first 10 samples, 790 ms -> 1519 samples per chunk
+    chunk_size = 1519
+    data = accelerometer_signal(chunk_size * 20 + 300, seed=8)
+    ts = 1577836800000 + chunk_ts(len(data), chunk_size)
+    bundle = SensorDataBundle(None, None, 'acc/3ax/4g')
+    bundle.add(SensorData2(ts[0], ts[-1], ts, 'acc/3ax/4g', data))
+    var_names = ['x', 'y', 'z']
+    # Hole markers (None) aside, format_samples() also marks one before the first record
+    samples = without_holes(format_samples(bundle, True, var_names), var_names)
+    pyramid = format_pyramid([bucket_stats(ts, data, BUCKET_MS)], 'acc/3ax/4g', var_names)
+    assert pyramid['ts'] == samples['ts']
+    for l in var_names:
+        assert numpy.allclose(pyramid[l], samples[l], rtol=1e-6)
+        assert numpy.allclose(pyramid[l + '_diff'], samples[l + '_diff'], rtol=1e-6)
@@ -0,0 +1,77 @@
+import os
+import numpy
+import pytest
+
+pytest.importorskip('flask_redis')
+os.environ.setdefault('SENS_CONFIG', 'unittest')
+
+from models.sensordata.sample_cache import SampleCache, decode_samples_value, encode_samples
+
+
+class Row(object):
+    def __init__(self, **columns):
+        self.__dict__.update(columns)
+
+
+STREAM = Row(open_record_tx=90000)
+
+
+def record(timestamp_tx, stream_cnt_end=10):
+    return Row(stream_id=7, timestamp_tx=timestamp_tx, stream_cnt_end=stream_cnt_end)
+
+
+class DictRedis(object):
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def setex(self, key, ttl_s, value):
+        self.values[key] = value
+
+
+class FailingRedis(object):
+    def get(self, key):
+        raise ConnectionError('redis down')
+
+    def setex(self, key, ttl_s, value):
+        raise ConnectionError('redis down')
+
+
+@pytest.mark.parametrize('dtype', ['<i2', '<u2', '<f4', '<f8', '>f8'])
+def test_encode_roundtrip(dtype):
+    samples = (numpy.random.RandomState(0).randn(1000, 3) * 1000).astype(dtype)
+    decoded = decode_samples_value(encode_samples(samples))
+    assert decoded.dtype == samples.dtype.newbyteorder('=')
+    assert numpy.array_equal(decoded, samples)
+    assert encode_samples(samples.astype(numpy.int64)) is None
+
+
+def test_open_record_not_cached():
+    redis = DictRedis()
+    cache = SampleCache(1 << 20, redis)
+    cache.put(record(STREAM.open_record_tx), STREAM, numpy.zeros((10, 3)))
+    assert cache.get(record(STREAM.open_record_tx), STREAM) is None
+    assert len(cache.local.items) == 0 and len(redis.values) == 0
+    assert cache.stats()['misses'] == 0
+
+
+def test_redis_shared_between_processes():
+    redis = DictRedis()
+    samples = numpy.random.RandomState(1).randn(500, 3)
+    SampleCache(1 << 20, redis).put(record(0), STREAM, samples)
+    other = SampleCache(1 << 20, redis)
+    assert numpy.array_equal(other.get(record(0), STREAM), samples)
+    assert other.get(record(0, stream_cnt_end=11), STREAM) is None
+    assert (other.hits_redis, other.misses) == (1, 1)
+
+
+def test_redis_failure_falls_back_to_local():
+    cache = SampleCache(1 << 20, FailingRedis())
+    samples = numpy.arange(30, dtype=numpy.int16).reshape(10, 3)
+    cache.put(record(0), STREAM, samples)
+    assert numpy.array_equal(cache.get(record(0), STREAM), samples)
+    assert cache.get(record(60000), STREAM) is None
+    stats = cache.stats()
+    assert (stats['hits_local'], stats['misses'], stats['redis_errors']) == (1, 1, 2)
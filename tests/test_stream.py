@@ -0,0 +1,73 @@
+import numpy
+from bench.bench_compress import accelerometer_signal
+from math.algorithm.algorithms import hyst_crossing, hyst_crossing_stream
+from math.algorithm.generic.alg_movement import ActivityMovement
+from math.algorithm.lowpass_filter import LowpassFilter, LowpassStream
+from types.sensor_data import SensorData2
+from types.sensor_data_bundle import SensorDataBundle
+
+START_TS = 1577836800000
+
+
+def bundle(ts, data, first, last):
+    b = SensorDataBundle(None, None, 'acc/3ax/4g')
+    b.add(SensorData2(ts[first], ts[last - 1], ts[first:last], 'acc/3ax/4g', data[first:last]))
+    return b
+
+
+def test_stream_matches_single_call():
+    data = accelerometer_signal(45000, seed=3).astype(numpy.int16)
+    ts = START_TS + numpy.arange(len(data), dtype=numpy.int64) * 80
+    whole = ActivityMovement.analyse_data({'any': bundle(ts, data, 0, len(data))}, None).get_data()
+
+    state = None
+    parts = []
+    cuts = [0, 30, 10000, 10001, 20050, 45000]
+    for first, last in zip(cuts[:-1], cuts[1:]):
+        derived, state = ActivityMovement.analyse_stream({'any': bundle(ts, data, first, last)}, None, state)
+        if derived is not None:
+            parts.append(derived)
+    assert numpy.array_equal(numpy.concatenate([d.ts for d in parts]), whole.ts)
+    assert numpy.array_equal(numpy.concatenate([d.data for d in parts]), whole.data)
+    assert whole.derived_type == parts[0].derived_type
+
+
+def test_gap_ends_stream():
+    data = accelerometer_signal(1000, seed=1).astype(numpy.int16)
+    ts = START_TS + numpy.arange(len(data), dtype=numpy.int64) * 80
+    derived, state = ActivityMovement.analyse_stream({'any': bundle(ts, data, 0, 100)}, None)
+    assert len(derived.data) == 1 and len(state.carry['any'].ts) == 36
+    empty = SensorDataBundle(None, None, 'acc/3ax/4g')
+    assert ActivityMovement.analyse_stream({'any': empty}, None, state) == (None, None)
+
+
+def test_lowpass_stream_matches_filter():
+    rng = numpy.random.RandomState(0)
+    lowpass = LowpassFilter(12.5, 0.5)
+    for shape in ((5000,), (3, 5000)):
+        x = rng.randn(*shape)
+        ref = lowpass.filter(x)
+        for _ in range(5):
+            cuts = numpy.sort(rng.choice(numpy.arange(1, 5000), 8, replace=False))
+            cuts = numpy.concatenate(([0, 1, 3], cuts, [5000]))
+            stream = LowpassStream(lowpass)
+            out = [stream.push(x[..., a:b]) for a, b in zip(cuts[:-1], cuts[1:])] + [stream.finish()]
+            out = numpy.concatenate(out, axis=-1)
+            assert out.shape == ref.shape
+            assert numpy.allclose(out, ref, rtol=0, atol=1e-12)
+    stream = LowpassStream(lowpass)
+    stream.push(numpy.arange(4.0))
+    assert numpy.allclose(stream.finish(), lowpass.filter(numpy.arange(4.0)), rtol=0, atol=1e-12)
+
+
+def test_hyst_crossing_stream_matches_hyst_crossing():
+    x = numpy.sin(numpy.arange(5000) / 40.0) + numpy.random.RandomState(0).randn(5000) * 0.2
+    down, up = hyst_crossing(x, -0.3, 0.3)
+    state = None
+    stream_down, stream_up = [], []
+    for a, b in zip([0, 700, 701, 2500], [700, 701, 2500, 5000]):
+        d, u, state = hyst_crossing_stream(x[a:b], -0.3, 0.3, state)
+        stream_down.append(d + a)
+        stream_up.append(u + a)
+    assert numpy.array_equal(numpy.concatenate(stream_down), down)
+    assert numpy.array_equal(numpy.concatenate(stream_up), up)
@@ -0,0 +1,54 @@
+import numpy
+from types.sensor_data import SensorData2, TimeIndex, window
+
+
+def baseline_window(ts, start_ts, end_ts):
+    # window() before the searchsorted lookup, as it was
+    if len(ts) == 0:
+        return 0, 0
+    first = numpy.argmax(ts > start_ts)
+    last = numpy.argmax(ts > end_ts)
+    if first == 0 and ts[-1] < start_ts:
+        first = len(ts)-1
+    if last == 0 and ts[-1] < end_ts:
+        last = len(ts)-1
+    return first, last
+
+
+def sample_ts():
+    ts = 1577836800000 + numpy.cumsum(numpy.random.RandomState(4).randint(60, 100, 500))
+    # A repeated timestamp, as left by clock model steps
+    ts[200] = ts[199]
+    return ts
+
+
+def bounds(ts):
+    """Window bounds on, just before and just after sample timestamps and past either end"""
+    on = [ts[0], ts[1], ts[199], ts[250], ts[-2], ts[-1]]
+    return on + [t - 1 for t in on] + [t + 1 for t in on] + [ts[0] - 10000, ts[-1] + 10000]
+
+
+def test_window_matches_baseline_scan():
+    ts = sample_ts()
+    pairs = [(a, b) for a in bounds(ts) for b in bounds(ts) if a <= b]
+    for start_ts, end_ts in pairs:
+        assert window(ts, start_ts, end_ts) == baseline_window(ts, start_ts, end_ts)
+    index = TimeIndex(ts)
+    starts, ends = zip(*pairs)
+    assert index.windows(starts, ends) == [baseline_window(ts, a, b) for a, b in pairs]
+    for start_ts, end_ts in pairs:
+        assert index.window(start_ts, end_ts) == baseline_window(ts, start_ts, end_ts)
+    for single in (ts[:1], ts[:0]):
+        for start_ts, end_ts in [(ts[0] - 1, ts[0]), (ts[0], ts[0]), (ts[0], ts[0] + 1)]:
+            assert window(single, start_ts, end_ts) == baseline_window(single, start_ts, end_ts)
+
+
+def test_windowed_view_on_sample_timestamps():
+    ts = sample_ts()
+    data = numpy.arange(len(ts) * 3, dtype=numpy.int16).reshape(-1, 3)
+    sensor_data = SensorData2(ts[0], ts[-1], ts, 'acc/3ax/4g', data)
+    for start_ts, end_ts in [(ts[10], ts[20]), (ts[199], ts[300]), (ts[0], ts[-1])]:
+        first, last = baseline_window(ts, start_ts, end_ts)
+        view = sensor_data.time_index().window(start_ts, end_ts)
+        assert view == (first, last)
+        assert numpy.array_equal(ts[view[0]:view[1]], ts[first:last])
@@ -0,0 +1,178 @@
+import json
+import pickle
+import struct
+import lz4.frame
+import numpy
+from types.derived_data import DerivedData
+from types.sensor_data import SensorData2
+from types.sensor_data_bundle import SensorDataBundle
+from utils import unixts, from_unixts
+
+###############################################################
+##
+## Versioned binary container of a SensorDataBundle, stored in
+## CacheDerivedData.data
+##
+###############################################################
+
+# Header (magic, version, flags, metadata length), JSON metadata, then the
+# arrays of every part, each starting at a multiple of _ALIGN from the start of
+# the value. Arrays are little endian. The columns of a part's data are stored
+# one after another (Fortran order) so every column is contiguous on its own.
+# With FLAG_LZ4 the ts and the data of every part are lz4 compressed separately.
+_HEADER = struct.Struct('<4sBBHI')
+_MAGIC = b'SDBC'
+_VERSION = 1
+_ALIGN = 64
+
+FLAG_LZ4 = 1
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def dumps_bundle(bundle, compress=False):
+    """
+    :param bundle: SensorDataBundle of DerivedData and/or SensorData2 parts
+    :param compress: lz4 compress the arrays, smaller but read as copies
+    :return: bytes
+    """
+    blobs = []  # (offset from the end of the metadata, bytes)
+    end = [0]
+
+    def add(array):
+        blob = numpy.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<')).tobytes()
+        if compress:
+            blob = lz4.frame.compress(blob)
+        offset = _aligned(end[0])
+        blobs.append((offset, blob))
+        end[0] = offset + len(blob)
+        return [offset, len(blob)]
+
+    parts = []
+    for d in bundle.data:
+        if len(d.data.shape) != 2:
+            raise ValueError("Only [samples, columns] data can be stored, got %s" % str(d.data.shape))
+        part = {'start_ts': int(d.start_ts), 'end_ts': int(d.end_ts), 'rows': d.data.shape[0],
+                'ts': {'dtype': d.ts.dtype.newbyteorder('<').str, 'blob': add(d.ts)},
+                'data': {'dtype': d.data.dtype.newbyteorder('<').str, 'columns': d.data.shape[1],
+                         'blob': add(d.data.T)}}
+        if isinstance(d, DerivedData):
+            part['derived_type'] = list(d.derived_type)
+        else:
+            part['stream_type'] = d.stream_type
+        parts.append(part)
+
+    meta = json.dumps({'start_ts': unixts(bundle.start_time),
+                       'end_ts': unixts(bundle.end_time),
+                       'stream_type': bundle.stream_type,
+                       'parts': parts}).encode('utf-8')
+    start = _aligned(_HEADER.size + len(meta))
+
+    out = bytearray(start + end[0])
+    _HEADER.pack_into(out, 0, _MAGIC, _VERSION, FLAG_LZ4 if compress else 0, 0, len(meta))
+    out[_HEADER.size:_HEADER.size + len(meta)] = meta
+    for offset, blob in blobs:
+        out[start + offset:start + offset + len(blob)] = blob
+    return bytes(out)
+
+
+def is_container(value):
+    return bytes(value[:len(_MAGIC)]) == _MAGIC
+
+
+class BundleContainer(object):
+    """
+    Read side of dumps_bundle(). Only the header and metadata are parsed up
+    front, arrays are read when asked for. Arrays are read only views into the
+    value, or into the decompressed blob if it was stored with compress=True.
+    """
+
+    def __init__(self, value):
+        magic, version, flags, _, meta_len = _HEADER.unpack_from(value)
+        if magic != _MAGIC:
+            raise ValueError("Not a bundle container")
+        if version != _VERSION:
+            raise ValueError("Unsupported bundle container version %d" % version)
+        self.value = value
+        self.compressed = bool(flags & FLAG_LZ4)
+        self.meta = json.loads(bytes(value[_HEADER.size:_HEADER.size + meta_len]).decode('utf-8'))
+        self.start = _aligned(_HEADER.size + meta_len)
+        self.parts = self.meta['parts']
+        self._decompressed = {}
+
+    def _array(self, blob, dtype, count, offset=0):
+        """count items of dtype from offset bytes into a blob"""
+        blob_offset, nbytes = blob
+        if self.compressed:
+            blob = self._decompressed.get(blob_offset)
+            if blob is None:
+                blob = lz4.frame.decompress(memoryview(self.value)[self.start + blob_offset:self.start + blob_offset + nbytes])
+                self._decompressed[blob_offset] = blob
+            return numpy.frombuffer(blob, dtype=dtype, count=count, offset=offset)
+        return numpy.frombuffer(self.value, dtype=dtype, count=count, offset=self.start + blob_offset + offset)
+
+    def column_names(self, part):
+        return self.parts[part].get('derived_type')
+
+    def ts(self, part):
+        meta = self.parts[part]
+        return self._array(meta['ts']['blob'], numpy.dtype(meta['ts']['dtype']), meta['rows'])
+
+    def column(self, part, column):
+        """:param column: index, or name for DerivedData parts"""
+        return self.data(part, [column])[:, 0]
+
+    def data(self, part, columns=None):
+        """
+        :param columns: indices, or names for DerivedData parts, default all
+        :return: [rows, columns], a view unless columns are picked out of order
+        """
+        meta = self.parts[part]
+        dtype = numpy.dtype(meta['data']['dtype'])
+        rows = meta['rows']
+        if columns is None:
+            indices = list(range(meta['data']['columns']))
+        else:
+            indices = [c if isinstance(c, int) else self.column_names(part).index(c) for c in columns]
+        if len(indices) and indices == list(range(indices[0], indices[0] + len(indices))):
+            data = self._array(meta['data']['blob'], dtype, rows * len(indices), indices[0] * rows * dtype.itemsize)
+            return data.reshape(len(indices), rows).T
+        data = numpy.empty((rows, len(indices)), dtype=dtype, order='F')
+        for i, c in enumerate(indices):
+            data[:, i] = self._array(meta['data']['blob'], dtype, rows, c * rows * dtype.itemsize)
+        return data
+
+    def part(self, part, columns=None):
+        """
+        :param columns: names of the derived columns to load, DerivedData parts hold only these
+        :return: DerivedData (without source) or SensorData2
+        """
+        meta = self.parts[part]
+        if 'derived_type' in meta:
+            names = meta['derived_type'] if columns is None else list(columns)
+            d = DerivedData.__new__(DerivedData)
+            d.__setstate__((meta['start_ts'], meta['end_ts'], names, self.data(part, names), self.ts(part)))
+            return d
+        return SensorData2(meta['start_ts'], meta['end_ts'], self.ts(part), meta['stream_type'], self.data(part))
+
+    def bundle(self, columns=None):
+        meta = self.meta
+        bundle = SensorDataBundle(start_time=from_unixts(meta['start_ts']) if meta['start_ts'] is not None else None,
+                                  end_time=from_unixts(meta['end_ts']) if meta['end_ts'] is not None else None,
+                                  stream_type=meta['stream_type'])
+        bundle.data = [self.part(i, columns) for i in range(len(self.parts))]
+        return bundle
+
+
+def loads_bundle(value, columns=None):
+    """
+    SensorDataBundle of a dumps_bundle() value. Values without the container
+    magic are pickle + lz4 blobs from before the container, they are still read.
+
+    :param columns: names of the derived columns to load, default all
+    """
+    if not is_container(value):
+        return pickle.loads(lz4.frame.decompress(value))
+    return BundleContainer(value).bundle(columns)
@@ -1,6 +1,6 @@
 from datetime import datetime
 import numpy
-from types.sensor_data import window, SensorData2
+from types.sensor_data import TimeIndex, SensorData2
 from utils import unixts
 
 
@@ -14,6 +14,16 @@ class DerivedData():
         self.ts = ts
         self._times = None
 
+    def __setattr__(self, key, value):
+        if key == 'ts':
+            self._time_index = None
+        super(DerivedData, self).__setattr__(key, value)
+
+    def time_index(self):
+        if self._time_index is None:
+            self._time_index = TimeIndex(self.ts)
+        return self._time_index
+
     def __getstate__(self):
         """Return state values to be pickled."""
         return self.start_ts, self.end_ts, self.derived_type, self.data, self.ts
@@ -28,33 +38,30 @@ class DerivedData():
         return numpy.vstack((self.ts, self.data.transpose())).transpose()
 
     def derived_window(self, start, end):
-        start_ts = unixts(start)
-        end_ts = unixts(end)
-        first, last = window(self.ts, start_ts, end_ts)
+        first, last = self.time_index().window(unixts(start), unixts(end))
         return self.data[first:last, :]
 
+    def derived_windows(self, starts, ends):
+        """derived_window() of many windows, looked up together"""
+        bounds = self.time_index().windows([unixts(start) for start in starts], [unixts(end) for end in ends])
+        return [self.data[first:last, :] for first, last in bounds]
+
     def categories_window(self, start, end):
-        start_ts = unixts(start)
-        end_ts = unixts(end)
-        first, last = window(self.ts, start_ts, end_ts)
+        first, last = self.time_index().window(unixts(start), unixts(end))
         return self.data[first:last, 0].astype(dtype=numpy.int)
 
     def meta_window(self, start, end):
-        start_ts = unixts(start)
-        end_ts = unixts(end)
-        first, last = window(self.ts, start_ts, end_ts)
+        first, last = self.time_index().window(unixts(start), unixts(end))
         return self.data[first:last, 1].astype(dtype=numpy.double)
 
     def ts_window(self, start, end):
-        start_ts = unixts(start)
-        end_ts = unixts(end)
-        first, last = window(self.ts, start_ts, end_ts)
+        first, last = self.time_index().window(unixts(start), unixts(end))
         return self.ts[first:last].astype(dtype=numpy.int)
 
     def windowed_view(self, start, end):
         start_ts = unixts(start)
         end_ts = unixts(end)
-        first, last = window(self.ts, start_ts, end_ts)
+        first, last = self.time_index().window(start_ts, end_ts)
         return DerivedData(derived_type=self.derived_type,
                            data=self.data[first:last, :],
                            source = self.source.windowed_view(start, end) if self.source is not None else SensorData2(start_ts, end_ts, None, None, None),
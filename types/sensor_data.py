@@ -6,23 +6,91 @@ from utils import unixts
 def window(ts, start_ts, end_ts):
     if len(ts) == 0:
         return 0, 0
-    first = numpy.argmax(ts > start_ts)
-    last = numpy.argmax(ts > end_ts)
-    if first == 0 and ts[-1] < start_ts:
-        first = len(ts)-1
-    if last == 0 and ts[-1] < end_ts:
-        last = len(ts)-1
-    return first, last
+    first, last = window_bounds(ts, start_ts, end_ts)
+    return int(first), int(last)
 
 
+def window_bounds(ts, start_ts, end_ts):
+    """
+    Batched window() on sorted ts, start_ts and end_ts may be arrays
+
+    Same results as the linear scan it replaces: the first sample after each
+    bound, or the last sample if the bound is after all samples (index 0 if
+    the bound equals the last sample).
+    """
+    bound_ts = numpy.array([start_ts, end_ts])
+    bounds = numpy.searchsorted(ts, bound_ts, side='right')
+    after = bounds == len(ts)
+    bounds[after] = numpy.where(ts[-1] < bound_ts[after], len(ts) - 1, 0)
+    return bounds[0], bounds[1]
+
+
+class TimeIndex(object):
+    """
+    Window lookups on the timestamps of a SensorData2 or DerivedData, ts must
+    be sorted. Lookups are memoized as the same windows are asked for
+    repeatedly (e.g. the bins of fetch_derived_data_bins()).
+    """
+
+    def __init__(self, ts):
+        if len(ts) > 1 and numpy.any(ts[1:] < ts[:-1]):
+            raise ValueError("Timestamps are not sorted")
+        self.ts = ts
+        self._windows = {}
+
+    def window(self, start_ts, end_ts):
+        key = (start_ts, end_ts)
+        bounds = self._windows.get(key)
+        if bounds is None:
+            bounds = window(self.ts, start_ts, end_ts)
+            self._windows[key] = bounds
+        return bounds
+
+    def windows(self, start_ts, end_ts):
+        """:return: [(first, last)] of each start_ts[i], end_ts[i], in one searchsorted call"""
+        if len(self.ts) == 0:
+            return [(0, 0)] * len(start_ts)
+        first, last = window_bounds(self.ts, numpy.asarray(start_ts), numpy.asarray(end_ts))
+        bounds = list(zip(first.tolist(), last.tolist()))
+        self._windows.update(zip(zip(start_ts, end_ts), bounds))
+        return bounds
+
+
+
+# dtype of scaled samples (see SensorData2.samples()), float32 halves the
+# memory of float64 and holds the 12 bit samples exactly enough for analysis
+SAMPLE_DTYPE = numpy.float32
+
+
+def set_sample_dtype(dtype):
+    global SAMPLE_DTYPE
+    SAMPLE_DTYPE = numpy.dtype(dtype).type
+
+
+def sample_scale(stream_type):
+    """Factor from stored sample values to the units of SensorData2.samples()"""
+    if stream_type == 'acc/3ax/4g':
+        return 4.0 / 500.0
+    elif stream_type == 'temp/acc/scalar':
+        return 1.0 / 10.0
+    elif stream_type == 'volt/system/mv':
+        return 1.0 / 1000.0
+    elif stream_type == 'cap/stretch/scalar':
+        return 5.0
+    else:
+        return 1.0
+
 
 class SensorData2(object):
-    def __init__(self, start_ts, end_ts, ts, stream_type, data):
+    def __init__(self, start_ts, end_ts, ts, stream_type, data, idle=None):
         self.start_ts = start_ts
         self.end_ts = end_ts
         self.ts = ts
         self.stream_type = stream_type
         self.data = data
+        # Optional bool per sample (same leading shape as data), True where the
+        # sample is an exact repeat from an idle frame of the compressed record
+        self.idle = idle
         self._samples = None
         self._times = None
 
@@ -32,8 +100,28 @@ class SensorData2(object):
         if key == 'data':
             # Data has been updated, clear _samples cache
             self._samples = None
+            self._axis_samples = {}
+            self._intermediates = None
+        elif key == 'ts':
+            self._time_index = None
         super(SensorData2, self).__setattr__(key, value)
 
+    def time_index(self):
+        if self._time_index is None:
+            self._time_index = TimeIndex(self.ts)
+        return self._time_index
+
+    def intermediates(self):
+        """
+        Results shared by the algorithms run on this data, None unless they are
+        being shared, see math/algorithm/intermediates.py
+        """
+        return self._intermediates
+
+    def share_intermediates(self, share):
+        """Start or stop (releasing them) sharing intermediates"""
+        self._intermediates = {} if share else None
+
     def __getstate__(self):
         """Return state values to be pickled."""
         return self.start_ts, self.end_ts, self.ts, self.stream_type, self.data
@@ -41,21 +129,39 @@ class SensorData2(object):
     def __setstate__(self, state):
         """Restore state from the unpickled state values."""
         self.start_ts, self.end_ts, self.ts, self.stream_type, self.data = state
+        self.idle = None
 
-    def samples(self):
-        if self._samples is None:
-            if self.stream_type == 'acc/3ax/4g':
-                self._samples = self.data.astype(numpy.float64) * 4.0 / 500.0
-            elif self.stream_type == 'temp/acc/scalar':
-                self._samples = self.data.astype(numpy.float64) / 10.0
-            elif self.stream_type == 'volt/system/mv':
-                self._samples = self.data.astype(numpy.float64) / 1000.0
-            elif self.stream_type == 'cap/stretch/scalar':
-                self._samples = self.data.astype(numpy.float64) * 5.0
-            else:
-                self._samples = self.data.astype(numpy.float64)
+    def samples(self, dtype=None):
+        """
+        Samples scaled to their units, as dtype (default SAMPLE_DTYPE). Cached
+        and read only, copy before modifying.
+        """
+        dtype = numpy.dtype(dtype or SAMPLE_DTYPE)
+        if self._samples is None or self._samples.dtype != dtype:
+            self._samples = self._scaled(self.data, dtype)
+            self._axis_samples = {}
         return self._samples
 
+    def axis_samples(self, axis, dtype=None):
+        """
+        samples()[..., axis:axis + 1] without scaling the other axes. A view if
+        samples() is already materialized, otherwise only this axis is scaled.
+        Cached and read only.
+        """
+        dtype = numpy.dtype(dtype or SAMPLE_DTYPE)
+        if self._samples is not None and self._samples.dtype == dtype:
+            return self._samples[..., axis:axis + 1]
+        cached = self._axis_samples.get(axis)
+        if cached is None or cached.dtype != dtype:
+            cached = self._scaled(self.data[..., axis:axis + 1], dtype)
+            self._axis_samples[axis] = cached
+        return cached
+
+    def _scaled(self, data, dtype):
+        scaled = numpy.multiply(data, dtype.type(sample_scale(self.stream_type)), dtype=dtype)
+        scaled.flags.writeable = False
+        return scaled
+
     def timed_samples(self):
         print(self.ts.shape, self.data.shape, self.samples().shape)
         return numpy.vstack((self.ts, self.samples().transpose())).transpose()
@@ -63,25 +169,46 @@ class SensorData2(object):
     def windowed_view(self, start, end):
         if not self.has_data():
             return self
-        start_ts = unixts(start)
-        end_ts = unixts(end)
-        first, last = window(self.ts, start_ts, end_ts)
+        first, last = self.time_index().window(unixts(start), unixts(end))
         return SensorData2(start_ts=self.ts[first],
                            end_ts=self.ts[last],
                            ts=self.ts[first:last],
                            stream_type=self.stream_type,
-                           data=self.data[first:last, :])
+                           data=self.data[first:last, :],
+                           idle=self.idle[first:last] if self.idle is not None else None)
 
     def chunked_view(self, sample_count):
         skip_count = len(self.data) % sample_count
         new_view = self.data.view()[0:len(self.data)-skip_count]
         new_shape = (-1, sample_count, self.data.shape[1])
         new_view.shape = new_shape
+        idle = None
+        if self.idle is not None:
+            idle = self.idle[0:len(self.idle)-skip_count].reshape(new_shape[:2])
         return SensorData2(start_ts=self.start_ts,
                            end_ts=self.end_ts,
                            ts=self.ts[0:len(self.ts)-skip_count:sample_count],
                            stream_type=self.stream_type,
-                           data=new_view)
+                           data=new_view,
+                           idle=idle)
+
+    def idle_chunks(self):
+        """
+        For a chunked view, True for every chunk made up only of idle samples.
+        Such chunks are constant, so algorithms can skip them. None if unknown.
+        """
+        if self.idle is None or not self.is_chunked:
+            return None
+        return numpy.all(self.idle, axis=1)
+
+    def chunk_subset(self, selection):
+        """Chunked view holding only the selected chunks"""
+        return SensorData2(start_ts=self.start_ts,
+                           end_ts=self.end_ts,
+                           ts=self.ts[selection],
+                           stream_type=self.stream_type,
+                           data=self.data[selection],
+                           idle=self.idle[selection] if self.idle is not None else None)
 
     def continous_view(self):
         new_view = self.data.view()
@@ -91,7 +218,8 @@ class SensorData2(object):
                            end_ts=self.end_ts,
                            ts=new_ts,
                            stream_type=self.stream_type,
-                           data=new_view)
+                           data=new_view,
+                           idle=self.idle.reshape(-1) if self.idle is not None else None)
 
     @property
     def start_time(self):
@@ -5,6 +5,7 @@ from components import internal_cache, db
 from flaskapp import app
 from math.algorithm.algorithms import Algorithms
 from models import SensorAccess, GatewaySensorDiscovered, Session2, TimeSync, MotionDevice
+from models.sensordata.sample_cache import get_sample_cache
 from models.structure.measurement import AlgProfile
 from query.deriveddata.derived_data_query import fetch_derived_data_bins, fetch_cached_derived_data_hour
 from query.sensordata.sensor_query import extend_sensors_remote_details
@@ -17,6 +18,18 @@ def debug_info():
     return 'SENS backend ' + app.config['DESCRIPTION']
 
 
+@app.route('/internal/debug/sample_cache')
+@text_view
+def debug_sample_cache():
+    stats = get_sample_cache().stats()
+
+    def out():
+        for name in sorted(stats):
+            yield "%-16s %s" % (name, stats[name])
+
+    return out()
+
+
 @app.route('/internal/debug/crash')
 def view_crash():
     None.non_existing_function()
@@ -8,7 +8,7 @@ from datetime import timedelta
 from flask import request, abort, json
 from api.helpers import id_argument
 from flaskapp import app
-from models import MotionDevice, Session2, SensorRecord2, load_all_bindata, TimeSync
+from models import MotionDevice, Session2, SensorRecord2, get_bindata, load_all_bindata, TimeSync
 from query.sensordata.sensordata_query import fetch_sensor_data_bundle_for_sensor
 from utils import parse_date_string, json_isoformat
 from views.util import download_view, text_view
@@ -23,7 +23,7 @@ def record_to_json(r):
             'timestamp_tx_end': r.timestamp_tx_end,
             'stream_cnt_begin': r.stream_cnt_begin,
             'stream_cnt_end': r.stream_cnt_end,
-            'bindata': json_b64(r.bindata_cached.bin_data)
+            'bindata': json_b64(get_bindata(r))
             }
 
 
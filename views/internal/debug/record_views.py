@@ -3,7 +3,7 @@ from api.api_json import api_isoformat
 from api.helpers import id_out
 from flaskapp import app
 from math.compress import analyze_compressed
-from models import Session2, TimeSync, get_samples, get_bindata, MotionDevice, load_all_bindata
+from models import Session2, TimeSync, get_clock_model, get_samples, get_bindata, MotionDevice, load_all_bindata
 from query.sensordata.sensordata_query import fetch_records_for_stream
 from utils import parse_date_string, tx_format
 from views.util import text_view, id_encode
@@ -66,14 +66,16 @@ def browse_session1_raw(session_id, day):
         yield "*" * 30
 
         yield "Timesyncs"
-        yield "% 10s % 10s - %10s - %10s" % ("Diff TX", "Abs TX", "Server Time", "Derived Epoch")
-        timesyncs = TimeSync.query.filter(TimeSync.session_id==session_id).all()
+        yield "% 10s % 10s - %10s - %10s - %10s" % ("Diff TX", "Abs TX", "Server Time", "Derived Epoch", "Tick ms")
+        timesyncs = TimeSync.query.filter(TimeSync.session_id==session_id).order_by(TimeSync.timestamp_tx).all()
+        session_clock = get_clock_model(session_id)
         prev = 0
-        for t in timesyncs:
+        for i, t in enumerate(timesyncs):
             if t.server_time < start - timedelta(days=1) or t.server_time > end + timedelta(days=1):
                 continue
             epoch = t.server_time - timedelta(milliseconds=t.timestamp_tx * 10)
-            yield "% 10d % 10d - %s - %s" % (t.timestamp_tx - prev, t.timestamp_tx, t.server_time.isoformat(), epoch)
+            yield "% 10d % 10d - %s - %s - %.5f" % (t.timestamp_tx - prev, t.timestamp_tx, t.server_time.isoformat(), epoch,
+                                                    session_clock.slope[i])
             prev = t.timestamp_tx
 
         for s in streams:
@@ -87,7 +89,7 @@ def browse_session1_raw(session_id, day):
             yield "Format: %d" % s.data_format
             yield "Open TX: %s" % tx_format(s.open_record_tx)
 
-            records, _ = fetch_records_for_stream(s, start, end)
+            records, clock = fetch_records_for_stream(s, start, end)
             prev = 0
             prev_end = 0
             prev_samples = 0
@@ -114,7 +116,7 @@ def browse_session1_raw(session_id, day):
                     freq = 0
                 #yield "% 10d % 10d %d" % (r.timestamp_tx, r.timestamp_tx_end, r.timestamp_tx - prev_end)
                 yield ""
-                yield "+ % 30s % 15s % 15s % 15.2f % 15d % 15d % 15.2f %d/%d" % (timesyncs[0].tx_to_utc(r.timestamp_tx).isoformat(),
+                yield "+ % 30s % 15s % 15s % 15.2f % 15d % 15d % 15.2f %d/%d" % (clock.tx_to_utc(r.timestamp_tx).isoformat(),
                                                                 tx_format(r.timestamp_tx),
                                                                 tx_format(r.timestamp_tx_end),
                                                                 (r.timestamp_tx_end - r.timestamp_tx) / 6000.0,
@@ -140,7 +142,7 @@ def browse_session1_raw(session_id, day):
                     prev2 = tx
                     prev2_samples = sample_cnt
 
-                    yield "- % 30s % 15s = Samples: % 6d @ Bytes: % 6d % 12.2f" % (timesyncs[0].tx_to_utc(r.timestamp_tx).isoformat(), tx_format(tx), sample_cnt, bytes_cnt, freq)
+                    yield "- % 30s % 15s = Samples: % 6d @ Bytes: % 6d % 12.2f" % (clock.tx_to_utc(r.timestamp_tx).isoformat(), tx_format(tx), sample_cnt, bytes_cnt, freq)
 
                 yield "total: " + str(total_samples)
 
@@ -1,9 +1,12 @@
 from flask import g
 from flaskapp import app
 from migrate import MSG
+from migrate.migrate_blobs import migrate_bindata_to_blob_store
 from migrate.migrate_db import migrate_create_structure_db
 from migrate.migrate_measurement import migrate_measurements_from_patient_group, migrate_measurement, \
     migrate_patient, migrate_add_patient_key, migrate_add_measurement
+from migrate.migrate_pyramids import migrate_record_pyramids
+from migrate.migrate_record_times import migrate_record_utc_times
 from migrate.migrate_org import migrate_single_usergroup, migrate_add_single_organization, \
     migrate_add_project_key, migrate_single_usergroup_internally, migrate_add_new_project, migrate_add_project_to_org
 from migrate.migrate_patients import migrate_add_new_patient
@@ -25,6 +28,30 @@ def view_migrate_1_create():
     return [""]
 
 
+@app.route('/internal/migrate/blobs/<int:max_batches>')
+@text_view
+def view_migrate_blobs(max_batches):
+    MSG("Starting")
+    migrate_bindata_to_blob_store(max_batches=max_batches)
+    return g.msg
+
+
+@app.route('/internal/migrate/record_times/<int:max_batches>')
+@text_view
+def view_migrate_record_times(max_batches):
+    MSG("Starting")
+    migrate_record_utc_times(max_batches=max_batches)
+    return g.msg
+
+
+@app.route('/internal/migrate/pyramids/<int:max_batches>')
+@text_view
+def view_migrate_pyramids(max_batches):
+    MSG("Starting")
+    migrate_record_pyramids(max_batches=max_batches)
+    return g.msg
+
+
 @app.route('/internal/migrate/1/basic')
 @text_view
 def view_migrate_1_basic():
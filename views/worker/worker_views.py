@@ -1,14 +1,14 @@
 import hashlib
-import pickle
 from datetime import timedelta, datetime
 import time
 from components import db
 from flaskapp import app
 from models import CacheQueueEntry, CacheDerivedData, MotionDevice
 from models.structure.measurement import AlgProfile
-from query.deriveddata.derived_data_query import fetch_derived_data_hour
+from query.deriveddata.derived_data_query import generate_derived_data_hours
+from query.sensordata.pyramid_query import build_pending_pyramids
+from types.bundle_container import dumps_bundle
 from views.util import text_view
-import lz4.frame
 
 
 @app.route('/internal/worker/derived')
@@ -28,26 +28,26 @@ def view_worker_derived():
 
     now = datetime.utcnow()
 
+    entries = {}
     for h in range(24):
-        start = time.time()
-
         start_hour = queue_entry.start_time + timedelta(hours=h)
         cache_id = CacheDerivedData.make_cache_id(sensor_device_map, alg_profile, start_hour)
         cached_entry = CacheDerivedData.query.get(cache_id)
         if cached_entry is not None:
             if not cached_entry.invalidated and cached_entry.timeout > now:
                 continue
+        entries[start_hour] = (cache_id, cached_entry)
 
-        #rint("Analyzing %s" % start_hour.isoformat())
-        data = fetch_derived_data_hour(sensor_device_map, alg_profile, queue_entry.parameters_json(), start_hour)
-
-        #rint(" ... fetched in %f" % (time.time() - start))
+    # Runs of consecutive hours are analysed as one stream, each hour fetched once
+    start = time.time()
+    hours = generate_derived_data_hours(sensor_device_map, alg_profile, queue_entry.parameters_json(), sorted(entries))
+    for start_hour, data in hours:
+        cache_id, cached_entry = entries[start_hour]
 
-        pickled_data = pickle.dumps(data)
-        compressed_data = lz4.frame.compress(pickled_data)
-        #rint("Size %d %d" % (len(pickled_data), len(compressed_data)))
+        #rint(" ... %s fetched in %f" % (start_hour.isoformat(), time.time() - start))
 
-        cache_data = compressed_data
+        cache_data = dumps_bundle(data, compress=app.config['CACHE_DERIVED_COMPRESS'])
+        #rint("Size %d" % len(cache_data))
 
         #rint(" ... compressed in %f" % (time.time() - start))
 
@@ -85,6 +85,18 @@ def view_worker_derived():
            + '<body><pre>OK - %d pending</pre></body></html>' % left
 
 
+@app.route('/internal/worker/pyramids')
+def view_worker_pyramids():
+    built = build_pending_pyramids(app.config['PYRAMID_WORKER_BATCH'])
+
+    refresh_s = 15 if built == 0 else 1
+
+    return '<html><head><meta http-equiv="refresh" content="'\
+           + str(refresh_s)\
+           + '"></head>'\
+           + '<body><pre>OK - %d records built</pre></body></html>' % built
+
+
 @app.route('/internal/worker/status')
 @text_view
 def view_worker_status():